@@ -1,9 +1,9 @@
+from heroic_api.metrics import hop_handler, observe_ingest_lag
 from heroic_api.models import TelescopeStatus, Telescope
+from heroic_api.time_conversions import gps_to_datetime
 from hop.io import Metadata
 from hop.models import JSONBlob
 
-from astropy.time import Time
-from datetime import datetime, timezone
 import logging
 
 logger = logging.getLogger(__name__)
@@ -41,11 +41,7 @@ def state_to_telescope_status(state: str) -> str:
             return TelescopeStatus.StatusChoices.UNAVAILABLE
 
 
-def gps_to_datetime(gps_time: float) -> datetime:
-    time = Time(gps_time, format='gps', scale='utc')
-    return time.datetime.replace(tzinfo=timezone.utc)
-
-
+@hop_handler('igwn_sensitivity')
 def handle_igwn_sensistivity_message(blob: JSONBlob, metadata: Metadata):
     """ Called with sensitivity range_history messages for the LVK telescopes
     """
@@ -54,9 +50,8 @@ def handle_igwn_sensistivity_message(blob: JSONBlob, metadata: Metadata):
         logger.error(f"Could not find a telescope associated with topic {metadata.topic}")
         return
 
-    old_telescope = TelescopeStatus.objects.filter(telescope=telescope).first()
-    if old_telescope:
-        old_status = old_telescope.status
+    if telescope.current_status:
+        old_status = telescope.current_status.status
     else:
         old_status = TelescopeStatus.StatusChoices.UNAVAILABLE
 
@@ -66,9 +61,11 @@ def handle_igwn_sensistivity_message(blob: JSONBlob, metadata: Metadata):
         status=old_status,
         extra={'sensitivity': blob.content['data'][0]}
     )
+    observe_ingest_lag('igwn_sensitivity', status.date)
     logger.info(f"Created state for telescope {telescope.id} with status {status.status} and sensitivity {status.extra['sensitivity']}")
 
 
+@hop_handler('igwn_status')
 def handle_igwn_status_message(blob: JSONBlob, metadata: Metadata):
     """ Called with status messages for the LVK telescopes
     """
@@ -82,4 +79,5 @@ def handle_igwn_status_message(blob: JSONBlob, metadata: Metadata):
         date=gps_to_datetime(blob.content['time']),
         status=state_to_telescope_status(blob.content['state']),
     )
+    observe_ingest_lag('igwn_status', status.date)
     logger.info(f"Created state for telescope {telescope.id} with status {status.status}")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HeroicApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'heroic_api'
+
+    def ready(self):
+        # Connect the signal receivers
+        from heroic_api import signals  # noqa: F401
@@ -0,0 +1,151 @@
+"""heroic_api/cache.py
+
+The HEROIC cache layer, on top of the shared redis cache in settings.CACHES
+
+Each kind of cached data (auth tokens, visibility results, ...) gets its own HeroicCache namespace:
+  * keys are prefixed with the namespace and the namespace's current version, so every entry in a
+    namespace can be invalidated at once by bumping the version with invalidate()
+  * values are pickled once here so their size is known. Values larger than the namespace's
+    max_entry_size are not stored, so one large result can't evict many small ones. Every entry has a
+    timeout, so redis (configured with maxmemory-policy volatile-lru) only ever evicts cache entries
+    and never the dramatiq queues it shares the instance with.
+  * hits, misses, sets and oversized values are counted per namespace in the heroic_cache_operations
+    Prometheus counter, see heroic_api.metrics
+"""
+import logging
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+from heroic_api.metrics import count_cache_operation
+
+logger = logging.getLogger(__name__)
+
+# Deletes KEYS[1] only if it still holds ARGV[1], in one step so another client's value is never deleted
+_DELETE_IF_EQUAL_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class HeroicCache:
+    def __init__(self, namespace: str, timeout: float = None, max_entry_size: int = None, alias: str = 'default'):
+        """
+        Parameters:
+            namespace: prefix for all keys of this cache
+            timeout: default timeout of entries in seconds, defaulting to HEROIC_CACHE_DEFAULT_TIMEOUT
+            max_entry_size: largest pickled value in bytes that will be stored, defaulting to
+                            HEROIC_CACHE_MAX_ENTRY_SIZE
+        """
+        self.namespace = namespace
+        self.timeout = timeout or settings.HEROIC_CACHE_DEFAULT_TIMEOUT
+        self.max_entry_size = max_entry_size or settings.HEROIC_CACHE_MAX_ENTRY_SIZE
+        self.alias = alias
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def _version_key(self) -> str:
+        return f'{self.namespace}:version'
+
+    def version(self) -> int:
+        version = self.backend.get(self._version_key)
+        if version is None:
+            # add() so concurrent first uses agree on the version
+            self.backend.add(self._version_key, 1, timeout=None)
+            version = self.backend.get(self._version_key, 1)
+        return version
+
+    def invalidate(self):
+        """Invalidate every entry in this namespace by moving to a new version. Old entries expire on their own."""
+        try:
+            self.backend.incr(self._version_key)
+        except ValueError:
+            self.backend.add(self._version_key, 2, timeout=None)
+
+    def make_key(self, key: str, version: int = None) -> str:
+        return f'{self.namespace}:{self.version() if version is None else version}:{key}'
+
+    def _dumps(self, value):
+        """Pickle the value, returning None if it is too large to store"""
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_entry_size:
+            count_cache_operation(self.namespace, 'oversize')
+            logger.debug(f'Not caching {len(data)} byte value in {self.namespace}, over the {self.max_entry_size} limit')
+            return None
+        return data
+
+    def get(self, key: str, default=None):
+        data = self.backend.get(self.make_key(key))
+        if data is None:
+            count_cache_operation(self.namespace, 'miss')
+            return default
+        count_cache_operation(self.namespace, 'hit')
+        return pickle.loads(data)
+
+    def peek(self, key: str, default=None):
+        """Like get(), but not counted as a hit or miss, for polling a key that is expected to be missing"""
+        data = self.backend.get(self.make_key(key))
+        return default if data is None else pickle.loads(data)
+
+    def get_many(self, keys: list) -> dict:
+        version = self.version()
+        found = self.backend.get_many([self.make_key(key, version) for key in keys])
+        results = {}
+        for key in keys:
+            data = found.get(self.make_key(key, version))
+            if data is not None:
+                results[key] = pickle.loads(data)
+        count_cache_operation(self.namespace, 'hit', len(results))
+        count_cache_operation(self.namespace, 'miss', len(keys) - len(results))
+        return results
+
+    def set(self, key: str, value, timeout: float = None) -> bool:
+        """Store the value, returning whether it was stored"""
+        data = self._dumps(value)
+        if data is None:
+            return False
+        self.backend.set(self.make_key(key), data, timeout=self.timeout if timeout is None else timeout)
+        count_cache_operation(self.namespace, 'set')
+        return True
+
+    def add(self, key: str, value, timeout: float = None) -> bool:
+        """Store the value only if the key doesn't exist, returning whether it was stored"""
+        data = self._dumps(value)
+        if data is None:
+            return False
+        return self.backend.add(self.make_key(key), data, timeout=self.timeout if timeout is None else timeout)
+
+    def get_or_set(self, key: str, default_func, timeout: float = None):
+        """Return the cached value, or call default_func to compute it and cache the result"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = default_func()
+            self.set(key, value, timeout)
+        return value
+
+    def delete(self, key: str):
+        self.backend.delete(self.make_key(key))
+
+    def delete_if_equal(self, key: str, value) -> bool:
+        """ Delete the key only if it holds value, returning whether it was deleted
+
+            This is atomic on redis. Other backends (the local memory cache the tests use) compare and delete
+            in two steps.
+        """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        backend = self.backend
+        if isinstance(backend, RedisCache):
+            backend_key = backend.make_and_validate_key(self.make_key(key))
+            client = backend._cache.get_client(backend_key, write=True)
+            return bool(client.eval(_DELETE_IF_EQUAL_SCRIPT, 1, backend_key, backend._cache._serializer.dumps(data)))
+        if backend.get(self.make_key(key)) != data:
+            return False
+        return backend.delete(self.make_key(key))
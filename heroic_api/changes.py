@@ -0,0 +1,158 @@
+"""heroic_api/changes.py
+
+Incremental change feed of telescope statuses, instrument capabilities, their planned versions and
+telescope pointings
+
+Every create, update and delete of those objects appends a ChangeEvent holding the object's new
+representation: single writes through heroic_api.signals, and bulk writes (which bypass signals) by
+calling record_changes() / record_deletions() directly inside suppress_change_events(). Clients keep
+the cursor of the last event they have seen and poll for the events after it, which is a single
+keyset query on the ChangeEvent primary key. Recorded events are also pushed to clients of the event
+stream, see heroic_api.event_stream.
+
+Ids are assigned on insert rather than commit, so an event written by a slow transaction can become
+visible after later ids. Events newer than CHANGE_FEED_SAFETY_LAG_SECONDS are held back from the feed
+so such events aren't skipped by a client that has already moved its cursor past them.
+"""
+import base64
+from contextlib import contextmanager
+from datetime import timedelta
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from heroic_api import event_stream
+from heroic_api.models import (ChangeEvent, Instrument, TelescopeStatus, PlannedTelescopeStatus, InstrumentCapability,
+                               PlannedInstrumentCapability, TelescopePointing)
+from heroic_api.serializers import (TelescopeStatusSerializer, PlannedTelescopeStatusSerializer,
+                                    InstrumentCapabilitySerializer, PlannedInstrumentCapabilitySerializer,
+                                    TelescopePointingSerializer)
+
+CURSOR_PREFIX = 'v1:'
+
+# model: (object type, serializer class)
+CHANGE_TRACKED_MODELS = {
+    TelescopeStatus: (ChangeEvent.ObjectTypes.TELESCOPE_STATUS, TelescopeStatusSerializer),
+    PlannedTelescopeStatus: (ChangeEvent.ObjectTypes.PLANNED_TELESCOPE_STATUS, PlannedTelescopeStatusSerializer),
+    InstrumentCapability: (ChangeEvent.ObjectTypes.INSTRUMENT_CAPABILITY, InstrumentCapabilitySerializer),
+    PlannedInstrumentCapability: (ChangeEvent.ObjectTypes.PLANNED_INSTRUMENT_CAPABILITY,
+                                  PlannedInstrumentCapabilitySerializer),
+    TelescopePointing: (ChangeEvent.ObjectTypes.TELESCOPE_POINTING, TelescopePointingSerializer),
+}
+
+_state = threading.local()
+
+
+@contextmanager
+def suppress_change_events():
+    """Don't record change events from signals in this block, for bulk writes that record their own"""
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def change_events_suppressed() -> bool:
+    return getattr(_state, 'suppressed', False)
+
+
+def get_telescope_id(instance) -> str:
+    """Return the id of the telescope a status, capability or pointing belongs to"""
+    if hasattr(instance, 'telescope_id'):
+        return instance.telescope_id
+    return Instrument.objects.filter(id=instance.instrument_id).values_list('telescope_id', flat=True).first() or ''
+
+
+def record_changes(action: str, instances: list):
+    """ Append a change event for each created or updated instance, which must all be of the same model
+    """
+    if not instances:
+        return
+    object_type, serializer_class = CHANGE_TRACKED_MODELS[type(instances[0])]
+    representations = serializer_class(instances, many=True).data
+    telescope_ids = {}
+    events = []
+    for instance, data in zip(instances, representations):
+        # Instances of bulk writes mostly share their telescope or instrument, so look each one up once
+        owner = getattr(instance, 'telescope_id', None) or instance.instrument_id
+        if owner not in telescope_ids:
+            telescope_ids[owner] = get_telescope_id(instance)
+        events.append(ChangeEvent(object_type=object_type, object_id=instance.pk, action=action,
+                                  telescope=telescope_ids[owner], data=data))
+    ChangeEvent.objects.bulk_create(events, batch_size=settings.CHANGE_FEED_BATCH_SIZE)
+    event_stream.publish_change_events(events)
+
+
+def record_deletions(model, object_ids: list, telescope_id: str):
+    """ Append a deletion event for each deleted object id of a model
+    """
+    object_type = CHANGE_TRACKED_MODELS[model][0]
+    events = ChangeEvent.objects.bulk_create([
+        ChangeEvent(object_type=object_type, object_id=object_id, action=ChangeEvent.Actions.DELETED,
+                    telescope=telescope_id)
+        for object_id in object_ids
+    ], batch_size=settings.CHANGE_FEED_BATCH_SIZE)
+    event_stream.publish_change_events(events)
+
+
+def prune_change_events() -> int:
+    """ Delete change events older than CHANGE_FEED_RETENTION_DAYS, returning how many were deleted
+    """
+    cutoff = timezone.now() - timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS)
+    last_id = ChangeEvent.objects.filter(created__lt=cutoff).order_by('-id').values_list('id', flat=True).first()
+    if last_id is None:
+        return 0
+    # Events have no relations or signal receivers, so this is a single DELETE on a primary key range
+    return ChangeEvent.objects.filter(id__lte=last_id).delete()[0]
+
+
+def encode_cursor(event_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{CURSOR_PREFIX}{event_id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """ Return the event id of a cursor from encode_cursor(), raising ValueError if it is invalid
+    """
+    try:
+        decoded = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    if not decoded.startswith(CURSOR_PREFIX):
+        raise ValueError('Invalid cursor')
+    event_id = int(decoded[len(CURSOR_PREFIX):])
+    if event_id < 0:
+        raise ValueError('Invalid cursor')
+    return event_id
+
+
+def get_changes(after_id: int, limit: int, telescopes: list = None, object_types: list = None,
+                safety_lag_seconds: float = None) -> dict:
+    """ Return up to limit change events after the event id, oldest first
+
+        Events newer than safety_lag_seconds, defaulting to CHANGE_FEED_SAFETY_LAG_SECONDS, are left out.
+
+    Returns:
+        dict of the events, the cursor to pass to get the next events, and whether there are more
+    """
+    if safety_lag_seconds is None:
+        safety_lag_seconds = settings.CHANGE_FEED_SAFETY_LAG_SECONDS
+    events = ChangeEvent.objects.filter(
+        id__gt=after_id, created__lte=timezone.now() - timedelta(seconds=safety_lag_seconds)
+    )
+    if telescopes:
+        events = events.filter(telescope__in=telescopes)
+    if object_types:
+        events = events.filter(object_type__in=object_types)
+    events = list(events.order_by('id').values(
+        'id', 'object_type', 'object_id', 'action', 'telescope', 'data', 'created'
+    )[:limit + 1])
+    has_more = len(events) > limit
+    events = events[:limit]
+    return {
+        'results': events,
+        'cursor': encode_cursor(events[-1]['id'] if events else after_id),
+        'has_more': has_more
+    }
@@ -0,0 +1,156 @@
+"""heroic_api/etags.py
+
+ETag and conditional GET support for the catalog endpoints and the current status snapshot
+
+The ETag of a response is a fingerprint of the data it is built from, which never reads the status, capability
+or pointing histories. It is made of the row count and latest modified value of each catalog (observatory, site,
+telescope and instrument) queryset, all computed in a single UNION ALL aggregate query, plus the data versions
+bumped by heroic_api.signals of the telescopes in the response (or the global data version, for responses
+covering every telescope), which change whenever a status or capability is written, and so whenever a
+telescope's current_status or an instrument's current_capability does. The request path and the negotiated
+media type are included too. Representations that depend on the current time (e.g. next_twilight) also include
+a time bucket of ETAG_TIME_BUCKET_SECONDS.
+
+The history list endpoints are cursor paginated and have no ETags, since any fingerprint of a page covers the
+whole filtered history.
+
+Requests with a matching If-None-Match header get a 304 Not Modified without the response being serialized.
+Anonymous responses are marked public for ETAG_MAX_AGE seconds so nginx can cache them, and authenticated
+ones private so they must be revalidated. Responses vary on Accept, since the browsable API and JSON share urls.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max, Value, IntegerField
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+from heroic_api.profiling import span
+from heroic_api.models import Telescope
+from heroic_api.response_cache import get_global_data_version, get_telescope_data_versions
+
+
+def queryset_fingerprint(sources: list) -> list:
+    """ Return the (index, count, latest) of each (queryset, date_field) source, using a single query
+    """
+    aggregates = [
+        queryset.order_by().prefetch_related(None).annotate(
+            source=Value(index, output_field=IntegerField())
+        ).values('source').annotate(
+            count=Count('pk'), latest=Max(date_field)
+        ).values_list('source', 'count', 'latest')
+        for index, (queryset, date_field) in enumerate(sources)
+    ]
+    if len(aggregates) > 1:
+        rows = aggregates[0].union(*aggregates[1:], all=True)
+    else:
+        rows = aggregates[0]
+    return sorted(rows, key=lambda row: row[0])
+
+
+def compute_etag(request, sources: list = (), time_bucket: int = None, telescope_ids: list = (),
+                 global_version: bool = False) -> str:
+    media_type = getattr(request, 'accepted_media_type', None) or request.headers.get('Accept', '')
+    parts = [request.get_full_path(), media_type]
+    if sources:
+        parts.extend(f'{index}:{count}:{latest.isoformat() if latest else ""}'
+                     for index, count, latest in queryset_fingerprint(sources))
+    telescope_ids = sorted(telescope_ids)
+    parts.extend(f'{telescope_id}:{version}'
+                 for telescope_id, version in zip(telescope_ids, get_telescope_data_versions(telescope_ids)))
+    if global_version:
+        parts.append(f'__all__:{get_global_data_version()}')
+    if time_bucket:
+        parts.append(int(time.time() // time_bucket))
+    return '"' + hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest() + '"'
+
+
+def etag_matches(request, etag: str) -> bool:
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+def conditional_response(request, render, sources: list = (), time_bucket: int = None,
+                         telescope_ids: list = (), global_version: bool = False) -> Response:
+    """ Return a 304 if the request's If-None-Match matches the ETag of the response's data, otherwise render()
+
+    Parameters:
+        render: function returning the full Response
+        sources: list of (queryset, date_field) of the catalog data the response is built from
+        time_bucket: seconds to bucket the current time by, for responses that depend on it
+        telescope_ids: ids of the telescopes whose data versions the response depends on
+        global_version: whether the response depends on the data of every telescope
+    """
+    with span('etag'):
+        etag = compute_etag(request, sources, time_bucket, telescope_ids, global_version)
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        with span('serialize'):
+            response = render()
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.ETAG_MAX_AGE)
+        patch_vary_headers(response, ['Accept', 'Authorization', 'Cookie'])
+    return response
+
+
+class ConditionalGetMixin:
+    """ Viewset mixin adding ETags and conditional GETs to list and retrieve, for the catalog viewsets
+
+        etag_date_field is the field of the viewset's model that changes whenever a row does,
+        etag_related_sources are (model, date_field, lookup) triples for other data nested in the representation,
+        where lookup leads from that model to the viewset's model so only the rows nested in the listed or
+        retrieved objects are counted, and etag_telescope_field leads from the viewset's model to the telescopes
+        whose data versions are included.
+    """
+    etag_date_field = 'modified'
+    etag_related_sources = ()
+    etag_telescope_field = None
+    etag_time_bucket = None
+
+    def get_etag_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset
+
+    def get_etag_sources(self, queryset) -> list:
+        sources = [(queryset, self.etag_date_field)]
+        object_ids = queryset.order_by().prefetch_related(None).values('pk')
+        sources.extend((model.objects.filter(**{f'{lookup}__in': object_ids}), date_field)
+                       for model, date_field, lookup in self.etag_related_sources)
+        return sources
+
+    def get_etag_telescope_ids(self, queryset) -> list:
+        if self.etag_telescope_field is None:
+            return []
+        return list(Telescope.objects.filter(
+            pk__in=queryset.order_by().prefetch_related(None).values(self.etag_telescope_field)
+        ).values_list('pk', flat=True))
+
+    def _conditional_response(self, request, render):
+        queryset = self.get_etag_queryset()
+        return conditional_response(
+            request, render, self.get_etag_sources(queryset), self.etag_time_bucket,
+            self.get_etag_telescope_ids(queryset)
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -0,0 +1,130 @@
+"""heroic_api/event_stream.py
+
+Server-Sent Events push channel of the change feed (see heroic_api.changes)
+
+Every recorded change event is published, once its transaction commits, to a redis pub/sub channel.
+Each connection to the stream endpoint subscribes to that channel, so changes written on any worker or
+node reach every client. The stream is an async view and must be served by the ASGI app
+(heroic_base.asgi), where an open connection is a cheap coroutine instead of a WSGI worker.
+
+SSE event ids are change feed cursors. A client reconnecting with a Last-Event-ID header (which browsers'
+EventSource send automatically), or connecting with a cursor query parameter, first gets the changes it
+missed from the change feed, then live ones.
+"""
+from datetime import timedelta
+import json
+import logging
+
+import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from heroic_api import changes
+
+logger = logging.getLogger(__name__)
+
+_publisher = None
+
+
+def get_publisher():
+    global _publisher
+    if _publisher is None:
+        _publisher = redis.Redis.from_url(settings.EVENT_STREAM_REDIS_URL)
+    return _publisher
+
+
+def change_event_message(event) -> dict:
+    """The message published and streamed for a ChangeEvent, or a ChangeEvent values() dict"""
+    if not isinstance(event, dict):
+        event = {'id': event.id, 'object_type': event.object_type, 'object_id': event.object_id,
+                 'action': event.action, 'telescope': event.telescope, 'data': event.data, 'created': event.created}
+    message = {key: value for key, value in event.items() if key != 'id'}
+    message['cursor'] = changes.encode_cursor(event['id'])
+    message['id'] = event['id']
+    return message
+
+
+def _publish(messages: list):
+    try:
+        pipeline = get_publisher().pipeline(transaction=False)
+        for message in messages:
+            pipeline.publish(settings.EVENT_STREAM_CHANNEL, json.dumps(message, cls=DjangoJSONEncoder))
+        pipeline.execute()
+    except redis.RedisError as e:
+        # Subscribers can catch up on missed events from the change feed, so don't fail the write
+        logger.warning(f'Failed to publish {len(messages)} change events: {repr(e)}')
+
+
+def publish_change_events(events: list):
+    """ Publish saved ChangeEvents to the event stream once the current transaction commits
+    """
+    if not events or not settings.EVENT_STREAM_REDIS_URL:
+        return
+    messages = [change_event_message(event) for event in events]
+    transaction.on_commit(lambda: _publish(messages))
+
+
+def format_sse(message: dict) -> str:
+    return (f"id: {message['cursor']}\nevent: {message['object_type']}\n"
+            f"data: {json.dumps(message, cls=DjangoJSONEncoder)}\n\n")
+
+
+def _matches(message: dict, telescopes: list, object_types: list) -> bool:
+    return ((not telescopes or message['telescope'] in telescopes) and
+            (not object_types or message['object_type'] in object_types))
+
+
+async def stream_change_events(after_id: int = None, telescopes: list = None, object_types: list = None):
+    """ Async generator of SSE formatted change events, for a StreamingHttpResponse
+
+    Parameters:
+        after_id: replay the change events after this event id before streaming live events
+        telescopes: only stream changes of these telescopes
+        object_types: only stream changes of these types of object
+    """
+    client = redis.asyncio.Redis.from_url(settings.EVENT_STREAM_REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        # Subscribe before replaying, so nothing published in between is missed
+        await pubsub.subscribe(settings.EVENT_STREAM_CHANNEL)
+        subscribed = timezone.now()
+        yield f"retry: {settings.EVENT_STREAM_RETRY_MILLISECONDS}\n\n"
+        # Ids of replayed events that may also arrive live. Events of slow transactions can commit after
+        # later ids were replayed, so live events are deduplicated by id rather than skipped up to the
+        # last replayed id. Like the change feed, this assumes transactions commit within the safety lag.
+        replayed_ids = set()
+        if after_id is not None:
+            last_id = after_id
+            has_more = True
+            while has_more:
+                replay = await sync_to_async(changes.get_changes)(
+                    last_id, settings.CHANGE_FEED_MAX_LIMIT, telescopes, object_types, safety_lag_seconds=0
+                )
+                for event in replay['results']:
+                    last_id = event['id']
+                    if event['created'] >= subscribed - timedelta(seconds=settings.CHANGE_FEED_SAFETY_LAG_SECONDS):
+                        replayed_ids.add(event['id'])
+                    yield format_sse(change_event_message(event))
+                has_more = replay['has_more']
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                               timeout=settings.EVENT_STREAM_KEEPALIVE_SECONDS)
+            if message is None:
+                # Comment lines keep proxies from closing idle connections
+                yield ': keepalive\n\n'
+                continue
+            message = json.loads(message['data'])
+            if message['id'] in replayed_ids:
+                # Already sent while replaying
+                replayed_ids.discard(message['id'])
+                continue
+            if _matches(message, telescopes, object_types):
+                yield format_sse(message)
+    finally:
+        # Also runs when the client disconnects and the response is cancelled
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,182 @@
+"""heroic_api/export.py
+
+Streaming bulk export of the telescope status and pointing histories as CSV, NDJSON or Parquet
+
+Rows are read with a server-side cursor (QuerySet.iterator) and written out EXPORT_CHUNK_SIZE rows at a
+time by a StreamingHttpResponse, so an export of years of history uses as much memory as one chunk of it.
+Rows are read with values_list() and written directly, without going through the DRF serializers.
+"""
+from abc import ABC, abstractmethod
+import csv
+from datetime import datetime
+import io
+from itertools import islice
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+import pyarrow
+import pyarrow.parquet
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportTable(ABC):
+    """ The columns of an export, and how to read them from a queryset
+
+        fields are the values_list fields read from the database, and columns are the exported columns of
+        the rows returned by to_row. json_columns hold JSON data, which CSV and Parquet write as JSON text.
+        Subclasses give the Parquet schema of their columns in arrow_schema.
+    """
+    fields = ()
+    columns = ()
+    json_columns = ()
+
+    def to_row(self, values: tuple) -> tuple:
+        return values
+
+    @abstractmethod
+    def arrow_schema(self):
+        """The pyarrow.Schema of the columns"""
+
+    def rows(self, queryset):
+        # Export oldest first, ignoring any ordering parameter, so consecutive exports can be appended
+        values = queryset.order_by('date', 'id').values_list(*self.fields)
+        return (self.to_row(row) for row in values.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE))
+
+
+class TelescopeStatusExport(ExportTable):
+    fields = columns = ('id', 'date', 'telescope', 'status', 'reason', 'extra', 'created')
+    json_columns = ('extra',)
+
+    def arrow_schema(self):
+        return pyarrow.schema([
+            ('id', pyarrow.int64()), ('date', pyarrow.timestamp('us', tz='UTC')), ('telescope', pyarrow.string()),
+            ('status', pyarrow.string()), ('reason', pyarrow.string()), ('extra', pyarrow.string()),
+            ('created', pyarrow.timestamp('us', tz='UTC')),
+        ])
+
+
+class TelescopePointingExport(ExportTable):
+    fields = ('id', 'date', 'planned', 'telescope', 'instrument', 'target', 'coordinate', 'field', 'extra')
+    columns = ('id', 'date', 'planned', 'telescope', 'instrument', 'target', 'ra', 'dec', 'field', 'extra')
+    json_columns = ('extra',)
+
+    def to_row(self, values: tuple) -> tuple:
+        pointing_id, date, planned, telescope, instrument, target, coordinate, field, extra = values
+        return (pointing_id, date, planned, telescope, instrument, target, coordinate.x, coordinate.y,
+                field.wkt if field else None, extra)
+
+    def arrow_schema(self):
+        return pyarrow.schema([
+            ('id', pyarrow.int64()), ('date', pyarrow.timestamp('us', tz='UTC')), ('planned', pyarrow.bool_()),
+            ('telescope', pyarrow.string()), ('instrument', pyarrow.string()), ('target', pyarrow.string()),
+            ('ra', pyarrow.float64()), ('dec', pyarrow.float64()), ('field', pyarrow.string()),
+            ('extra', pyarrow.string()),
+        ])
+
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    """Encodes datetimes the same as the API does, keeping their microseconds"""
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat().replace('+00:00', 'Z')
+        return super().default(o)
+
+
+def _chunks(rows):
+    while chunk := list(islice(rows, settings.EXPORT_CHUNK_SIZE)):
+        yield chunk
+
+
+def _json_text(table: ExportTable, chunk: list) -> list:
+    """The rows of the chunk with their JSON columns dumped to text"""
+    json_indexes = [table.columns.index(column) for column in table.json_columns]
+    rows = []
+    for row in chunk:
+        row = list(row)
+        for index in json_indexes:
+            row[index] = json.dumps(row[index], cls=ExportJSONEncoder)
+        rows.append(row)
+    return rows
+
+
+def stream_csv(table: ExportTable, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table.columns)
+    encoder = ExportJSONEncoder()
+    for chunk in _chunks(rows):
+        writer.writerows([[encoder.default(value) if isinstance(value, datetime) else value for value in row]
+                          for row in _json_text(table, chunk)])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(table: ExportTable, rows):
+    for chunk in _chunks(rows):
+        yield ''.join(json.dumps(dict(zip(table.columns, row)), cls=ExportJSONEncoder) + '\n' for row in chunk)
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only file the Parquet writer writes to, whose written bytes are taken after each row group"""
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_parquet(table: ExportTable, rows):
+    schema = table.arrow_schema()
+    sink = _ChunkSink()
+    with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+        # Each chunk is written as one row group
+        for chunk in _chunks(rows):
+            columns = list(zip(*_json_text(table, chunk)))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.take()
+    yield sink.take()
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+    'parquet': stream_parquet,
+}
+
+
+def export_response(queryset, table: ExportTable, export_format: str, filename: str) -> StreamingHttpResponse:
+    """ A StreamingHttpResponse of every row of the (filtered) queryset in the export format
+    """
+    response = StreamingHttpResponse(
+        STREAMERS[export_format](table, table.rows(queryset)), content_type=EXPORT_CONTENT_TYPES[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    # Stop nginx from buffering the export
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -154,11 +154,11 @@ class TelescopePointingFilter(django_filters.FilterSet):
         label='Date Before',
         widget=forms.TextInput(attrs={'class': 'input', 'type': 'date'})
     )
+    # Only date orderings can be paged by cursor (see heroic_api.pagination.PointingCursorPagination),
+    # so any other ordering is rejected with a 400
     ordering = django_filters.OrderingFilter(
         fields=(
             ('date', 'date'),
-            ('telescope', 'telescope'),
-            ('instrument', 'instrument')
         )
     )
 
@@ -0,0 +1,43 @@
+"""heroic_api/footprints.py
+
+Bulk generation of circular field of view polygons for telescope pointings.
+
+Calling Point.buffer() for every pointing builds a 33 vertex polygon through GEOS one at a time. Here a
+unit circle template with a configurable number of vertices is computed once, then scaled and
+translated for a whole batch of pointings with NumPy before the GEOS polygons are constructed.
+"""
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import LinearRing, Polygon
+
+
+@lru_cache(maxsize=8)
+def _unit_circle(vertices: int) -> np.ndarray:
+    """Closed ring of points on the unit circle, shape (vertices + 1, 2)"""
+    angles = np.linspace(0.0, 2.0 * np.pi, vertices, endpoint=False)
+    ring = np.column_stack([np.cos(angles), np.sin(angles)])
+    return np.vstack([ring, ring[:1]])
+
+
+def circular_field_coordinates(ras, decs, radii, vertices: int = None) -> np.ndarray:
+    """Compute the vertices of circular fields centered on each ra/dec with the given radius
+
+    The circles are in planar ra/dec degrees, matching what Point.buffer() produces.
+    Parameters:
+        ras, decs, radii: arrays of field centers and radii in decimal degrees
+        vertices: number of distinct vertices per circle, defaulting to settings.FIELD_POLYGON_VERTICES
+    Returns:
+        array of shape (n, vertices + 1, 2) with each ring closed
+    """
+    template = _unit_circle(vertices or settings.FIELD_POLYGON_VERTICES)
+    centers = np.column_stack([np.asarray(ras, dtype=np.float64), np.asarray(decs, dtype=np.float64)])
+    radii = np.asarray(radii, dtype=np.float64)
+    return centers[:, np.newaxis, :] + radii[:, np.newaxis, np.newaxis] * template[np.newaxis, :, :]
+
+
+def circular_fields(ras, decs, radii, vertices: int = None, srid: int = 4326) -> list:
+    """Build a list of circular field Polygons centered on each ra/dec with the given radius"""
+    rings = circular_field_coordinates(ras, decs, radii, vertices)
+    return [Polygon(LinearRing(ring), srid=srid) for ring in rings]
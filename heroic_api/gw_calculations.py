@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from pyslalib import slalib
 from rise_set.astrometry import gregorian_to_ut_mjd, ut_mjd_to_gmst
 
+from heroic_api.profiling import profiled
+
 
 def get_detector_arm_directions(detector_id: str) -> Dict[str, Tuple[float, float, float]]:
     """
@@ -115,6 +117,7 @@ def detector_response_tensor(detector_params: Dict) -> np.ndarray:
     return D
 
 
+@profiled('antenna_pattern')
 def antenna_pattern(ra: float, dec: float, time: datetime, detector_id: str) -> Tuple[float, float]:
     """
     Calculate the antenna pattern functions F+ and Fx for a given sky position and detector
@@ -308,6 +311,7 @@ def find_horizon_distance(available_detectors: List[Dict], ra: float, dec: float
     return max_distance
 
 
+@profiled('gw_visibility_timeline')
 def calculate_gw_visibility_timeline(
     telescopes_status: Dict[str, List[Dict]], 
     ra: float, 
@@ -23,22 +23,31 @@ Lower level and utility functions:
 from http.client import responses
 import json
 import logging
-import requests
 
 from django.conf import settings
-from django.core.cache import cache
 from django.utils import dateparse, timezone
 from django.contrib.auth.models import User
 
 from hop.auth import Auth
 import scramp
 
+from heroic_api.cache import HeroicCache
+from heroic_api.http_client import get_session
+
 
 logger = logging.getLogger(__name__)
 
  # this API client was written against this version of the SCIMMA Admin API
 SCIMMA_AUTH_API_VERSION = 1
 
+# API tokens and credential verification results
+auth_cache = HeroicCache('auth')
+
+
+def get_hop_auth_session():
+    """Return the pooled HTTP session used for all calls to the SCiMMA Auth API"""
+    return get_session('hopskotch')
+
 
 def get_hop_auth_api_url(api_version=SCIMMA_AUTH_API_VERSION) -> str:
     """Use the SCIMMA_AUTH_BASE_URL from settings.py and construct the API url from that.
@@ -47,7 +56,7 @@ def get_hop_auth_api_url(api_version=SCIMMA_AUTH_API_VERSION) -> str:
 
 
 def get_heroic_api_token():
-    heroic_api_token = cache.get('heroic_api_token', None)
+    heroic_api_token = auth_cache.get('heroic_api_token')
     if not heroic_api_token:
         logger.debug("Heroic api token doesn't exist in cache, regenerating it now.")
         heroic_api_token, heroic_api_token_expiration = _get_heroic_api_token(
@@ -57,7 +66,7 @@ def get_heroic_api_token():
         expiration_date = dateparse.parse_datetime(heroic_api_token_expiration)
         # Subtract a small amount from timeout to ensure credential is available when retrieved
         timeout = (expiration_date - timezone.now()).total_seconds() - 60
-        cache.set('heroic_api_token', heroic_api_token, timeout=timeout)
+        auth_cache.set('heroic_api_token', heroic_api_token, timeout=timeout)
     return heroic_api_token
 
 
@@ -71,9 +80,9 @@ def _get_heroic_api_token(scram_username, scram_password) -> str:
     client_first = client.get_client_first()
     logger.debug(f'_get_heroic_api_token: SCRAM client first request: {client_first}')
 
-    scram_resp1 = requests.post(hop_auth_api_url + '/scram/first',
-                                json={"client_first": client_first},
-                                headers={"Content-Type":"application/json"})
+    scram_resp1 = get_hop_auth_session().post(hop_auth_api_url + '/scram/first',
+                                              json={"client_first": client_first},
+                                              headers={"Content-Type":"application/json"})
     logger.debug(f'_get_heroic_api_token: SCRAM server first response: {scram_resp1.json()}')
 
     # Peform the second round of the SCRAM handshake:
@@ -81,9 +90,9 @@ def _get_heroic_api_token(scram_username, scram_password) -> str:
     client_final = client.get_client_final()
     logger.debug(f'_get_heroic_api_token: SCRAM client final request: {client_final}')
 
-    scram_resp2 = requests.post(hop_auth_api_url + '/scram/final',
-                                json={"client_final": client_final},
-                                headers={"Content-Type":"application/json"})
+    scram_resp2 = get_hop_auth_session().post(hop_auth_api_url + '/scram/final',
+                                              json={"client_final": client_final},
+                                              headers={"Content-Type":"application/json"})
     logger.debug(f'_get_heroic_api_token: SCRAM server final response: {scram_resp2.json()}')
 
     client.set_server_final(scram_resp2.json()["server_final"])
@@ -158,9 +167,9 @@ def get_or_create_user(claims: dict):
         # pass the claims on to SCiMMA Auth to create the User there.
         url = get_hop_auth_api_url() +  f'/users'
         # this requires admin priviledge so use HEROIC service account API token
-        response = requests.post(url, json=claims,
-                                 headers={'Authorization': heroic_api_token,
-                                          'Content-Type': 'application/json'})
+        response = get_hop_auth_session().post(url, json=claims,
+                                               headers={'Authorization': heroic_api_token,
+                                                        'Content-Type': 'application/json'})
         if response.status_code == 201:
             hop_user = response.json()
             logger.debug(f'get_or_create_user new hop_user: {hop_user} type: {type(hop_user)}')
@@ -178,9 +187,9 @@ def verify_credential_for_user(username: str, credential_name: str):
     user_api_token = get_user_api_token(username)
 
     try:
-        response = requests.get(url,
-                                headers={'Authorization': user_api_token,
-                                        'Content-Type': 'application/json'})
+        response = get_hop_auth_session().get(url,
+                                              headers={'Authorization': user_api_token,
+                                                      'Content-Type': 'application/json'})
         response.raise_for_status()
         credential = response.json()
         if credential.get('username') == credential_name:
@@ -193,21 +202,76 @@ def verify_credential_for_user(username: str, credential_name: str):
     return False
 
 
+def _credential_verification_cache_key(username: str, credential_name: str) -> str:
+    return f'hop_credential_verified_{username}_{credential_name}'
+
+
+def cache_credential_verification(username: str, credential_name: str, valid: bool):
+    """ Cache the result of verifying a users credential, along with when it was checked
+
+        Valid credentials are cached for HOP_CREDENTIAL_VERIFY_TTL. Invalid ones are cached for the much
+        shorter HOP_CREDENTIAL_VERIFY_NEGATIVE_TTL, so a failing SCiMMA Auth isn't retried on every request.
+    """
+    timeout = settings.HOP_CREDENTIAL_VERIFY_TTL if valid else settings.HOP_CREDENTIAL_VERIFY_NEGATIVE_TTL
+    auth_cache.set(_credential_verification_cache_key(username, credential_name),
+                   {'valid': valid, 'checked': timezone.now()}, timeout=timeout)
+
+
 def check_and_regenerate_hop_credential(user: User):
     """ Check that the Django model user profile has a valid credential, and if not, generate a new one
+
+        Verification results are cached, so SCiMMA Auth is only called when there is no cached result.
+        Once a cached valid result is older than HOP_CREDENTIAL_VERIFY_REFRESH_AFTER it is re-verified
+        by a background task, so requests don't block on SCiMMA Auth while the credential is known good.
     """
-    if ((not user.profile.credential_name or not user.profile.credential_password) or
-        not verify_credential_for_user(user.username, user.profile.credential_name)):
+    if not user.profile.credential_name or not user.profile.credential_password:
+        regenerate_hop_credential(user)
+        return
+
+    username = user.username
+    credential_name = user.profile.credential_name
+    verification = auth_cache.get(_credential_verification_cache_key(username, credential_name))
+    if verification is None:
+        valid = verify_credential_for_user(username, credential_name)
+        cache_credential_verification(username, credential_name, valid)
+        if not valid:
+            regenerate_hop_credential(user)
+    elif verification['valid']:
+        age = (timezone.now() - verification['checked']).total_seconds()
+        # Only enqueue one refresh per credential at a time
+        if (age > settings.HOP_CREDENTIAL_VERIFY_REFRESH_AFTER and
+                auth_cache.add(f'hop_credential_refresh_{username}_{credential_name}', True,
+                          timeout=settings.HOP_CREDENTIAL_VERIFY_NEGATIVE_TTL)):
+            from heroic_api.tasks import refresh_hop_credential_verification
+            refresh_hop_credential_verification.send(user.id)
+    # Otherwise the credential was recently found invalid, and regenerating it was already attempted then
+
+
+def refresh_hop_credential(user: User):
+    """ Re-verify a users credential, updating the cached verification and regenerating it if it is invalid
+    """
+    username = user.username
+    credential_name = user.profile.credential_name
+    valid = verify_credential_for_user(username, credential_name)
+    cache_credential_verification(username, credential_name, valid)
+    if not valid:
         regenerate_hop_credential(user)
 
 
-def regenerate_hop_credential(user: User):
+def regenerate_hop_credential(user: User) -> bool:
     """ Create hop credential for django model user
+
+        Returns whether a new credential was created
     """
     hop_auth = create_credential_for_user(user.get_username())
+    if hop_auth is None:
+        return False
     user.profile.credential_name = hop_auth.username
     user.profile.credential_password = hop_auth.password
     user.profile.save()
+    # The credential was just created so it doesn't need verifying
+    cache_credential_verification(user.username, hop_auth.username, True)
+    return True
 
 
 def create_credential_for_user(username: str, heroic_api_token: str = None) -> Auth:
@@ -245,9 +309,9 @@ def get_hop_user(username, api_token) -> dict:
     }
     """
     url = f"{get_hop_auth_api_url()}/users/{username}"
-    response = requests.get(url,
-                            headers={'Authorization': api_token,
-                                     'Content-Type': 'application/json'})
+    response = get_hop_auth_session().get(url,
+                                          headers={'Authorization': api_token,
+                                                   'Content-Type': 'application/json'})
 
     if response.status_code == 200:
         # from the response, extract the user dictionarie
@@ -272,10 +336,10 @@ def _create_credential_for_user(username: str, user_api_token) -> Auth:
     logger.info(f'_create_credential_for_user Creating SCRAM credentials for user {username}')
     user_hop_authorization = None
     try:
-        response = requests.post(url,
-                                data=json.dumps({'description': 'Created by HEROIC'}),
-                                headers={'Authorization': user_api_token,
-                                        'Content-Type': 'application/json'})
+        response = get_hop_auth_session().post(url,
+                                              data=json.dumps({'description': 'Created by HEROIC'}),
+                                              headers={'Authorization': user_api_token,
+                                                      'Content-Type': 'application/json'})
         # for example, {'username': 'llindstrom-93fee00b', 'password': 'asdlkjfsadkjf', 'pk': 0}
         user_hop_username = response.json()['username']
         user_hop_password = response.json()['password']
@@ -301,9 +365,9 @@ def delete_user_hop_credentials(username, credential_name, user_api_token):
     url = get_hop_auth_api_url() + f'/users/{username}/credentials/{credential_name}'
 
     # find the <PK> of the SCRAM credential just issued
-    response = requests.delete(url,
-                               headers={'Authorization': user_api_token,
-                                        'Content-Type': 'application/json'})
+    response = get_hop_auth_session().delete(url,
+                                             headers={'Authorization': user_api_token,
+                                                      'Content-Type': 'application/json'})
     if response.status_code == 204:
         logger.info(f"delete_user_hop_credentials: Successfully deleted credential {credential_name} for user {username}")
     else:
@@ -320,7 +384,7 @@ def get_user_api_token(username: str, heroic_api_token=None):
     for the HEROIC service account), to get the API token for the user with
     the given username. If the heroic_api_token isn't passed in, get one.
     """
-    user_api_token = cache.get(f'user_{username}_api_token', None)
+    user_api_token = auth_cache.get(f'user_{username}_api_token')
     if not user_api_token:
         logger.debug(f"User {username} api token doesn't exist in cache, regenerating it now.")
         # Set up the URL
@@ -340,10 +404,10 @@ def get_user_api_token(username: str, heroic_api_token=None):
             heroic_api_token = get_heroic_api_token()
 
         # Make the request and extract the user api token from the response
-        response = requests.post(url,
-                                data=json.dumps(hop_auth_request_data),
-                                headers={'Authorization': heroic_api_token,
-                                        'Content-Type': 'application/json'})
+        response = get_hop_auth_session().post(url,
+                                              data=json.dumps(hop_auth_request_data),
+                                              headers={'Authorization': heroic_api_token,
+                                                      'Content-Type': 'application/json'})
 
         if response.status_code == 200:
             # get the user API token out of the response
@@ -354,7 +418,7 @@ def get_user_api_token(username: str, heroic_api_token=None):
             # Subtract a small amount from timeout to ensure credential is available when retrieved
             expiration_date = dateparse.parse_datetime(user_api_token_expiration_date_as_str)
             timeout = (expiration_date - timezone.now()).total_seconds() - 60
-            cache.set(f'user_{username}_api_token', user_api_token, timeout=timeout)
+            auth_cache.set(f'user_{username}_api_token', user_api_token, timeout=timeout)
             logger.debug("Caching ")
             logger.debug(f'get_user_api_token username: {username};  user_api_token: {user_api_token}')
             logger.debug(f'get_user_api_token user_api_token Expires: {user_api_token_expiration_date_as_str}')
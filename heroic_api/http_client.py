@@ -0,0 +1,147 @@
+"""heroic_api/http_client.py
+
+Shared client for outbound HTTP calls to other services (SCiMMA Auth, observatory schedules, ...)
+
+get_session() returns a requests Session that is cached per name and per thread, so connections to each
+host are pooled and kept alive between calls. The session's requests get:
+  * a default (connect, read) timeout, so a slow dependency can't hang a worker indefinitely
+  * bounded retries with exponential backoff for connection errors and 502/503/504 responses
+    (idempotent methods only, plus connection failures where the request was never sent)
+  * a per-host circuit breaker. After HTTP_CLIENT_BREAKER_FAILURES consecutive failures calls to that
+    host fail fast with CircuitOpenError for HTTP_CLIENT_BREAKER_RESET_SECONDS, after which a single
+    trial request is allowed through to check if the host has recovered.
+"""
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Sessions are cached per name and per thread, since requests Sessions are not guaranteed to be thread-safe
+_session_thread_local = threading.local()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of making a request while the circuit breaker for a host is open"""
+
+
+class CircuitBreaker:
+    """ Tracks consecutive failures for a host and decides whether requests to it are allowed
+
+        Closed: requests are allowed. Open: requests fail fast until reset_seconds have passed.
+        Half open: a single trial request is allowed, and its outcome closes or re-opens the circuit.
+    """
+    def __init__(self, host: str, failure_threshold: int, reset_seconds: float):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_seconds and not self.trial_in_progress:
+                self.trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f'Circuit breaker for {self.host} closed')
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f'Circuit breaker for {self.host} opened after {self.failures} consecutive failures')
+                self.opened_at = time.monotonic()
+
+
+# Circuit breakers are shared by every session in the process
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(
+                host, settings.HTTP_CLIENT_BREAKER_FAILURES, settings.HTTP_CLIENT_BREAKER_RESET_SECONDS
+            )
+        return _circuit_breakers[host]
+
+
+def reset_circuit_breakers():
+    """Forget the state of all circuit breakers"""
+    with _circuit_breakers_lock:
+        _circuit_breakers.clear()
+
+
+class ResilientSession(requests.Session):
+    """ requests Session with default timeouts, retries and per-host circuit breaking
+
+        Responses with a 5xx status still count as failures for the circuit breaker but are returned
+        as normal, so callers keep handling error statuses as they do now.
+    """
+    def __init__(self, timeout=None, retries: int = None, backoff_factor: float = None, pool_maxsize: int = None):
+        super().__init__()
+        self.timeout = timeout or settings.HTTP_CLIENT_TIMEOUT
+        retry = Retry(
+            total=settings.HTTP_CLIENT_RETRIES if retries is None else retries,
+            backoff_factor=settings.HTTP_CLIENT_BACKOFF_FACTOR if backoff_factor is None else backoff_factor,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_maxsize=pool_maxsize or settings.HTTP_CLIENT_POOL_MAXSIZE,
+            max_retries=retry
+        )
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        breaker = get_circuit_breaker(urlsplit(url).netloc)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f'Circuit breaker for {breaker.host} is open, not calling {method} {url}')
+        try:
+            response = super().request(method, url, **kwargs)
+        except Exception:
+            # Any error, not just connection errors and timeouts, is a failure, so a half open circuit's
+            # trial request always ends the trial
+            breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+
+def get_session(name: str = 'default', **kwargs) -> ResilientSession:
+    """ Return this thread's ResilientSession for the given name, creating it if needed
+
+        Keyword arguments are passed to the ResilientSession when it is first created.
+    """
+    sessions = getattr(_session_thread_local, 'sessions', None)
+    if sessions is None:
+        sessions = _session_thread_local.sessions = {}
+    if name not in sessions:
+        sessions[name] = ResilientSession(**kwargs)
+    return sessions[name]
@@ -0,0 +1,162 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+BENCHMARK_TABLE = 'benchmark_telescopestatus'
+BENCHMARK_TELESCOPE_TABLE = 'benchmark_telescope'
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+# The hot queries of the status history, see heroic_api.snapshot, Telescope.update_current_status, the status
+# filters' start_filter and the GW visibility status intervals
+QUERIES = (
+    ('status of a telescope at a time',
+     'SELECT * FROM {table} WHERE telescope_id = %(telescope)s AND date < %(time)s ORDER BY date DESC, id DESC LIMIT 1'),
+    ('a day of a telescope',
+     'SELECT * FROM {table} WHERE telescope_id = %(telescope)s AND date >= %(start)s AND date < %(end)s '
+     'ORDER BY date DESC, id DESC'),
+    ('an hour of every telescope',
+     'SELECT count(*) FROM {table} WHERE date >= %(start)s AND date < %(hour_end)s'),
+    ('snapshot of every telescope',
+     'SELECT * FROM {table} WHERE date <= %(time)s AND id IN (SELECT (SELECT id FROM {table} '
+     'WHERE telescope_id = telescope.id AND date <= %(time)s ORDER BY date DESC, id DESC LIMIT 1) '
+     'FROM {telescope_table} telescope) ORDER BY telescope_id'),
+)
+
+# The indexes of heroic_api_telescopestatus before migrations 0013 and 0014, and the ones they add
+BASELINE_INDEXES = (
+    'CREATE INDEX ON {table} (telescope_id)',
+    'CREATE INDEX ON {table} (date)',
+)
+TUNED_INDEXES = (
+    'CREATE INDEX ON {table} (telescope_id, date DESC, id DESC)',
+    'CREATE INDEX ON {table} USING brin (date) WITH (autosummarize = on)',
+)
+
+
+class Command(BaseCommand):
+    help = ('Compare the query plans and execution times of the hot status history queries on a synthetic '
+            f'{BENCHMARK_TABLE} table, with only the single column indexes HEROIC had before, and with the '
+            'composite and BRIN indexes added too. The tables are dropped afterwards unless --keep is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='Number of statuses in the table')
+        parser.add_argument('--telescopes', type=int, default=100, help='Number of telescopes they are spread over')
+        parser.add_argument('--seconds-between', type=int, default=30,
+                            help='Seconds between consecutive statuses across all the telescopes')
+        parser.add_argument('--keep', action='store_true', help='Keep the table, and reuse it if it exists')
+        parser.add_argument('--plans', action='store_true', help='Print the full query plans')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('This benchmark needs PostgreSQL')
+        end = START + timedelta(seconds=options['seconds_between'] * options['rows'])
+        middle = START + (end - START) / 2
+        params = {
+            'telescope': 'bench.site.tel0',
+            'time': middle,
+            'start': middle,
+            'end': middle + timedelta(days=1),
+            'hour_end': middle + timedelta(hours=1),
+        }
+        with connection.cursor() as cursor:
+            self._create_table(cursor, options)
+            try:
+                self._run_indexes(cursor, BASELINE_INDEXES)
+                baseline = self._run_queries(cursor, params, 'single column indexes', options['plans'])
+                self._run_indexes(cursor, TUNED_INDEXES)
+                tuned = self._run_queries(cursor, params, 'composite and BRIN indexes', options['plans'])
+                cursor.execute(f"SELECT pg_size_pretty(pg_relation_size(indexrelid)), indexrelid::regclass "
+                               f"FROM pg_index WHERE indrelid = '{BENCHMARK_TABLE}'::regclass")
+                for size, index in cursor.fetchall():
+                    self.stdout.write(f'{index}: {size}')
+            finally:
+                if not options['keep']:
+                    cursor.execute(f'DROP TABLE {BENCHMARK_TABLE}, {BENCHMARK_TELESCOPE_TABLE}')
+
+        for name, _ in QUERIES:
+            (before_ms, before_buffers, before_plan), (after_ms, after_buffers, after_plan) = baseline[name], tuned[name]
+            self.stdout.write(
+                f'{name}: {before_ms:.2f}ms ({before_buffers} buffers, {before_plan}) -> '
+                f'{after_ms:.2f}ms ({after_buffers} buffers, {after_plan}), {before_ms / max(after_ms, 0.001):.1f}x'
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+    def _create_table(self, cursor, options):
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {BENCHMARK_TELESCOPE_TABLE} (id varchar(191) PRIMARY KEY)')
+        cursor.execute(f'DELETE FROM {BENCHMARK_TELESCOPE_TABLE}')
+        cursor.execute(f"INSERT INTO {BENCHMARK_TELESCOPE_TABLE} SELECT 'bench.site.tel' || i "
+                       f"FROM generate_series(0, %s - 1) AS i", [options['telescopes']])
+        cursor.execute('SELECT to_regclass(%s)', [BENCHMARK_TABLE])
+        if cursor.fetchone()[0] is not None:
+            if options['keep']:
+                self.stdout.write(f'Reusing the existing {BENCHMARK_TABLE} table')
+                cursor.execute('SELECT indexrelid::regclass::text FROM pg_index '
+                               'WHERE indrelid = %s::regclass AND NOT indisprimary', [BENCHMARK_TABLE])
+                for (index,) in cursor.fetchall():
+                    cursor.execute(f'DROP INDEX {index}')
+                return
+            raise CommandError(f'{BENCHMARK_TABLE} already exists, drop it or run with --keep to reuse it')
+        start = time.perf_counter()
+        # Unlogged, since it's thrown away, and shaped like heroic_api_telescopestatus without its foreign key
+        cursor.execute(f'''
+            CREATE UNLOGGED TABLE {BENCHMARK_TABLE} (
+                id bigserial PRIMARY KEY,
+                date timestamp with time zone NOT NULL,
+                telescope_id varchar(191) NOT NULL,
+                status varchar(20) NOT NULL,
+                reason text,
+                extra jsonb NOT NULL,
+                created timestamp with time zone NOT NULL
+            )
+        ''')
+        # Statuses are appended in date order, round robin over the telescopes
+        cursor.execute(f'''
+            INSERT INTO {BENCHMARK_TABLE} (date, telescope_id, status, reason, extra, created)
+            SELECT %(start)s + i * %(step)s * interval '1 second', 'bench.site.tel' || (i %% %(telescopes)s),
+                   (ARRAY['AVAILABLE', 'UNAVAILABLE', 'SCHEDULABLE'])[1 + i %% 3], 'Benchmark status', '{{}}', now()
+            FROM generate_series(0, %(rows)s - 1) AS i
+        ''', {'start': START, 'step': options['seconds_between'], 'telescopes': options['telescopes'],
+              'rows': options['rows']})
+        self.stdout.write(f"Created {options['rows']} statuses in {time.perf_counter() - start:.1f}s")
+
+    def _run_indexes(self, cursor, statements):
+        start = time.perf_counter()
+        for statement in statements:
+            cursor.execute(statement.format(table=BENCHMARK_TABLE))
+        cursor.execute(f'VACUUM ANALYZE {BENCHMARK_TABLE}')
+        self.stdout.write(f'Built {len(statements)} indexes in {time.perf_counter() - start:.1f}s')
+
+    def _run_queries(self, cursor, params: dict, label: str, print_plans: bool) -> dict:
+        """Return the (execution time in ms, shared buffers touched, plan summary) of each query"""
+        results = {}
+        for name, sql in QUERIES:
+            sql = sql.format(table=BENCHMARK_TABLE, telescope_table=BENCHMARK_TELESCOPE_TABLE)
+            # Run once first so both index sets are measured with a warm cache
+            cursor.execute(sql, params)
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+            explain = cursor.fetchone()[0]
+            if isinstance(explain, str):
+                explain = json.loads(explain)
+            plan = explain[0]['Plan']
+            buffers = plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0)
+            results[name] = (explain[0]['Execution Time'], buffers, _summarize(plan))
+            if print_plans:
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+                self.stdout.write(f'{name} with {label}:')
+                self.stdout.write('\n'.join(row[0] for row in cursor.fetchall()))
+        return results
+
+
+def _summarize(plan: dict) -> str:
+    """The plan's node types and the indexes they use, outermost first"""
+    nodes = []
+    while plan:
+        node = plan['Node Type']
+        if 'Index Name' in plan:
+            node += f" on {plan['Index Name']}"
+        nodes.append(node)
+        plan = plan.get('Plans', [None])[0]
+    return ' > '.join(nodes)
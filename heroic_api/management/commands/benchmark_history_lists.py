@@ -0,0 +1,99 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from heroic_api.models import Observatory, Site, Telescope, Instrument, TelescopeStatus, TelescopePointing
+from heroic_api.renderers import FastJSONRenderer
+from heroic_api.serializers import (TelescopeStatusSerializer, TelescopePointingSerializer,
+                                    TelescopeStatusValuesSerializer, TelescopePointingValuesSerializer)
+
+BENCHMARK_TELESCOPE = 'bench.site.tel'
+BENCHMARK_INSTRUMENT = 'bench.site.tel.inst'
+
+
+class Command(BaseCommand):
+    help = ('Compare the throughput of listing telescope statuses and pointings through their ModelSerializers and '
+            'the JSONRenderer with the values() and orjson path the list endpoints use. Use --setup to create the '
+            'benchmark telescope and its history first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of rows to list')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of times to list them with each path')
+        parser.add_argument('--setup', action='store_true',
+                            help=f'Create the {BENCHMARK_TELESCOPE} telescope with --rows statuses and pointings')
+
+    def handle(self, *args, **options):
+        if options['setup']:
+            _setup_history(options['rows'])
+        telescope = Telescope.objects.filter(id=BENCHMARK_TELESCOPE).first()
+        if telescope is None:
+            raise CommandError(f'The {BENCHMARK_TELESCOPE} telescope does not exist, run with --setup to create it')
+
+        benchmarks = (
+            ('statuses', TelescopeStatus, TelescopeStatusSerializer, TelescopeStatusValuesSerializer()),
+            ('pointings', TelescopePointing, TelescopePointingSerializer, TelescopePointingValuesSerializer()),
+        )
+        for name, model, serializer_class, values_serializer in benchmarks:
+            queryset = model.objects.filter(telescope=telescope).order_by('-date', '-id')[:options['rows']]
+
+            def serializer_path():
+                return JSONRenderer().render(serializer_class(list(queryset), many=True).data)
+
+            def values_path():
+                return FastJSONRenderer().render(values_serializer.many(values_serializer.values(queryset)))
+
+            if json.loads(serializer_path()) != json.loads(values_path()):
+                raise CommandError(f'The values path lists different {name} than the serializer path')
+            num_rows = queryset.count()
+            serializer_rate = num_rows / _best_time(serializer_path, options['repeat'])
+            values_rate = num_rows / _best_time(values_path, options['repeat'])
+            self.stdout.write(
+                f'{num_rows} {name}: serializer {serializer_rate:.0f} rows/s, values {values_rate:.0f} rows/s, '
+                f'{values_rate / serializer_rate:.1f}x'
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+
+def _best_time(func, repeat: int) -> float:
+    """The fastest of repeat runs of func, which is the one least disturbed by everything else running"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _setup_history(num_rows: int):
+    observatory, _ = Observatory.objects.get_or_create(id='bench', defaults={'name': 'Benchmark Observatory'})
+    site, _ = Site.objects.get_or_create(
+        id='bench.site', defaults={'name': 'Benchmark Site', 'elevation': 0.0, 'observatory': observatory}
+    )
+    telescope, _ = Telescope.objects.get_or_create(
+        id=BENCHMARK_TELESCOPE, defaults={'name': 'Benchmark Telescope', 'site': site}
+    )
+    instrument, _ = Instrument.objects.get_or_create(
+        id=BENCHMARK_INSTRUMENT, defaults={'name': 'Benchmark Instrument', 'telescope': telescope}
+    )
+    now = timezone.now()
+    missing_statuses = num_rows - TelescopeStatus.objects.filter(telescope=telescope).count()
+    TelescopeStatus.objects.bulk_create([
+        TelescopeStatus(telescope=telescope, date=now - timedelta(minutes=i), status=TelescopeStatus.StatusChoices.AVAILABLE,
+                        reason='Benchmark status', extra={'seeing': 1.2, 'wind_speed': 5.5})
+        for i in range(max(missing_statuses, 0))
+    ], batch_size=1000)
+    missing_pointings = num_rows - TelescopePointing.objects.filter(telescope=telescope).count()
+    TelescopePointing.objects.bulk_create([
+        TelescopePointing(
+            telescope=telescope, instrument=instrument, date=now - timedelta(minutes=i), target=f'Target {i}',
+            coordinate=f'SRID=4326;POINT ({i % 360} {i % 180 - 90})',
+            field=f'SRID=4326;POLYGON (({i % 360} {i % 180 - 90}, {i % 360 + 0.5} {i % 180 - 90}, '
+                  f'{i % 360 + 0.5} {i % 180 - 89.5}, {i % 360} {i % 180 - 89.5}, {i % 360} {i % 180 - 90}))',
+            extra={'exposure_time': 30.0}
+        )
+        for i in range(max(missing_pointings, 0))
+    ], batch_size=1000)
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from heroic_api.models import Observatory, Site, Telescope, Instrument
+from heroic_api.schedule_ingest import get_schedule_source
+from heroic_api.schedule_ingest.pipeline import ingest_schedule
+
+
+class Command(BaseCommand):
+    help = ('Synchronously fetch and ingest the schedule of a configured schedule source. Use the fake source '
+            'with --setup and --repeat to load test the ingest pipeline offline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='NAME of the source in SCHEDULE_INGEST_SOURCES')
+        parser.add_argument('--repeat', type=int, default=1, help='Number of times to ingest the schedule')
+        parser.add_argument('--setup', action='store_true',
+                            help="Create the source's observatory, site, telescope and instrument if they don't exist")
+        parser.add_argument('--option', action='append', default=[], metavar='KEY=VALUE',
+                            help='Override a source OPTION, e.g. --option NUM_VISITS=10000')
+
+    def handle(self, *args, **options):
+        try:
+            source = get_schedule_source(options['source'])
+        except KeyError as e:
+            raise CommandError(str(e))
+        for option in options['option']:
+            key, _, value = option.partition('=')
+            source.options[key] = _parse_option_value(value)
+        if 'BATCH_SIZE' in source.options:
+            source.batch_size = source.options['BATCH_SIZE']
+        if options['setup']:
+            _setup_telescope(source.telescope_id, source.instrument_id)
+
+        total_start = time.perf_counter()
+        for _ in range(options['repeat']):
+            stats = ingest_schedule(source)
+            if not stats:
+                raise CommandError(f'Failed to ingest the {source.name} schedule, see the log for details')
+            self.stdout.write(
+                f"{stats['visits']} visits: performed {stats['performed']}, planned {stats['planned']}, "
+                f"fetch {stats['fetch_time']:.3f}s, parse {stats['parse_time']:.3f}s, write {stats['write_time']:.3f}s"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested the {source.name} schedule {options['repeat']} times in {time.perf_counter() - total_start:.3f}s"
+        ))
+
+
+def _parse_option_value(value: str):
+    for value_type in (int, float):
+        try:
+            return value_type(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _setup_telescope(telescope_id: str, instrument_id: str):
+    """Create the observatory, site and telescope hierarchy for an id of the form observatory.site.telescope"""
+    observatory_id, site_id, _ = telescope_id.split('.', 2)
+    observatory, _ = Observatory.objects.get_or_create(id=observatory_id, defaults={'name': observatory_id})
+    site, _ = Site.objects.get_or_create(
+        id=f'{observatory_id}.{site_id}', defaults={'name': site_id, 'observatory': observatory}
+    )
+    telescope, _ = Telescope.objects.get_or_create(id=telescope_id, defaults={'name': telescope_id, 'site': site})
+    Instrument.objects.get_or_create(id=instrument_id, defaults={'name': instrument_id, 'telescope': telescope})
@@ -0,0 +1,152 @@
+"""heroic_api/metrics.py
+
+Prometheus metrics for the computation and ingest hot paths, and the HEROIC cache layer
+
+The metrics are served in the Prometheus text format by the /metrics view for the web app, by the dramatiq
+Prometheus middleware's exposition server (port 9191) for the dramatiq workers, and by a small HTTP server
+started on METRICS_SERVER_PORT for the alert stream ingestor. When PROMETHEUS_MULTIPROC_DIR is set, every
+process writes its samples there and the exposition aggregates them, so the numbers cover all gunicorn (or
+dramatiq) worker processes rather than whichever one answered the scrape. It must be set in the environment
+before the process starts, and is cleared when gunicorn starts (see heroic_base/gunicorn_config.py).
+"""
+from datetime import datetime, timezone
+from functools import wraps
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+import prometheus_client
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Hot paths range from a millisecond of interval math to a minute of high resolution skymap
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Ingest lag ranges from seconds for live alert streams to hours for observing schedules
+LAG_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 3 * 3600.0, 12 * 3600.0, 86400.0)
+
+HOT_PATH_SECONDS = prometheus_client.Histogram(
+    'heroic_hot_path_duration_seconds',
+    'Time spent in each instrumented hot path (the spans of heroic_api.profiling)',
+    ['span'], buckets=DURATION_BUCKETS
+)
+SKYMAP_PIXELS = prometheus_client.Counter(
+    'heroic_skymap_pixels',
+    'HEALPix pixels computed for skymap visibility, per telescope'
+)
+HOP_MESSAGES = prometheus_client.Counter(
+    'heroic_hop_messages',
+    'Alert stream messages handled, by handler and outcome',
+    ['handler', 'outcome']
+)
+HOP_MESSAGE_SECONDS = prometheus_client.Histogram(
+    'heroic_hop_message_duration_seconds',
+    'Time spent handling each alert stream message',
+    ['handler'], buckets=DURATION_BUCKETS
+)
+INGEST_LAG_SECONDS = prometheus_client.Histogram(
+    'heroic_ingest_lag_seconds',
+    'Time from an ingested status, or performed visit, to when it was stored',
+    ['source'], buckets=LAG_BUCKETS
+)
+SCHEDULE_INGEST_SECONDS = prometheus_client.Histogram(
+    'heroic_schedule_ingest_duration_seconds',
+    'Time spent in each stage of a schedule ingest',
+    ['source', 'stage'], buckets=DURATION_BUCKETS
+)
+SCHEDULE_INGEST_VISITS = prometheus_client.Counter(
+    'heroic_schedule_ingest_visits',
+    'Visits parsed from schedule sources',
+    ['source']
+)
+CACHE_OPERATIONS = prometheus_client.Counter(
+    'heroic_cache_operations',
+    'HEROIC cache operations, by namespace and operation (hit, miss, set, or oversize for values too large '
+    'to store)',
+    ['namespace', 'operation']
+)
+
+
+def metrics_available() -> bool:
+    return settings.METRICS_ENABLED
+
+
+def observe_span(name: str, seconds: float):
+    HOT_PATH_SECONDS.labels(name).observe(seconds)
+
+
+def count_skymap_pixels(num_pixels: int):
+    SKYMAP_PIXELS.inc(num_pixels)
+
+
+def count_cache_operation(namespace: str, operation: str, amount: int = 1):
+    if amount:
+        CACHE_OPERATIONS.labels(namespace, operation).inc(amount)
+
+
+def observe_ingest_lag(source: str, date: datetime):
+    """Record the lag between a date in the ingested data and now"""
+    INGEST_LAG_SECONDS.labels(source).observe(max((datetime.now(timezone.utc) - date).total_seconds(), 0.0))
+
+
+def observe_schedule_ingest(stats: dict):
+    """Record the stats returned by heroic_api.schedule_ingest.pipeline.ingest_schedule"""
+    if not stats:
+        return
+    for stage in ('fetch', 'parse', 'write'):
+        SCHEDULE_INGEST_SECONDS.labels(stats['source'], stage).observe(stats[f'{stage}_time'])
+    SCHEDULE_INGEST_VISITS.labels(stats['source']).inc(stats['visits'])
+
+
+def hop_handler(name: str):
+    """Decorator counting and timing the alert stream messages handled by the decorated handler"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start_metrics_server()
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'success'
+                return result
+            finally:
+                HOP_MESSAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+                HOP_MESSAGES.labels(name, outcome).inc()
+        return wrapper
+    return decorator
+
+
+def get_registry():
+    """The registry to expose: every process's samples when running multiprocess, else this process's"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return prometheus_client.REGISTRY
+
+
+def generate_metrics() -> tuple:
+    """Return the (body, content type) of the metrics exposition"""
+    return prometheus_client.generate_latest(get_registry()), prometheus_client.CONTENT_TYPE_LATEST
+
+
+_server_lock = threading.Lock()
+_server_started = False
+
+
+def start_metrics_server():
+    """Serve metrics on METRICS_SERVER_PORT from this process, for processes without a web server (the ingestor)"""
+    global _server_started
+    if _server_started or not settings.METRICS_SERVER_PORT or not metrics_available():
+        return
+    with _server_lock:
+        if _server_started:
+            return
+        _server_started = True
+        try:
+            prometheus_client.start_http_server(settings.METRICS_SERVER_PORT, registry=get_registry())
+        except OSError:
+            logger.exception(f"Failed to start the metrics server on port {settings.METRICS_SERVER_PORT}")
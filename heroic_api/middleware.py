@@ -7,7 +7,8 @@ from django.contrib.auth import logout
 from django.core.exceptions import MiddlewareNotUsed
 from django.http import HttpResponse
 
-from heroic_api.tasks import write_request_metric
+from heroic_api.profiling import get_current_profile, profile_request
+from heroic_api.request_metrics import get_request_metric_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -36,13 +37,35 @@ class SCiMMAAuthSessionRefresh:
         return response
 
 
+class ServerTimingMiddleware:
+    """Middleware that profiles each request when PROFILING_ENABLED is set (see heroic_api.profiling).
+
+    The time spent in each instrumented hot path, and the number and total duration of database
+    queries, are returned in a Server-Timing header. This must come before InfluxDBRequestLogger so
+    the same timings are also added as fields of the request's InfluxDB point.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+
+    def __call__(self, request):
+        with profile_request() as profile:
+            response = self.get_response(request)
+        response['Server-Timing'] = profile.server_timing()
+        return response
+
+
 class InfluxDBRequestLogger:
     """Middleware that records a metric for every request to an InfluxDB v1 database.
 
     Each request is turned into a single point capturing the endpoint, authenticated user
     (if any), status code, response size and latency. Rather than writing to InfluxDB inline,
-    the point is handed to the write_request_metric dramatiq actor so the actual write happens
-    on the worker and adds no latency to the request/response path.
+    the point is added to an in-process buffer which is flushed in batches to the
+    write_request_metrics dramatiq actor (see heroic_api.request_metrics), so the actual write
+    happens on the worker and adds no latency to the request/response path.
     """
 
     def __init__(self, get_response):
@@ -53,6 +76,7 @@ class InfluxDBRequestLogger:
             raise MiddlewareNotUsed()
 
         self.measurement = settings.INFLUXDB_MEASUREMENT
+        self.buffer = get_request_metric_buffer()
 
     def __call__(self, request):
         start = time.monotonic()
@@ -63,9 +87,9 @@ class InfluxDBRequestLogger:
         try:
             latency_ms = (time.monotonic() - start) * 1000.0
             point = self._build_point(request, response, request_time, latency_ms)
-            write_request_metric.send(point)
+            self.buffer.add(point)
         except Exception:
-            logger.exception('Failed to enqueue request metric for InfluxDB.')
+            logger.exception('Failed to buffer request metric for InfluxDB.')
 
         return response
 
@@ -93,6 +117,17 @@ class InfluxDBRequestLogger:
         else:
             response_size = len(response.content)
 
+        fields = {
+            'path': request.get_full_path(),
+            'client_ip': self._client_ip(request),
+            'response_size': response_size,
+            'latency_ms': round(latency_ms, 3),
+            'count': 1,
+        }
+        profile = get_current_profile()
+        if profile is not None:
+            fields.update(profile.influxdb_fields())
+
         # 'time' is serialized to an ISO8601 string so the point survives JSON serialization
         return {
             'measurement': self.measurement,
@@ -104,13 +139,7 @@ class InfluxDBRequestLogger:
                 'user': username,
                 'authenticated': username != 'anonymous',
             },
-            'fields': {
-                'path': request.get_full_path(),
-                'client_ip': self._client_ip(request),
-                'response_size': response_size,
-                'latency_ms': round(latency_ms, 3),
-                'count': 1,
-            },
+            'fields': fields,
         }
 
     @staticmethod
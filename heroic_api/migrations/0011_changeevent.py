@@ -0,0 +1,29 @@
+# Generated by Django 5.2.13 on 2026-10-19 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heroic_api', '0010_telescopepointing_planned_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('object_type', models.CharField(choices=[('TELESCOPE_STATUS', 'Telescope Status'), ('PLANNED_TELESCOPE_STATUS', 'Planned Telescope Status'), ('INSTRUMENT_CAPABILITY', 'Instrument Capability'), ('PLANNED_INSTRUMENT_CAPABILITY', 'Planned Instrument Capability'), ('TELESCOPE_POINTING', 'Telescope Pointing')], help_text='Type of the changed object', max_length=40)),
+                ('object_id', models.BigIntegerField(help_text='ID of the changed object')),
+                ('action', models.CharField(choices=[('CREATED', 'Created'), ('UPDATED', 'Updated'), ('DELETED', 'Deleted')], help_text='What happened to the object', max_length=10)),
+                ('telescope', models.CharField(blank=True, default='', help_text='ID of the telescope the changed object belongs to. Not a foreign key so events outlive telescopes.', max_length=191)),
+                ('data', models.JSONField(blank=True, default=dict, help_text='Representation of the object after the change, empty for deletions')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, help_text='When this change happened')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['telescope', 'id'], name='ce_telescope_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.13 on 2026-10-19 00:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def set_current_status_and_capability(apps, schema_editor):
+    Telescope = apps.get_model('heroic_api', 'Telescope')
+    TelescopeStatus = apps.get_model('heroic_api', 'TelescopeStatus')
+    Instrument = apps.get_model('heroic_api', 'Instrument')
+    InstrumentCapability = apps.get_model('heroic_api', 'InstrumentCapability')
+    Telescope.objects.update(current_status=Subquery(
+        TelescopeStatus.objects.filter(telescope=OuterRef('pk')).order_by('-date', '-id').values('pk')[:1]
+    ))
+    Instrument.objects.update(current_capability=Subquery(
+        InstrumentCapability.objects.filter(instrument=OuterRef('pk')).order_by('-date', '-id').values('pk')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heroic_api', '0011_changeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telescope',
+            name='current_status',
+            field=models.ForeignKey(blank=True, editable=False, help_text='The latest status of this telescope, kept up to date whenever a status is saved or deleted', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='heroic_api.telescopestatus'),
+        ),
+        migrations.AddField(
+            model_name='instrument',
+            name='current_capability',
+            field=models.ForeignKey(blank=True, editable=False, help_text='The latest capability of this instrument, kept up to date whenever a capability is saved or deleted', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='heroic_api.instrumentcapability'),
+        ),
+        migrations.RunPython(set_current_status_and_capability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.13 on 2026-10-19 00:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The history tables are large, so their indexes are built without locking out writes
+    atomic = False
+
+    dependencies = [
+        ('heroic_api', '0012_telescope_current_status_instrument_current_capability'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='telescopestatus',
+            index=models.Index(fields=['telescope', '-date', '-id'], name='ts_telescope_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='instrumentcapability',
+            index=models.Index(fields=['instrument', '-date', '-id'], name='ic_instrument_date_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.13 on 2026-10-19 00:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The history tables are large, so their indexes are built without locking out writes
+    atomic = False
+
+    dependencies = [
+        ('heroic_api', '0013_telescopestatus_instrumentcapability_latest_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='telescopestatus',
+            index=django.contrib.postgres.indexes.BrinIndex(autosummarize=True, fields=['date'], name='ts_date_brin'),
+        ),
+        AddIndexConcurrently(
+            model_name='instrumentcapability',
+            index=django.contrib.postgres.indexes.BrinIndex(autosummarize=True, fields=['date'], name='ic_date_brin'),
+        ),
+        AddIndexConcurrently(
+            model_name='telescopepointing',
+            index=models.Index(fields=['telescope', '-date'], name='tp_telescope_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='telescopepointing',
+            index=models.Index(fields=['instrument', '-date'], name='tp_instrument_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='telescopepointing',
+            index=django.contrib.postgres.indexes.BrinIndex(autosummarize=True, fields=['date'], name='tp_date_brin'),
+        ),
+    ]
@@ -0,0 +1,171 @@
+# Generated by Django 5.2.13 on 2026-10-19 00:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Creates the monthly partition of a partitioned table for the month containing the date, named
+# <table>_pYYYY_MM, if it doesn't exist. Rows of that month already in the table's default partition are
+# moved into it first. Used by heroic_api.partitions to keep partitions ahead of the current month.
+CREATE_MONTH_PARTITION_FUNCTION = '''
+CREATE OR REPLACE FUNCTION heroic_create_month_partition(parent regclass, partition_month date) RETURNS boolean AS $$
+DECLARE
+    parent_name text := (SELECT relname FROM pg_class WHERE oid = parent);
+    partition_name text := format('%s_p%s', parent_name, to_char(partition_month, 'YYYY_MM'));
+    default_name text := parent_name || '_default';
+    lower_bound timestamptz := date_trunc('month', partition_month::timestamp) AT TIME ZONE 'UTC';
+    upper_bound timestamptz := (date_trunc('month', partition_month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %s INCLUDING DEFAULTS INCLUDING STORAGE)', partition_name, parent);
+    IF to_regclass(default_name) IS NOT NULL THEN
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I WHERE date >= %L AND date < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+            default_name, lower_bound, upper_bound, partition_name
+        );
+    END IF;
+    EXECUTE format('ALTER TABLE %s ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent, partition_name, lower_bound, upper_bound);
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+# Replaces a table with a copy partitioned by month on date, keeping the names of its indexes, foreign keys
+# and id sequence. The primary key of a partitioned table must include the partition key, so it becomes
+# (id, date). The id stays unique, since it comes from the sequence, and Django still treats it as the
+# primary key. There are partitions from the month of the oldest row, or the current month if that is later
+# or the table is empty, to months_ahead months from now, and a default partition for rows outside them.
+PARTITION_TABLE_FUNCTION = '''
+CREATE OR REPLACE FUNCTION heroic_partition_by_month(table_name text, months_ahead integer) RETURNS void AS $$
+DECLARE
+    old_table text := table_name || '_unpartitioned';
+    id_sequence text := pg_get_serial_sequence(table_name, 'id');
+    is_identity boolean := (SELECT attidentity <> '' FROM pg_attribute
+                            WHERE attrelid = table_name::regclass AND attname = 'id');
+    index_definitions text[] := '{}';
+    constraint_definitions text[] := '{}';
+    definition text;
+    next_id bigint;
+    partition_month date;
+    this_month date := date_trunc('month', now() AT TIME ZONE 'UTC');
+    last_month date := this_month + make_interval(months => months_ahead);
+    item record;
+BEGIN
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', table_name, old_table);
+    EXECUTE format('ALTER TABLE %I RENAME CONSTRAINT %I TO %I', old_table, table_name || '_pkey', old_table || '_pkey');
+    -- Index names are unique per schema, so drop them here to recreate them on the partitioned table
+    FOR item IN SELECT indexname, indexdef FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = old_table AND indexname <> old_table || '_pkey' LOOP
+        EXECUTE format('DROP INDEX %I', item.indexname);
+        index_definitions := index_definitions || replace(
+            item.indexdef, format(' ON %s.%s ', current_schema(), old_table), format(' ON %s.%s ', current_schema(), table_name)
+        );
+    END LOOP;
+    FOR item IN SELECT conname, pg_get_constraintdef(oid) AS condef FROM pg_constraint
+                WHERE conrelid = old_table::regclass AND contype = 'f' LOOP
+        constraint_definitions := constraint_definitions ||
+            format('ALTER TABLE %I ADD CONSTRAINT %I %s', table_name, item.conname, item.condef);
+    END LOOP;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS) '
+                   'PARTITION BY RANGE (date)', table_name, old_table);
+    IF is_identity THEN
+        -- Replace the identity column's sequence, which goes with the old table, with an owned sequence
+        next_id := nextval(id_sequence);
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN id DROP IDENTITY', old_table);
+        id_sequence := table_name || '_id_seq';
+        EXECUTE format('CREATE SEQUENCE %I', id_sequence);
+        PERFORM setval(id_sequence, next_id, false);
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN id SET DEFAULT nextval(%L)', table_name, id_sequence);
+    END IF;
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', id_sequence, table_name);
+
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', table_name || '_default', table_name);
+    EXECUTE format('SELECT date_trunc(''month'', min(date) AT TIME ZONE ''UTC'') FROM %I', old_table) INTO partition_month;
+    partition_month := least(coalesce(partition_month, this_month), this_month);
+    WHILE partition_month <= last_month LOOP
+        PERFORM heroic_create_month_partition(table_name::regclass, partition_month);
+        partition_month := partition_month + interval '1 month';
+    END LOOP;
+
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', table_name, old_table);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I PRIMARY KEY (id, date)', table_name, table_name || '_pkey');
+    FOREACH definition IN ARRAY index_definitions || constraint_definitions LOOP
+        EXECUTE definition;
+    END LOOP;
+    EXECUTE format('DROP TABLE %I', old_table);
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+# The reverse of heroic_partition_by_month, which merges the attached partitions back into a single table.
+# Partitions detached by the retention policy are left as they are.
+UNPARTITION_TABLE_FUNCTION = '''
+CREATE OR REPLACE FUNCTION heroic_unpartition(table_name text) RETURNS void AS $$
+DECLARE
+    old_table text := table_name || '_partitioned';
+    id_sequence text := pg_get_serial_sequence(table_name, 'id');
+    index_definitions text[] := '{}';
+    constraint_definitions text[] := '{}';
+    definition text;
+    item record;
+BEGIN
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', table_name, old_table);
+    EXECUTE format('ALTER TABLE %I RENAME CONSTRAINT %I TO %I', old_table, table_name || '_pkey', old_table || '_pkey');
+    FOR item IN SELECT indexname, indexdef FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = old_table AND indexname <> old_table || '_pkey' LOOP
+        EXECUTE format('DROP INDEX %I', item.indexname);
+        index_definitions := index_definitions || replace(replace(
+            item.indexdef, ' ON ONLY ', ' ON '
+        ), format(' ON %s.%s ', current_schema(), old_table), format(' ON %s.%s ', current_schema(), table_name));
+    END LOOP;
+    FOR item IN SELECT conname, pg_get_constraintdef(oid) AS condef FROM pg_constraint
+                WHERE conrelid = old_table::regclass AND contype = 'f' AND conparentid = 0 LOOP
+        constraint_definitions := constraint_definitions ||
+            format('ALTER TABLE %I ADD CONSTRAINT %I %s', table_name, item.conname, item.condef);
+    END LOOP;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS)',
+                   table_name, old_table);
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', id_sequence, table_name);
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', table_name, old_table);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I PRIMARY KEY (id)', table_name, table_name || '_pkey');
+    FOREACH definition IN ARRAY index_definitions || constraint_definitions LOOP
+        EXECUTE definition;
+    END LOOP;
+    EXECUTE format('DROP TABLE %I CASCADE', old_table);
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+PARTITIONED_TABLES = ('heroic_api_telescopestatus', 'heroic_api_telescopepointing')
+MONTHS_AHEAD = 3
+
+PARTITION_SQL = '\n'.join([CREATE_MONTH_PARTITION_FUNCTION, PARTITION_TABLE_FUNCTION] + [
+    f"SELECT heroic_partition_by_month('{table}', {MONTHS_AHEAD});" for table in PARTITIONED_TABLES
+] + ['DROP FUNCTION heroic_partition_by_month(text, integer);'])
+
+UNPARTITION_SQL = '\n'.join([UNPARTITION_TABLE_FUNCTION] + [
+    f"SELECT heroic_unpartition('{table}');" for table in PARTITIONED_TABLES
+] + ['DROP FUNCTION heroic_unpartition(text);', 'DROP FUNCTION heroic_create_month_partition(regclass, date);'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('heroic_api', '0014_history_composite_and_brin_indexes'),
+    ]
+
+    operations = [
+        # A foreign key can only reference a partitioned table through a unique constraint including the
+        # partition key, so the current status is kept consistent by Telescope.update_current_status alone
+        migrations.AlterField(
+            model_name='telescope',
+            name='current_status',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, help_text='The latest status of this telescope, kept up to date whenever a status is saved or deleted', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='heroic_api.telescopestatus'),
+        ),
+        migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.gis.db import models as gis_models
+from django.contrib.postgres.indexes import BrinIndex
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
@@ -115,6 +116,12 @@ class Telescope(models.Model):
         help_text=_('Link to page with telescope information')
     )
     site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name="telescopes")
+    # Not a database constraint, since statuses are partitioned by date (see heroic_api.partitions)
+    current_status = models.ForeignKey(
+        'TelescopeStatus', null=True, blank=True, editable=False, on_delete=models.SET_NULL, related_name='+',
+        db_constraint=False,
+        help_text=_('The latest status of this telescope, kept up to date whenever a status is saved or deleted')
+    )
     created = models.DateTimeField(auto_now_add=True, help_text='When this model was created')
     modified = models.DateTimeField(auto_now=True, help_text='When this model was last modified')
 
@@ -125,6 +132,16 @@ class Telescope(models.Model):
     def observatory(self):
         return self.site.observatory
 
+    @classmethod
+    def update_current_status(cls, telescope_id):
+        """Point a telescope's current_status at its latest status"""
+        with transaction.atomic():
+            # Lock the telescope first, so concurrent writers of statuses see each other's statuses here
+            if not list(cls.objects.select_for_update().filter(pk=telescope_id).values_list('pk', flat=True)):
+                return
+            latest_status = TelescopeStatus.objects.filter(telescope_id=telescope_id).order_by('-date', '-id').first()
+            cls.objects.filter(pk=telescope_id).update(current_status=latest_status)
+
 
 class Instrument(models.Model):
     id = models.CharField(max_length=255, primary_key=True, verbose_name='Instrument ID')
@@ -138,6 +155,10 @@ class Instrument(models.Model):
     )
     footprint = gis_models.PolygonField(help_text='Footprint of the CCD of the instrument, in relative coordinates (centered on 0,0)', srid=4326, null=True, blank=True)
     telescope = models.ForeignKey(Telescope, on_delete=models.CASCADE, related_name="instruments")
+    current_capability = models.ForeignKey(
+        'InstrumentCapability', null=True, blank=True, editable=False, on_delete=models.SET_NULL, related_name='+',
+        help_text=_('The latest capability of this instrument, kept up to date whenever a capability is saved or deleted')
+    )
     created = models.DateTimeField(auto_now_add=True, help_text='When this model was created')
     modified = models.DateTimeField(auto_now=True, help_text='When this model was last modified')
 
@@ -148,12 +169,30 @@ class Instrument(models.Model):
     def observatory(self):
         return self.telescope.observatory
 
+    @classmethod
+    def update_current_capability(cls, instrument_id):
+        """Point an instrument's current_capability at its latest capability"""
+        with transaction.atomic():
+            # Lock the instrument first, so concurrent writers of capabilities see each other's capabilities here
+            if not list(cls.objects.select_for_update().filter(pk=instrument_id).values_list('pk', flat=True)):
+                return
+            latest_capability = InstrumentCapability.objects.filter(
+                instrument_id=instrument_id
+            ).order_by('-date', '-id').first()
+            cls.objects.filter(pk=instrument_id).update(current_capability=latest_capability)
+
 class TelescopeStatus(models.Model):
 
     class Meta:
         verbose_name_plural = 'Telescope Statuses'
         get_latest_by = 'date'
         ordering = ['-date']
+        indexes = [
+            # The latest statuses of a telescope, for the current status and snapshots (DISTINCT ON telescope)
+            models.Index(fields=['telescope', '-date', '-id'], name='ts_telescope_date_idx'),
+            # Date ranges across every telescope. Rows are appended in date order, so this stays tiny.
+            BrinIndex(fields=['date'], name='ts_date_brin', autosummarize=True),
+        ]
 
     class StatusChoices(models.TextChoices):
         AVAILABLE = 'AVAILABLE', _('Available')
@@ -194,6 +233,10 @@ class TelescopePointing(models.Model):
                 name='tp_planned_idx',
                 condition=Q(planned=True)
             ),
+            # A telescope's or instrument's pointings in date order
+            models.Index(fields=['telescope', '-date'], name='tp_telescope_date_idx'),
+            models.Index(fields=['instrument', '-date'], name='tp_instrument_date_idx'),
+            BrinIndex(fields=['date'], name='tp_date_brin', autosummarize=True),
         ]
 
     date = models.DateTimeField(db_index=True)
@@ -225,6 +268,11 @@ class InstrumentCapability(models.Model):
         verbose_name_plural = 'Instrument Capabilities'
         get_latest_by = 'date'
         ordering = ['-date']
+        indexes = [
+            # The latest capabilities of an instrument, for the current capability and snapshots
+            models.Index(fields=['instrument', '-date', '-id'], name='ic_instrument_date_idx'),
+            BrinIndex(fields=['date'], name='ic_date_brin', autosummarize=True),
+        ]
 
     class InstrumentStatus(models.TextChoices):
         AVAILABLE = 'AVAILABLE', _('Available')
@@ -325,6 +373,45 @@ class PlannedInstrumentCapability(models.Model):
         return self.instrument.observatory
 
 
+class ChangeEvent(models.Model):
+    """ Append-only log of mutations to statuses, capabilities and pointings, read by the changes feed.
+        The autoincrementing id is the feed's cursor.
+    """
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['telescope', 'id'], name='ce_telescope_id_idx'),
+        ]
+
+    class ObjectTypes(models.TextChoices):
+        TELESCOPE_STATUS = 'TELESCOPE_STATUS', _('Telescope Status')
+        PLANNED_TELESCOPE_STATUS = 'PLANNED_TELESCOPE_STATUS', _('Planned Telescope Status')
+        INSTRUMENT_CAPABILITY = 'INSTRUMENT_CAPABILITY', _('Instrument Capability')
+        PLANNED_INSTRUMENT_CAPABILITY = 'PLANNED_INSTRUMENT_CAPABILITY', _('Planned Instrument Capability')
+        TELESCOPE_POINTING = 'TELESCOPE_POINTING', _('Telescope Pointing')
+
+    class Actions(models.TextChoices):
+        CREATED = 'CREATED', _('Created')
+        UPDATED = 'UPDATED', _('Updated')
+        DELETED = 'DELETED', _('Deleted')
+
+    id = models.BigAutoField(primary_key=True)
+    object_type = models.CharField(max_length=40, choices=ObjectTypes.choices, help_text=_('Type of the changed object'))
+    object_id = models.BigIntegerField(help_text=_('ID of the changed object'))
+    action = models.CharField(max_length=10, choices=Actions.choices, help_text=_('What happened to the object'))
+    telescope = models.CharField(
+        max_length=191, blank=True, default='',
+        help_text=_('ID of the telescope the changed object belongs to. Not a foreign key so events outlive telescopes.')
+    )
+    data = models.JSONField(
+        blank=True, default=dict, help_text=_('Representation of the object after the change, empty for deletions')
+    )
+    created = models.DateTimeField(auto_now_add=True, db_index=True, help_text='When this change happened')
+
+    def __str__(self):
+        return f"{self.object_type} {self.object_id} {self.action} at {self.created}"
+
+
 class TargetTypes(models.TextChoices):
     ICRS = 'ICRS', _('ICRS')
     MPC_MINOR_PLANET = 'MPC_MINOR_PLANET', _('MPC Minor Planet')
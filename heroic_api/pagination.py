@@ -0,0 +1,49 @@
+"""heroic_api/pagination.py
+
+Cursor pagination of the status, capability and pointing histories
+
+Pages are found by seeking to the date of the last row of the previous page, so reading deep into a
+history costs the same as reading its first page, unlike a large offset which scans every row before it.
+Rows with the same date are ordered by id and skipped by an offset among just those rows.
+"""
+from django.conf import settings
+from rest_framework import status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class HistoryCursorPagination(CursorPagination):
+    """Pages of a time series, newest first"""
+    ordering = ('-date', '-id')
+    page_size = settings.HISTORY_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = settings.HISTORY_MAX_PAGE_SIZE
+
+
+class PlannedCursorPagination(HistoryCursorPagination):
+    """Pages of planned statuses or capabilities, in order of their start"""
+    ordering = ('start', 'id')
+
+
+class PointingCursorPagination(HistoryCursorPagination):
+    """Pages of telescope pointings, newest first unless ordering=date asks for oldest first"""
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('ordering') == 'date':
+            return ('date', 'id')
+        return self.ordering
+
+
+def history_response(request, view, queryset, serializer_class, pagination_class) -> Response:
+    """ A page of the history returned by a telescope or instrument history action (e.g. /telescopes/<id>/status/)
+
+        The body is a list, as it was before these actions were paginated, and the links to the next and
+        previous pages are given in a Link header.
+    """
+    paginator = pagination_class()
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    response = Response(serializer_class(page, many=True).data, status=status.HTTP_200_OK)
+    links = [f'<{url}>; rel="{rel}"' for rel, url in (('next', paginator.get_next_link()),
+                                                       ('prev', paginator.get_previous_link())) if url]
+    if links:
+        response['Link'] = ', '.join(links)
+    return response
@@ -0,0 +1,127 @@
+"""heroic_api/partitions.py
+
+Monthly partitions of the telescope status and pointing histories, and their retention
+
+Both tables are declaratively partitioned by range of date, one partition per calendar month (UTC) named
+<table>_pYYYY_MM, plus a <table>_default partition that catches rows outside every monthly partition (see
+migration 0015). Queries filtered on date only scan the partitions they overlap.
+
+maintain_partitions() runs daily: it creates the partitions of the next PARTITION_MONTHS_AHEAD months, so
+new rows never land in the default partition, and removes the partitions older than the retention of their
+table. Removed partitions are detached and kept as standalone tables, which can be archived (e.g. with
+pg_dump -t) and dropped, or dropped right away if PARTITION_RETENTION_ACTION is 'drop'. Statuses are only
+removed up to the month of the oldest current status of a telescope, so no telescope loses its status.
+"""
+from datetime import date
+import logging
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from heroic_api.models import Telescope, TelescopeStatus, TelescopePointing
+from heroic_api.response_cache import bump_telescope_data_version
+
+logger = logging.getLogger(__name__)
+
+# model: name of the setting with its retention in months
+PARTITIONED_MODELS = {
+    TelescopeStatus: 'TELESCOPE_STATUS_RETENTION_MONTHS',
+    TelescopePointing: 'TELESCOPE_POINTING_RETENTION_MONTHS',
+}
+
+PARTITION_NAME_PATTERN = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def add_months(month: date, months: int) -> date:
+    """The first day of the month the given number of months after (or before) the month"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_month_partition(model, month: date) -> bool:
+    """ Create the partition of the model's table for the month containing the date, returning whether it
+        was created. Rows of that month in the default partition are moved into it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT heroic_create_month_partition(%s::regclass, %s)', [model._meta.db_table, month])
+        return cursor.fetchone()[0]
+
+
+def get_month_partitions(model) -> dict:
+    """ The monthly partitions attached to the model's table, as {first day of the month: partition name}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = %s::regclass', [model._meta.db_table]
+        )
+        partitions = {}
+        for (name,) in cursor.fetchall():
+            match = PARTITION_NAME_PATTERN.search(name)
+            if match:
+                partitions[date(int(match[1]), int(match[2]), 1)] = name
+        return partitions
+
+
+def ensure_partitions() -> list:
+    """ Create any missing partitions from the current month to PARTITION_MONTHS_AHEAD months ahead,
+        returning the names of the tables they were created for and their months
+    """
+    this_month = timezone.now().date().replace(day=1)
+    created = []
+    for model in PARTITIONED_MODELS:
+        for months in range(settings.PARTITION_MONTHS_AHEAD + 1):
+            month = add_months(this_month, months)
+            if create_month_partition(model, month):
+                created.append(f'{model._meta.db_table} {month:%Y-%m}')
+    return created
+
+
+def retention_cutoff(model) -> date:
+    """ The first month of the model's table to keep, or None if every month is kept
+    """
+    retention_months = getattr(settings, PARTITIONED_MODELS[model])
+    if retention_months <= 0:
+        return None
+    cutoff = add_months(timezone.now().date().replace(day=1), -retention_months)
+    if model is TelescopeStatus:
+        oldest_current_status = Telescope.objects.aggregate(oldest=Min('current_status__date'))['oldest']
+        if oldest_current_status is not None:
+            cutoff = min(cutoff, oldest_current_status.date().replace(day=1))
+    return cutoff
+
+
+def apply_retention() -> list:
+    """ Detach, or drop, the partitions of each table older than its retention, returning their names
+    """
+    if settings.PARTITION_RETENTION_ACTION not in ('detach', 'drop'):
+        raise ValueError(f'Unknown PARTITION_RETENTION_ACTION {settings.PARTITION_RETENTION_ACTION}')
+    removed = []
+    for model in PARTITIONED_MODELS:
+        cutoff = retention_cutoff(model)
+        if cutoff is None:
+            continue
+        table = model._meta.db_table
+        for month, partition in sorted(get_month_partitions(model).items()):
+            if month >= cutoff:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'SELECT DISTINCT telescope_id FROM {connection.ops.quote_name(partition)}')
+                telescope_ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute(f'ALTER TABLE {connection.ops.quote_name(table)} '
+                               f'DETACH PARTITION {connection.ops.quote_name(partition)}')
+                if settings.PARTITION_RETENTION_ACTION == 'drop':
+                    cursor.execute(f'DROP TABLE {connection.ops.quote_name(partition)}')
+                for telescope_id in telescope_ids:
+                    transaction.on_commit(lambda telescope_id=telescope_id: bump_telescope_data_version(telescope_id))
+            removed.append(partition)
+    return removed
+
+
+def maintain_partitions() -> tuple:
+    """ Create the upcoming partitions and apply the retention, returning the created and removed partitions
+    """
+    return ensure_partitions(), apply_retention()
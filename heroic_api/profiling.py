@@ -0,0 +1,102 @@
+"""heroic_api/profiling.py
+
+Opt-in per-request profiling of the hot paths (see ServerTimingMiddleware)
+
+While a request is profiled, time spent inside span() blocks and @profiled functions is summed per span
+name, and the count and total duration of database queries are recorded. Every span is also observed in
+the heroic_hot_path_duration_seconds Prometheus histogram (see heroic_api.metrics), whether or not the
+request is being profiled.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import time
+
+from django.db import connection
+
+from heroic_api.metrics import observe_span
+
+_current_profile = ContextVar('heroic_request_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.span_ms = defaultdict(float)
+        self.span_counts = defaultdict(int)
+        self.db_queries = 0
+        self.db_ms = 0.0
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000.0
+
+    def record_span(self, name: str, duration_ms: float):
+        self.span_ms[name] += duration_ms
+        self.span_counts[name] += 1
+
+    def record_query(self, execute, sql, params, many, context):
+        """Database execute wrapper, see django.db.connection.execute_wrapper"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_ms += (time.perf_counter() - start) * 1000.0
+
+    def server_timing(self) -> str:
+        """Value of the Server-Timing header for this profile"""
+        metrics = [f'{name};dur={duration:.1f};desc="{self.span_counts[name]} calls"'
+                   for name, duration in self.span_ms.items()]
+        metrics.append(f'db;dur={self.db_ms:.1f};desc="{self.db_queries} queries"')
+        metrics.append(f'total;dur={self.total_ms():.1f}')
+        return ', '.join(metrics)
+
+    def influxdb_fields(self) -> dict:
+        """Fields for the InfluxDB request point"""
+        fields = {f'span_{name}_ms': round(duration, 3) for name, duration in self.span_ms.items()}
+        fields['db_queries'] = self.db_queries
+        fields['db_ms'] = round(self.db_ms, 3)
+        return fields
+
+
+def get_current_profile():
+    """Return the profile of the request being handled, or None if it isn't being profiled"""
+    return _current_profile.get()
+
+
+@contextmanager
+def profile_request():
+    """Profile everything in this block, including database queries"""
+    profile = RequestProfile()
+    token = _current_profile.set(profile)
+    try:
+        with connection.execute_wrapper(profile.record_query):
+            yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """Add the time spent in this block to the named span of the current request's profile and metrics"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        observe_span(name, duration)
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.record_span(name, duration * 1000.0)
+
+
+def profiled(name: str):
+    """Decorator adding the time spent in the function to the named span"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
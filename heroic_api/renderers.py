@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+
+import msgpack
+import numpy as np
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from heroic_api.profiling import span
+
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class ProfiledJSONRenderer(JSONRenderer):
+    """JSONRenderer that records its rendering time in the 'render' span of profiled requests"""
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONRenderer(ProfiledJSONRenderer):
+    """ProfiledJSONRenderer that renders with orjson, for the list endpoints of large histories.
+
+    Its output parses to the same data as the JSONRenderer's. The bytes are the same too, except for floats whose
+    repr uses an exponent, which orjson writes in its own way (e.g. 1e-7 rather than 1e-07).
+    Types orjson doesn't know are encoded by the JSONRenderer's encoder, and anything orjson can't encode at all,
+    or an indented render for the browsable API, falls back to the JSONRenderer.
+    NaN and infinite floats are written as null, where the JSONRenderer raises an error for them. Checking every
+    float first would cost the speed this renderer is for.
+    """
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is not None and not self.get_indent(accepted_media_type, renderer_context or {}):
+            try:
+                with span('render'):
+                    ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+            except orjson.JSONEncodeError:
+                pass
+            else:
+                # Escape the line and paragraph separators, like the JSONRenderer does
+                return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Accepts any media type, for views that return their own (streaming) HttpResponse, like the exports.
+    Errors are rendered as JSON."""
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """ Renders MessagePack, for views whose responses are large numeric arrays. Negotiated with an
+        Accept: application/msgpack header or a format=msgpack query parameter, JSON is still the default.
+
+        Successful responses are first passed through the view's compact_response(data), if it has one,
+        which replaces the numeric arrays in them with packed_array()s.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        view = renderer_context.get('view')
+        response = renderer_context.get('response')
+        with span('render'):
+            if hasattr(view, 'compact_response') and response is not None and response.status_code < 400:
+                data = view.compact_response(data)
+            return msgpack.packb(data, default=JSONEncoder().default)
+
+
+# Renderers of compact encodings to add after the default renderers of views that support them
+COMPACT_RENDERER_CLASSES = (MessagePackRenderer,)
+
+
+def packed_array(values, dtype: str) -> dict:
+    """ A 1D array of numbers as {'dtype': numpy dtype string, 'data': raw bytes}, read back with
+        numpy.frombuffer(packed['data'], dtype=packed['dtype'])
+    """
+    return {'dtype': dtype, 'data': np.asarray(values, dtype=dtype).tobytes()}
+
+
+def packed_times(times) -> dict:
+    """ ISO 8601 times, or datetimes, as a packed_array of int64 milliseconds since the Unix epoch. Times
+        without a timezone are UTC.
+    """
+    milliseconds = []
+    for time in times:
+        if isinstance(time, str):
+            time = datetime.fromisoformat(time)
+        if time.tzinfo is None:
+            time = time.replace(tzinfo=timezone.utc)
+        milliseconds.append((time - UNIX_EPOCH) // timedelta(milliseconds=1))
+    return packed_array(milliseconds, '<i8')
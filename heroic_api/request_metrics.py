@@ -0,0 +1,103 @@
+"""heroic_api/request_metrics.py
+
+In-process buffering of request-metric points for the InfluxDBRequestLogger middleware
+
+Points are buffered per process and flushed as a single write_request_metrics dramatiq message when
+INFLUXDB_BATCH_SIZE points are waiting, or every INFLUXDB_FLUSH_INTERVAL_SECONDS, whichever comes first.
+Flushing happens on a background thread, so requests only ever append to the buffer. The buffer holds at
+most INFLUXDB_MAX_BUFFERED_POINTS; if the broker is unreachable the oldest points are dropped rather than
+growing memory without bound.
+"""
+import atexit
+from collections import deque
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricBuffer:
+    def __init__(self, flush_func, batch_size: int, flush_interval: float, max_points: int):
+        """
+        Parameters:
+            flush_func: called with each batch (a list of points) when flushing
+            batch_size: most points per batch, and the number of waiting points that triggers a flush
+            flush_interval: seconds between flushes of whatever points are waiting
+            max_points: most points buffered, beyond which the oldest are dropped
+        """
+        self.flush_func = flush_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._points = deque(maxlen=max_points)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher_pid = None
+
+    def __len__(self):
+        return len(self._points)
+
+    def add(self, point: dict):
+        self._ensure_flusher()
+        with self._lock:
+            if len(self._points) == self._points.maxlen:
+                self.dropped += 1
+            self._points.append(point)
+            if len(self._points) >= self.batch_size:
+                self._wakeup.set()
+
+    def _take_batch(self) -> list:
+        with self._lock:
+            return [self._points.popleft() for _ in range(min(self.batch_size, len(self._points)))]
+
+    def flush(self):
+        """Flush every waiting point, in batches of at most batch_size"""
+        batch = self._take_batch()
+        while batch:
+            try:
+                self.flush_func(batch)
+            except Exception:
+                self.dropped += len(batch)
+                logger.exception(f'Failed to flush {len(batch)} request metrics, dropping them.')
+            batch = self._take_batch()
+
+    def _ensure_flusher(self):
+        # Threads don't survive a fork, so each process (e.g. gunicorn worker) starts its own flusher
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._run_flusher, name='request-metric-flusher', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _run_flusher(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def _send_batch(points: list):
+    from heroic_api.tasks import write_request_metrics
+    write_request_metrics.send(points)
+
+
+def get_request_metric_buffer() -> RequestMetricBuffer:
+    """Return this process's request-metric buffer, which flushes to the write_request_metrics actor"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = RequestMetricBuffer(
+                _send_batch, settings.INFLUXDB_BATCH_SIZE, settings.INFLUXDB_FLUSH_INTERVAL_SECONDS,
+                settings.INFLUXDB_MAX_BUFFERED_POINTS
+            )
+        return _buffer
@@ -0,0 +1,139 @@
+"""heroic_api/response_cache.py
+
+Memoization of the visibility computations, keyed on the validated query plus telescope data versions
+
+Each telescope has a data version counter, which is bumped (by heroic_api.signals) whenever the telescope,
+its site or instruments, or any of its statuses, capabilities or planned statuses are written. Cached
+results are keyed on the canonicalized query and the current data versions of the telescopes in it, so a
+write only invalidates the results involving the affected telescopes. A global data version is bumped
+along with them, for responses covering every telescope (see heroic_api.etags). Results also expire after
+VISIBILITY_CACHE_TIMEOUT, since which statuses count as past or planned depends on the current time.
+
+Computations are also single-flight: when identical queries arrive concurrently on any worker or node,
+one of them takes a redis lock and computes the result while the others wait for it to be cached. Results
+too large to cache, even with the larger VISIBILITY_CACHE_MAX_ENTRY_SIZE, are marked as uncached instead,
+so identical queries compute them right away rather than queueing behind each other's locks.
+"""
+from datetime import datetime
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+
+from heroic_api.cache import HeroicCache
+
+logger = logging.getLogger(__name__)
+
+visibility_cache = HeroicCache('visibility', timeout=settings.VISIBILITY_CACHE_TIMEOUT,
+                               max_entry_size=settings.VISIBILITY_CACHE_MAX_ENTRY_SIZE)
+
+
+# Bumped along with every telescope's data version, for responses that cover all telescopes
+GLOBAL_DATA_VERSION_KEY = 'data_version:__all__'
+
+
+def _data_version_key(telescope_id: str) -> str:
+    return f'data_version:{telescope_id}'
+
+
+def _bump_version(key: str):
+    backend = caches['default']
+    # Version counters have no timeout, so they are never evicted before the results keyed on them
+    if not backend.add(key, 1, timeout=None):
+        try:
+            backend.incr(key)
+        except ValueError:
+            backend.add(key, 1, timeout=None)
+
+
+def get_telescope_data_versions(telescope_ids: list) -> list:
+    """Return the current data version of each telescope, in the same order"""
+    keys = [_data_version_key(telescope_id) for telescope_id in telescope_ids]
+    versions = caches['default'].get_many(keys)
+    return [versions.get(key, 0) for key in keys]
+
+
+def get_global_data_version() -> int:
+    return caches['default'].get(GLOBAL_DATA_VERSION_KEY, 0)
+
+
+def bump_telescope_data_version(telescope_id: str):
+    """Invalidate cached results involving this telescope"""
+    _bump_version(_data_version_key(telescope_id))
+    _bump_version(GLOBAL_DATA_VERSION_KEY)
+
+
+def _canonical_value(value):
+    if isinstance(value, models.Model):
+        return value.pk
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Cannot canonicalize {type(value)} for a cache key')
+
+
+def query_cache_key(name: str, data: dict) -> str:
+    """ Build the cache key for validated query data, including the data versions of its telescopes
+
+        The telescopes are sorted, since the serializers default to an unordered list of every telescope.
+    """
+    telescope_ids = sorted(telescope.pk for telescope in data.get('telescopes', []))
+    if 'telescopes' in data:
+        data = {**data, 'telescopes': telescope_ids}
+    canonical = json.dumps(
+        [data, get_telescope_data_versions(telescope_ids)],
+        sort_keys=True, separators=(',', ':'), default=_canonical_value
+    )
+    return f'{name}:{hashlib.sha256(canonical.encode()).hexdigest()}'
+
+
+def single_flight(cache: HeroicCache, key: str, compute):
+    """ Return the cached result for key, computing and caching it with compute() on a miss
+
+        Only one caller at a time computes the result for a key. Others wait up to SINGLE_FLIGHT_WAIT_TIMEOUT
+        for it to appear in the cache, and compute it themselves if it doesn't (e.g. because the computation
+        failed). Exceptions raised by compute() are not cached. Results too large for the cache are marked
+        as uncached for the cache's timeout, and callers compute those without taking the lock or waiting.
+    """
+    sentinel = object()
+    result = cache.get(key, sentinel)
+    if result is not sentinel:
+        return result
+    uncached_key = f'{key}:uncached'
+    if cache.peek(uncached_key):
+        return compute()
+
+    lock_key = f'{key}:lock'
+    lock_token = uuid.uuid4().hex
+    if cache.add(lock_key, lock_token, timeout=settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        try:
+            result = compute()
+            if not cache.set(key, result):
+                cache.set(uncached_key, True)
+            return result
+        finally:
+            # The lock may have timed out and been taken by another caller, whose lock must be left alone
+            cache.delete_if_equal(lock_key, lock_token)
+
+    # Poll with peek(), since the get() above already counted this call as a miss
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+        result = cache.peek(key, sentinel)
+        if result is not sentinel:
+            return result
+        if cache.peek(lock_key) is None:
+            # The computation finished without caching a result (it failed, or was too large to cache)
+            break
+    logger.info(f'Computing {key} without waiting any longer on a concurrent computation')
+    return compute()
+
+
+def cached_result(name: str, data: dict, compute):
+    """Return the cached result of compute() for this validated query data, computing it on a miss.
+    Concurrent identical queries share a single computation."""
+    return single_flight(visibility_cache, query_cache_key(name, data), compute)
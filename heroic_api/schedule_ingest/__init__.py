@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def get_schedule_source_configs(active_only: bool = True) -> list:
+    """Return the configured schedule sources from settings.SCHEDULE_INGEST_SOURCES"""
+    return [
+        config for config in settings.SCHEDULE_INGEST_SOURCES
+        if config.get('ACTIVE', True) or not active_only
+    ]
+
+
+def get_schedule_source(name: str):
+    """Instantiate the schedule source adapter configured with the given name"""
+    for config in settings.SCHEDULE_INGEST_SOURCES:
+        if config['NAME'] == name:
+            source_class = import_string(config['CLASS'])
+            return source_class(
+                name=config['NAME'],
+                telescope_id=config['TELESCOPE'],
+                instrument_id=config['INSTRUMENT'],
+                options=config.get('OPTIONS', {})
+            )
+    raise KeyError(f'No schedule source named {name} is configured in SCHEDULE_INGEST_SOURCES')
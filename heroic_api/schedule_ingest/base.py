@@ -0,0 +1,65 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from heroic_api.http_client import ResilientSession, get_session
+
+
+class ScheduleVisits:
+    """ Columnar set of visits parsed from an observatory schedule
+
+        All arrays have one entry per visit. Dates are numpy datetime64 UTC times, positions and field
+        radii are in decimal degrees, and performed is True for visits that have already been observed.
+    """
+    def __init__(self, dates, targets, ras, decs, radii, performed, extras=None):
+        self.dates = np.asarray(dates, dtype='datetime64[us]')
+        self.targets = list(targets)
+        self.ras = np.asarray(ras, dtype=np.float64)
+        self.decs = np.asarray(decs, dtype=np.float64)
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.performed = np.asarray(performed, dtype=bool)
+        self.extras = list(extras) if extras is not None else [{} for _ in self.targets]
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, index):
+        """Slice the visits, e.g. to process them in batches"""
+        return ScheduleVisits(
+            self.dates[index], self.targets[index], self.ras[index], self.decs[index], self.radii[index],
+            self.performed[index], self.extras[index]
+        )
+
+
+class ScheduleSource(ABC):
+    """ Base class for an observatory schedule source
+
+        Subclasses implement fetch(), which retrieves the raw schedule, and parse(), which turns it into
+        ScheduleVisits. Everything after that (diffing against the database, bulk writes and stats) is
+        handled by heroic_api.schedule_ingest.pipeline.ingest_schedule.
+    """
+    # Default number of Telescope Pointings written per bulk insert or update statement
+    batch_size = 500
+
+    def __init__(self, name: str, telescope_id: str, instrument_id: str, options: dict = None):
+        self.name = name
+        self.telescope_id = telescope_id
+        self.instrument_id = instrument_id
+        self.options = options or {}
+        self.batch_size = self.options.get('BATCH_SIZE', self.batch_size)
+
+    @property
+    def session(self) -> ResilientSession:
+        """Pooled HTTP session for this source, reused between polls on the same worker thread.
+        The TIMEOUT and RETRIES options override the default HTTP_CLIENT_TIMEOUT and HTTP_CLIENT_RETRIES."""
+        return get_session(
+            f'schedule_{self.name}', timeout=self.options.get('TIMEOUT'), retries=self.options.get('RETRIES')
+        )
+
+    @abstractmethod
+    def fetch(self):
+        """Retrieve the raw schedule from the observatory"""
+
+    @abstractmethod
+    def parse(self, raw) -> ScheduleVisits:
+        """Parse the raw schedule returned by fetch() into ScheduleVisits"""
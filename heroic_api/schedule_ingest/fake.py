@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from heroic_api.schedule_ingest.base import ScheduleSource, ScheduleVisits
+
+
+class FakeScheduleSource(ScheduleSource):
+    """ Local schedule source which generates a random schedule, for testing and load testing the
+        ingest pipeline without an observatory.
+
+        Visits are spaced evenly from PAST_MINUTES before now, with the ones in the past marked performed.
+        Options:
+            NUM_VISITS: number of visits in each generated schedule
+            PAST_MINUTES: how far in the past the schedule starts
+            INTERVAL_SECONDS: time between visits
+            FOV: field of view diameter in degrees
+            CHANGED_FRACTION: fraction of visits given a new random position on each fetch, to simulate
+                              churn between polls of a real schedule
+            SEED: random seed, so repeated fetches generate the same base schedule
+            START: unix timestamp of the first visit. By default the schedule starts PAST_MINUTES ago,
+                   aligned to INTERVAL_SECONDS so repeated fetches line up with each other
+    """
+    def fetch(self):
+        num_visits = self.options.get('NUM_VISITS', 1000)
+        interval = self.options.get('INTERVAL_SECONDS', 60)
+        rng = np.random.default_rng(self.options.get('SEED', 0))
+        now = int(datetime.now(timezone.utc).timestamp())
+        start = self.options.get('START')
+        if start is None:
+            start = (now - self.options.get('PAST_MINUTES', 15) * 60) // interval * interval
+        dates = (np.arange(num_visits, dtype=np.int64) * interval + start) * 1000000
+        ras = rng.uniform(0.0, 360.0, num_visits)
+        decs = np.degrees(np.arcsin(rng.uniform(-1.0, 0.5, num_visits)))
+
+        changed = np.random.default_rng().random(num_visits) < self.options.get('CHANGED_FRACTION', 0.0)
+        ras[changed] = np.random.default_rng().uniform(0.0, 360.0, changed.sum())
+        return {
+            'dates': dates.astype('datetime64[us]'),
+            'ras': ras,
+            'decs': decs,
+            'performed': dates < now * 1000000
+        }
+
+    def parse(self, raw) -> ScheduleVisits:
+        num_visits = len(raw['dates'])
+        return ScheduleVisits(
+            dates=raw['dates'],
+            targets=[f'fake_field_{index}' for index in range(num_visits)],
+            ras=raw['ras'],
+            decs=raw['decs'],
+            radii=np.full(num_visits, self.options.get('FOV', 3.5) / 2.0),
+            performed=raw['performed'],
+            extras=[{'exposure_time': 30.0} for _ in range(num_visits)]
+        )
@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta, timezone
+import logging
+import time
+
+from django.contrib.gis.geos import Point
+
+from heroic_api.changes import record_changes, record_deletions, suppress_change_events
+from heroic_api.footprints import circular_fields
+from heroic_api.metrics import observe_ingest_lag, observe_schedule_ingest
+from heroic_api.models import ChangeEvent, TelescopePointing, Telescope, Instrument
+from heroic_api.schedule_ingest.base import ScheduleSource, ScheduleVisits
+from heroic_api.time_conversions import datetime64_to_datetimes
+
+logger = logging.getLogger(__name__)
+
+
+def ingest_schedule(source: ScheduleSource) -> dict:
+    """ Fetch, parse and store the schedule of a schedule source
+
+        Performed visits are upserted and the planned pointings of the source's telescope and instrument
+        are synced with the planned visits of the new schedule.
+    Returns:
+        dict of stats about the ingest: visit counts, rows written and timings in seconds
+    """
+    try:
+        telescope = Telescope.objects.get(id=source.telescope_id)
+    except Telescope.DoesNotExist:
+        logger.error(f"Cannot poll {source.name} schedule: telescope {source.telescope_id} is not defined")
+        return {}
+    try:
+        instrument = Instrument.objects.get(id=source.instrument_id)
+    except Instrument.DoesNotExist:
+        logger.error(f"Cannot poll {source.name} schedule: instrument {source.instrument_id} is not defined")
+        return {}
+
+    stats = {'source': source.name}
+    start = time.perf_counter()
+    raw = source.fetch()
+    stats['fetch_time'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    visits = source.parse(raw)
+    performed_pointings, planned_pointings = build_pointings(telescope, instrument, visits, source.batch_size)
+    stats['visits'] = len(visits)
+    stats['parse_time'] = time.perf_counter() - start
+
+    # First update existing Telescope Pointings which were planned but have now actually occurred,
+    # and then sync the set of planned future pointings with the new schedule. The change events of
+    # these bulk writes are recorded in bulk too.
+    start = time.perf_counter()
+    with suppress_change_events():
+        stats['performed'] = upsert_performed_pointings(telescope, instrument, performed_pointings, source.batch_size)
+        stats['planned'] = sync_planned_pointings(telescope, instrument, planned_pointings, source.batch_size)
+    stats['write_time'] = time.perf_counter() - start
+    observe_schedule_ingest(stats)
+    if performed_pointings:
+        # How far behind the telescope the schedule source is: the age of its latest performed visit
+        observe_ingest_lag(source.name, max(date for date, _ in performed_pointings.keys()))
+
+    logger.info(f"Ingested {stats['visits']} visits from the {source.name} schedule: "
+                f"performed {stats['performed']}, planned {stats['planned']}, fetch {stats['fetch_time']:.2f}s, "
+                f"parse {stats['parse_time']:.2f}s, write {stats['write_time']:.2f}s")
+    return stats
+
+
+def build_pointings(telescope: Telescope, instrument: Instrument, visits: ScheduleVisits, batch_size: int):
+    """ Build unsaved Telescope Pointings from schedule visits
+
+        Visits are processed in batches so the intermediate arrays stay small for large schedules.
+    Returns:
+        (performed, planned) dicts of (date, target) to unsaved TelescopePointing. Planned visits that
+        are more than a minute in the past are dropped.
+    """
+    planned_cutoff = datetime.now(timezone.utc) - timedelta(minutes=1)
+    performed_pointings = {}
+    planned_pointings = {}
+    for batch_start in range(0, len(visits), batch_size):
+        batch = visits[batch_start:batch_start + batch_size]
+        dates = datetime64_to_datetimes(batch.dates)
+        fields = circular_fields(batch.ras, batch.decs, batch.radii)
+        for index, (date, target, field) in enumerate(zip(dates, batch.targets, fields)):
+            performed = bool(batch.performed[index])
+            if not performed and date <= planned_cutoff:
+                continue
+            pointing = TelescopePointing(
+                date=date,
+                instrument=instrument,
+                telescope=telescope,
+                target=target,
+                planned=not performed,
+                coordinate=Point(float(batch.ras[index]), float(batch.decs[index]), srid=4326),
+                field=field,
+                extra=batch.extras[index]
+            )
+            if performed:
+                performed_pointings[(date, target)] = pointing
+            else:
+                planned_pointings[(date, target)] = pointing
+    return performed_pointings, planned_pointings
+
+
+def _pointing_changed(existing: TelescopePointing, pointing: TelescopePointing) -> bool:
+    return (existing.planned != pointing.planned or existing.extra != pointing.extra or
+            existing.coordinate.coords != pointing.coordinate.coords or existing.field != pointing.field)
+
+
+def _diff_pointings(existing_by_key: dict, pointings: dict):
+    to_create = []
+    to_update = []
+    for key, pointing in pointings.items():
+        existing = existing_by_key.get(key)
+        if existing is None:
+            to_create.append(pointing)
+        elif _pointing_changed(existing, pointing):
+            pointing.pk = existing.pk
+            to_update.append(pointing)
+    return to_create, to_update
+
+
+def upsert_performed_pointings(telescope: Telescope, instrument: Instrument, pointings: dict,
+                               batch_size: int) -> dict:
+    """ Create or update the performed Telescope Pointings in bulk
+
+        Existing pointings in the time range of the performed pointings are loaded once and diffed in memory
+        by their (date, target) key, so only new or changed pointings are written.
+    Parameters:
+        pointings: dict of (date, target) to unsaved TelescopePointing
+    Returns:
+        dict of the number of pointings created and updated
+    """
+    if not pointings:
+        return {'created': 0, 'updated': 0}
+    dates = [date for date, _ in pointings.keys()]
+    existing_pointings = TelescopePointing.objects.filter(
+        telescope=telescope, instrument=instrument, date__gte=min(dates), date__lte=max(dates)
+    ).only('id', 'date', 'target', 'planned', 'coordinate', 'field', 'extra')
+    existing_by_key = {(existing.date, existing.target): existing for existing in existing_pointings}
+    to_create, to_update = _diff_pointings(existing_by_key, pointings)
+
+    TelescopePointing.objects.bulk_update(to_update, ['planned', 'coordinate', 'field', 'extra'], batch_size=batch_size)
+    TelescopePointing.objects.bulk_create(to_create, batch_size=batch_size)
+    record_changes(ChangeEvent.Actions.UPDATED, to_update)
+    record_changes(ChangeEvent.Actions.CREATED, to_create)
+    return {'created': len(to_create), 'updated': len(to_update)}
+
+
+def sync_planned_pointings(telescope: Telescope, instrument: Instrument, pointings: dict,
+                           batch_size: int) -> dict:
+    """ Sync the planned Telescope Pointings with a newly fetched schedule
+
+        Planned pointings no longer in the schedule are deleted, new ones are created, and ones whose
+        details changed are updated. Pointings that are unchanged between schedules are left alone.
+    Parameters:
+        pointings: dict of (date, target) to unsaved planned TelescopePointing
+    Returns:
+        dict of the number of pointings created, updated and deleted
+    """
+    existing_pointings = TelescopePointing.objects.filter(
+        telescope=telescope, instrument=instrument, planned=True
+    ).only('id', 'date', 'target', 'planned', 'coordinate', 'field', 'extra')
+
+    to_delete = []
+    existing_by_key = {}
+    for existing in existing_pointings:
+        key = (existing.date, existing.target)
+        if key in pointings and key not in existing_by_key:
+            existing_by_key[key] = existing
+        else:
+            to_delete.append(existing.pk)
+    to_create, to_update = _diff_pointings(existing_by_key, pointings)
+
+    num_deleted = 0
+    for batch_start in range(0, len(to_delete), batch_size):
+        num_deleted += TelescopePointing.objects.filter(
+            pk__in=to_delete[batch_start:batch_start + batch_size]
+        ).delete()[0]
+    TelescopePointing.objects.bulk_update(to_update, ['coordinate', 'field', 'extra'], batch_size=batch_size)
+    TelescopePointing.objects.bulk_create(to_create, batch_size=batch_size)
+    record_deletions(TelescopePointing, to_delete, telescope.id)
+    record_changes(ChangeEvent.Actions.UPDATED, to_update)
+    record_changes(ChangeEvent.Actions.CREATED, to_create)
+    return {'created': len(to_create), 'updated': len(to_update), 'deleted': num_deleted}
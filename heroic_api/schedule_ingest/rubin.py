@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+import logging
+
+from heroic_api.schedule_ingest.base import ScheduleSource, ScheduleVisits
+from heroic_api.time_conversions import mjd_to_datetime64
+
+logger = logging.getLogger(__name__)
+
+
+class RubinScheduleSource(ScheduleSource):
+    """ Schedule source for the Rubin obsloctap service
+
+        Options:
+            URL: the obsloctap schedule endpoint
+            TIMEOUT: (connect, read) timeout in seconds. The service fails and hangs alot
+            PAST_MINUTES: how far back to request performed visits
+            HOURS: how many hours of schedule to request
+    """
+    def fetch(self):
+        # Get the schedule from 15 minutes in the past until 25 hours later by default
+        start = datetime.now() - timedelta(minutes=self.options.get('PAST_MINUTES', 15))
+        logger.info(f'Getting the Rubin schedule starting at {start.strftime("%Y-%m-%d %H:%M:%S")}')
+        params = {
+            'time': str(self.options.get('HOURS', 25)),
+            'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'RESPONSEFORMAT': 'json',
+            'columns': 't_planning,target_name,s_ra,s_dec,s_fov,t_min,t_exptime,execution_status'
+        }
+        response = self.session.get(self.options['URL'], params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def parse(self, raw) -> ScheduleVisits:
+        return ScheduleVisits(
+            dates=mjd_to_datetime64([visit['t_min'] for visit in raw]),
+            targets=[visit['target_name'] for visit in raw],
+            ras=[visit['s_ra'] for visit in raw],
+            decs=[visit['s_dec'] for visit in raw],
+            radii=[visit['s_fov'] / 2.0 for visit in raw],
+            performed=[visit['execution_status'] == 'Performed' for visit in raw],
+            extras=[{'exposure_time': visit['t_exptime']} for visit in raw]
+        )
@@ -1,12 +1,105 @@
+from functools import cached_property
+
+from django.conf import settings
+from django.db.models import FloatField, Func
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.contrib.gis.db.models.functions import Translate
 from drf_spectacular.utils import extend_schema_serializer, OpenApiExample
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from heroic_api.visibility import telescope_dark_intervals
 from heroic_api.models import (Observatory, Site, Telescope, Instrument, TelescopeStatus, TelescopePointing,
                                InstrumentCapability, Profile, TargetTypes, PlannedTelescopeStatus,
-                               PlannedInstrumentCapability)
+                               PlannedInstrumentCapability, ChangeEvent)
+
+
+class FieldSelection:
+    """ The fields of a nested response selected by the fields, omit and expand query parameters
+
+        Each parameter is a comma separated list of field paths, with nested fields separated by dots,
+        e.g. fields=id,sites.telescopes.status. fields keeps only the listed fields at each level they go
+        below, omit drops the listed fields, and expand expands only the listed nested objects (and the
+        objects above them). Nested objects that are not expanded are returned as a list of their ids,
+        and expensive computed fields that are not expanded are left out. Without expand everything is
+        expanded, as before these parameters existed.
+    """
+    def __init__(self, fields: str = None, omit: str = None, expand: str = None):
+        self.fields = self._parse(fields)
+        self.omit = self._parse(omit) or set()
+        self.expand = self._parse(expand)
+
+    @staticmethod
+    def _parse(value):
+        if value is None:
+            return None
+        return {tuple(path.strip().split('.')) for path in value.split(',') if path.strip()}
+
+    @classmethod
+    def from_request(cls, request):
+        # Only responses to reads are trimmed, so writes still validate and return every field
+        if request is None or request.method not in SAFE_METHODS:
+            return cls()
+        params = request.query_params
+        return cls(params.get('fields'), params.get('omit'), params.get('expand'))
+
+    def includes(self, path: tuple, name: str) -> bool:
+        """Whether the field name of the object at path is selected"""
+        if path + (name,) in self.omit:
+            return False
+        if self.fields is None:
+            return True
+        below_path = [field for field in self.fields if len(field) > len(path) and field[:len(path)] == path]
+        return not below_path or any(field[len(path)] == name for field in below_path)
+
+    def expands(self, path: tuple, name: str) -> bool:
+        """Whether the expandable field name of the object at path is expanded"""
+        if self.expand is None:
+            return True
+        expanded = path + (name,)
+        return any(field[:len(expanded)] == expanded for field in self.expand)
+
+
+class FieldSelectionSerializerMixin:
+    """ Applies the FieldSelection of the request to a serializer and the serializers nested in it.
+        Fields that aren't selected are removed before serializing, so nothing is queried or computed for them.
+    """
+    # Nested serializers and expensive computed fields, which are only included when expanded
+    expandable_fields = ()
+
+    @property
+    def field_selection(self) -> FieldSelection:
+        # The context is shared by the nested serializers, so the query parameters are only parsed once
+        if 'field_selection' not in self.context:
+            self.context['field_selection'] = FieldSelection.from_request(self.context.get('request'))
+        return self.context['field_selection']
+
+    @property
+    def field_path(self) -> tuple:
+        names = []
+        node = self
+        while node is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return tuple(reversed(names))
+
+    def field_requested(self, name: str) -> bool:
+        return self.field_selection.includes(self.field_path, name)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.field_selection
+        path = self.field_path
+        for name in list(fields):
+            if not selection.includes(path, name):
+                del fields[name]
+            elif name in self.expandable_fields and not selection.expands(path, name):
+                if isinstance(fields[name], serializers.ListSerializer):
+                    fields[name] = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+                else:
+                    del fields[name]
+        return fields
 
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -148,7 +241,62 @@ class PlannedInstrumentCapabilitySerializer(serializers.ModelSerializer):
         return validated_data
 
 
-class InstrumentSerializer(serializers.ModelSerializer):
+class PointX(Func):
+    function = 'ST_X'
+    output_field = FloatField()
+
+
+class PointY(Func):
+    function = 'ST_Y'
+    output_field = FloatField()
+
+
+class ValuesSerializer:
+    """ A fast, read only representation of a queryset read with values(), for listing large histories
+
+        Each row has the same keys, in the same order, with the same values, as serializer_class's
+        representation of the model instance would, without building the instance or its fields. The
+        serializer's readable fields are read as they are, expressions are computed in SQL and added
+        after them, and to_representation converts whatever else needs converting in each row.
+    """
+    serializer_class = None
+    expressions = {}
+
+    @cached_property
+    def fields(self) -> list:
+        return [name for name, field in self.serializer_class().fields.items() if not field.write_only]
+
+    def values(self, queryset):
+        return queryset.values(*self.fields, **self.expressions)
+
+    def to_representation(self, row: dict) -> dict:
+        return row
+
+    def many(self, rows) -> list:
+        return [self.to_representation(row) for row in rows]
+
+
+class TelescopeStatusValuesSerializer(ValuesSerializer):
+    serializer_class = TelescopeStatusSerializer
+
+
+class InstrumentCapabilityValuesSerializer(ValuesSerializer):
+    serializer_class = InstrumentCapabilitySerializer
+
+
+class TelescopePointingValuesSerializer(ValuesSerializer):
+    serializer_class = TelescopePointingSerializer
+    # TelescopePointingSerializer.to_representation adds these after the other fields
+    expressions = {'ra': PointX('coordinate'), 'dec': PointY('coordinate')}
+
+    def to_representation(self, row: dict) -> dict:
+        # The field is represented as EWKT, by GEOS, like ModelField does
+        if row['field'] is not None:
+            row['field'] = row['field'].ewkt
+        return row
+
+
+class InstrumentSerializer(FieldSelectionSerializerMixin, serializers.ModelSerializer):
     optical_element_groups = serializers.JSONField(write_only=True, required=False, default=dict)
     operation_modes = serializers.JSONField(write_only=True, required=False, default=dict)
     status = serializers.ChoiceField(choices=InstrumentCapability.InstrumentStatus.choices,
@@ -156,7 +304,7 @@ class InstrumentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Instrument
-        fields = '__all__'
+        exclude = ('current_capability',)
 
     def validate(self, data):
         validated_data = super().validate(data)
@@ -171,17 +319,21 @@ class InstrumentSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super().to_representation(instance)
         # Add in the current instrument capability into the response
-        try:
-            current_capability = instance.capabilities.latest()
-            data['last_capability_update'] = current_capability.date
-            data['status'] = current_capability.status
-            data['optical_element_groups'] = current_capability.optical_element_groups
-            data['operation_modes'] = current_capability.operation_modes
-        except InstrumentCapability.DoesNotExist:
-            data['optical_element_groups'] = {}
-            data['operation_modes'] = {}
-            data['status'] = InstrumentCapability.InstrumentStatus.UNAVAILABLE
-            pass
+        current_capability = instance.current_capability
+        if current_capability:
+            current = {
+                'last_capability_update': current_capability.date,
+                'status': current_capability.status,
+                'optical_element_groups': current_capability.optical_element_groups,
+                'operation_modes': current_capability.operation_modes
+            }
+        else:
+            current = {
+                'optical_element_groups': {},
+                'operation_modes': {},
+                'status': InstrumentCapability.InstrumentStatus.UNAVAILABLE
+            }
+        data.update({key: value for key, value in current.items() if self.field_requested(key)})
         return data
 
     def create(self, validated_data):
@@ -202,17 +354,18 @@ class InstrumentSerializer(serializers.ModelSerializer):
         return instance
 
 
-class TelescopeSerializer(serializers.ModelSerializer):
+class TelescopeSerializer(FieldSelectionSerializerMixin, serializers.ModelSerializer):
     instruments = InstrumentSerializer(many=True, required=False)
     extra = serializers.JSONField(write_only=True, required=False, default=dict)
     status = serializers.ChoiceField(choices=TelescopeStatus.StatusChoices.choices,
                                      write_only=True, required=False)
     reason = serializers.CharField(write_only=True, required=False)
     next_twilight = serializers.SerializerMethodField(read_only=True, required=False)
+    expandable_fields = ('instruments', 'next_twilight')
 
     class Meta:
         model = Telescope
-        fields = '__all__'
+        exclude = ('current_status',)
 
     def get_next_twilight(self, obj):
         ''' This returns an array of either one or two twilights, depending on if we are currently within
@@ -241,19 +394,16 @@ class TelescopeSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super().to_representation(instance)
         # Add in the current telescope status into the response
-        try:
-            current_status = instance.statuses.latest()
-            data['status'] = current_status.status
-            data['last_status_update'] = current_status.date
+        current_status = instance.current_status
+        if current_status:
+            current = {'status': current_status.status, 'last_status_update': current_status.date}
             if current_status.reason:
-                data['reason'] = current_status.reason
+                current['reason'] = current_status.reason
             if current_status.extra:
-                data['extra'] = current_status.extra
-        except TelescopeStatus.DoesNotExist:
-            data['status'] = TelescopeStatus.StatusChoices.UNAVAILABLE
-            data['reason'] = ''
-            data['extra'] = {}
-            pass
+                current['extra'] = current_status.extra
+        else:
+            current = {'status': TelescopeStatus.StatusChoices.UNAVAILABLE, 'reason': '', 'extra': {}}
+        data.update({key: value for key, value in current.items() if self.field_requested(key)})
         return data
 
     def create(self, validated_data):
@@ -274,8 +424,10 @@ class TelescopeSerializer(serializers.ModelSerializer):
         return instance
 
 
-class SiteSerializer(serializers.ModelSerializer):
+class SiteSerializer(FieldSelectionSerializerMixin, serializers.ModelSerializer):
     telescopes = TelescopeSerializer(many=True, required=False)
+    expandable_fields = ('telescopes',)
+
     class Meta:
         model = Site
         fields = '__all__'
@@ -291,8 +443,10 @@ class SiteSerializer(serializers.ModelSerializer):
         return validated_data
 
 
-class ObservatorySerializer(serializers.ModelSerializer):
+class ObservatorySerializer(FieldSelectionSerializerMixin, serializers.ModelSerializer):
     sites = SiteSerializer(many=True, required=False)
+    expandable_fields = ('sites',)
+
     class Meta:
         model = Observatory
         fields = '__all__'
@@ -641,3 +795,54 @@ class GWVisibilityResponseSerializer(serializers.Serializer):
     """Serializer for GW visibility response"""
     query_info = serializers.DictField()
     timeline = serializers.ListField(child=GWVisibilityTimePointSerializer())
+
+
+class ChangeFeedQuerySerializer(serializers.Serializer):
+    """ Serializer for queries of the change feed
+
+    Returns the changes after the cursor, or from the oldest change if no cursor is given
+    """
+    cursor = serializers.CharField(required=False, help_text='Cursor returned by the previous query of the feed')
+    limit = serializers.IntegerField(required=False, default=settings.CHANGE_FEED_DEFAULT_LIMIT, min_value=1,
+                                     max_value=settings.CHANGE_FEED_MAX_LIMIT,
+                                     help_text='Maximum number of changes to return')
+    telescope = serializers.ListField(child=serializers.CharField(), required=False,
+                                      help_text='Only return changes of these telescopes')
+    object_type = serializers.ListField(child=serializers.ChoiceField(choices=ChangeEvent.ObjectTypes.choices),
+                                        required=False, help_text='Only return changes of these types of object')
+
+    def validate_cursor(self, value):
+        from heroic_api.changes import decode_cursor
+        try:
+            return decode_cursor(value)
+        except ValueError:
+            raise serializers.ValidationError(_('Invalid cursor, use the cursor returned by the previous query'))
+
+
+class SnapshotQuerySerializer(serializers.Serializer):
+    """ Serializer for queries of the snapshot of every telescope's status and instrument's capability
+    """
+    time = serializers.DateTimeField(required=False, help_text='Time of the snapshot, defaults to now')
+    telescope = serializers.ListField(child=serializers.CharField(), required=False,
+                                      help_text='Only include these telescopes and their instruments')
+
+
+class SnapshotResponseSerializer(serializers.Serializer):
+    time = serializers.DateTimeField()
+    telescopes = serializers.DictField(child=TelescopeStatusSerializer(),
+                                       help_text='Latest status as of the time by telescope id')
+    instruments = serializers.DictField(child=InstrumentCapabilitySerializer(),
+                                        help_text='Latest capability as of the time by instrument id')
+
+
+class ChangeEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChangeEvent
+        fields = '__all__'
+
+
+class ChangeFeedResponseSerializer(serializers.Serializer):
+    """Serializer for change feed responses"""
+    results = ChangeEventSerializer(many=True)
+    cursor = serializers.CharField()
+    has_more = serializers.BooleanField()
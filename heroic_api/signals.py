@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from heroic_api.changes import change_events_suppressed, get_telescope_id, record_changes, record_deletions
+from heroic_api.models import (Site, Telescope, Instrument, TelescopeStatus, InstrumentCapability,
+                               PlannedTelescopeStatus, PlannedInstrumentCapability, TelescopePointing, ChangeEvent)
+from heroic_api.response_cache import bump_telescope_data_version
+
+
+def _bump_on_commit(telescope_ids):
+    def bump():
+        for telescope_id in telescope_ids:
+            bump_telescope_data_version(telescope_id)
+    # Bump now so reads later in this transaction miss the cache, and again on commit in case another
+    # request cached a result computed from the pre-commit data in between
+    bump()
+    transaction.on_commit(bump)
+
+
+@receiver([post_save, post_delete], sender=TelescopeStatus)
+def telescope_status_changed(sender, instance, **kwargs):
+    Telescope.update_current_status(instance.telescope_id)
+
+
+@receiver([post_save, post_delete], sender=InstrumentCapability)
+def instrument_capability_changed(sender, instance, **kwargs):
+    Instrument.update_current_capability(instance.instrument_id)
+
+
+@receiver([post_save, post_delete], sender=TelescopeStatus)
+@receiver([post_save, post_delete], sender=PlannedTelescopeStatus)
+@receiver([post_save, post_delete], sender=Instrument)
+def telescope_data_changed(sender, instance, **kwargs):
+    _bump_on_commit([instance.telescope_id])
+
+
+@receiver([post_save, post_delete], sender=InstrumentCapability)
+@receiver([post_save, post_delete], sender=PlannedInstrumentCapability)
+def instrument_data_changed(sender, instance, **kwargs):
+    telescope_id = Instrument.objects.filter(id=instance.instrument_id).values_list('telescope_id', flat=True).first()
+    if telescope_id:
+        _bump_on_commit([telescope_id])
+
+
+@receiver([post_save, post_delete], sender=Telescope)
+def telescope_changed(sender, instance, **kwargs):
+    _bump_on_commit([instance.id])
+
+
+@receiver(post_save, sender=Site)
+def site_changed(sender, instance, **kwargs):
+    _bump_on_commit(list(instance.telescopes.values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=TelescopeStatus)
+@receiver(post_save, sender=PlannedTelescopeStatus)
+@receiver(post_save, sender=InstrumentCapability)
+@receiver(post_save, sender=PlannedInstrumentCapability)
+@receiver(post_save, sender=TelescopePointing)
+def record_saved_change(sender, instance, created, **kwargs):
+    if not change_events_suppressed():
+        record_changes(ChangeEvent.Actions.CREATED if created else ChangeEvent.Actions.UPDATED, [instance])
+
+
+@receiver(post_delete, sender=TelescopeStatus)
+@receiver(post_delete, sender=PlannedTelescopeStatus)
+@receiver(post_delete, sender=InstrumentCapability)
+@receiver(post_delete, sender=PlannedInstrumentCapability)
+@receiver(post_delete, sender=TelescopePointing)
+def record_deleted_change(sender, instance, **kwargs):
+    if not change_events_suppressed():
+        record_deletions(sender, [instance.pk], get_telescope_id(instance))
@@ -0,0 +1,62 @@
+"""heroic_api/snapshot.py
+
+Snapshot of the status of every telescope and the capability of every instrument at a point in time
+
+Each is found with a single query, which looks up the latest row id of every telescope or instrument with one
+probe of the (telescope, -date, -id) or (instrument, -date, -id) index each, rather than reading their histories.
+A DISTINCT ON query would read every row before the time instead, since PostgreSQL can't skip through an index.
+Snapshots of the current time are cached for SNAPSHOT_CACHE_TIMEOUT seconds, keyed on the global data version so
+any write is seen right away.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from heroic_api.cache import HeroicCache
+from heroic_api.models import Telescope, Instrument, TelescopeStatus, InstrumentCapability
+from heroic_api.response_cache import get_global_data_version, single_flight
+from heroic_api.serializers import TelescopeStatusSerializer, InstrumentCapabilitySerializer
+
+snapshot_cache = HeroicCache('snapshot', timeout=settings.SNAPSHOT_CACHE_TIMEOUT)
+
+
+def _latest_per(queryset, parents, field: str):
+    """The latest row of the queryset for each of the parents, which the field of the queryset's rows refers to"""
+    latest_ids = parents.annotate(latest_id=Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by('-date', '-id').values('id')[:1]
+    )).values('latest_id')
+    return queryset.filter(id__in=latest_ids).order_by(field)
+
+
+def compute_snapshot(time: datetime, telescopes: list = None) -> dict:
+    statuses = TelescopeStatus.objects.filter(date__lte=time)
+    capabilities = InstrumentCapability.objects.filter(date__lte=time)
+    telescope_queryset = Telescope.objects.all()
+    instrument_queryset = Instrument.objects.all()
+    if telescopes:
+        telescope_queryset = telescope_queryset.filter(id__in=telescopes)
+        instrument_queryset = instrument_queryset.filter(telescope_id__in=telescopes)
+    return {
+        'time': time,
+        'telescopes': {status['telescope']: status for status in TelescopeStatusSerializer(
+            _latest_per(statuses, telescope_queryset, 'telescope_id'), many=True
+        ).data},
+        'instruments': {capability['instrument']: capability for capability in InstrumentCapabilitySerializer(
+            _latest_per(capabilities, instrument_queryset, 'instrument_id'), many=True
+        ).data},
+    }
+
+
+def get_snapshot(time: datetime = None, telescopes: list = None) -> dict:
+    """ The latest status of each telescope and capability of each instrument as of the time, or now
+
+        Parameters:
+            time: time of the snapshot, defaults to now
+            telescopes: telescope ids to limit the snapshot to, defaults to every telescope
+    """
+    if time is not None:
+        return compute_snapshot(time, telescopes)
+    key = f"now:{get_global_data_version()}:{','.join(sorted(telescopes or []))}"
+    return single_flight(snapshot_cache, key, lambda: compute_snapshot(timezone.now(), telescopes))
@@ -1,25 +1,20 @@
 import dramatiq
 import logging
-import requests
 import threading
-from datetime import timedelta, timezone, datetime
 
-from django.contrib.gis.geos import Point
 from django.conf import settings
-from astropy.time import Time
+from django.contrib.auth.models import User
 from influxdb import InfluxDBClient
 
-from heroic_api.models import TelescopePointing, Telescope, Instrument
+from heroic_api import hopskotch
+from heroic_api.changes import prune_change_events
+from heroic_api.partitions import maintain_partitions as maintain_history_partitions
+from heroic_api.schedule_ingest import get_schedule_source
+from heroic_api.schedule_ingest.pipeline import ingest_schedule
 
 logger = logging.getLogger(__name__)
 
 
-RUBIN_TELESCOPE_ID='noirlab.cp.rubin'
-RUBIN_INSTRUMENT_ID='noirlab.cp.rubin.lsstcam'
-
-# Timeouts for the rubin schedule service. It fails and hangs alot
-RUBIN_REQUEST_TIMEOUT = (30, 120)
-
 # InfluxDB clients are lazy loaded and cached per worker thread.
 _influxdb_thread_local = threading.local()
 
@@ -34,17 +29,21 @@ def get_influxdb_client():
     _influxdb_thread_local.built = True
     _influxdb_thread_local.client = None
 
-    # The connection uses mTLS: the client cert/key authenticate us to the InfluxDB gateway.
-    # The gateway serves a publicly-trusted (AWS ACM) cert, so the server is verified against
-    # the system CA bundle (verify_ssl=True below).
-    cert_path = settings.INFLUXDB_CLIENT_CERT
-    key_path = settings.INFLUXDB_CLIENT_KEY
-    if not (cert_path and key_path):
-        logger.warning(
-            'InfluxDB mTLS client cert/key not configured '
-            '(INFLUXDB_CLIENT_CERT / INFLUXDB_CLIENT_KEY); request metrics will not be logged.'
-        )
-        return None
+    connection_options = {}
+    if settings.INFLUXDB_SSL:
+        # The connection uses mTLS: the client cert/key authenticate us to the InfluxDB gateway.
+        # The gateway serves a publicly-trusted (AWS ACM) cert, so the server is verified against
+        # the system CA bundle (verify_ssl=True below).
+        cert_path = settings.INFLUXDB_CLIENT_CERT
+        key_path = settings.INFLUXDB_CLIENT_KEY
+        if not (cert_path and key_path):
+            logger.warning(
+                'InfluxDB mTLS client cert/key not configured '
+                '(INFLUXDB_CLIENT_CERT / INFLUXDB_CLIENT_KEY); request metrics will not be logged.'
+            )
+            return None
+        connection_options = {'ssl': True, 'verify_ssl': True, 'cert': (cert_path, key_path)}
+    # Otherwise plain HTTP, e.g. to the stub InfluxDB in heroic_api/test/influxdb_stub.py for local development
 
     try:
         _influxdb_thread_local.client = InfluxDBClient(
@@ -53,10 +52,8 @@ def get_influxdb_client():
             username=settings.INFLUXDB_USERNAME or None,
             password=settings.INFLUXDB_PASSWORD or None,
             database=settings.INFLUXDB_DATABASE,
-            ssl=True,
-            verify_ssl=True,
-            cert=(cert_path, key_path),
             timeout=settings.INFLUXDB_TIMEOUT,
+            **connection_options
         )
     except Exception:
         logger.exception('Failed to construct InfluxDB client; request metrics will not be logged.')
@@ -66,75 +63,54 @@ def get_influxdb_client():
 
 @dramatiq.actor(max_retries=3, min_backoff=1000, max_backoff=30000, time_limit=60000)
 def write_request_metric(point):
-    """Write a single request-metric point (built by the InfluxDBRequestLogger middleware)
-    to InfluxDB. Runs on the dramatiq worker so the write stays out of the request path."""
+    """Kept for messages already enqueued before request metrics were batched"""
+    write_request_metrics.fn([point])
+
+
+# Retries, backoff and message age are bounded so a slow or unavailable InfluxDB can only delay a
+# batch by a few minutes before it is dropped, instead of the queue backing up indefinitely.
+@dramatiq.actor(max_retries=2, min_backoff=5000, max_backoff=30000, time_limit=60000,
+                max_age=settings.INFLUXDB_BATCH_MAX_AGE_SECONDS * 1000)
+def write_request_metrics(points):
+    """Write a batch of request-metric points (buffered from the InfluxDBRequestLogger middleware)
+    to InfluxDB in a single write. Runs on the dramatiq worker so the write stays out of the request path."""
     client = get_influxdb_client()
     if client is None:
         return
-    client.write_points([point])
+    client.write_points(points)
+
+
+@dramatiq.actor(max_retries=5, min_backoff=5000, max_backoff=300000, time_limit=360000)
+def poll_schedule_source(source_name):
+    """Fetch the schedule of a source configured in SCHEDULE_INGEST_SOURCES and sync its pointings"""
+    ingest_schedule(get_schedule_source(source_name))
 
 
 @dramatiq.actor(max_retries=5, min_backoff=5000, max_backoff=300000, time_limit=360000)
 def poll_rubin_schedule():
+    """Kept for messages already enqueued before schedule sources were configurable"""
+    ingest_schedule(get_schedule_source('rubin'))
+
+
+@dramatiq.actor(max_retries=0, time_limit=120000)
+def refresh_hop_credential_verification(user_id):
+    """Re-verify a users hop credential in the background before its cached verification expires"""
     try:
-        telescope = Telescope.objects.get(id=RUBIN_TELESCOPE_ID)
-    except Telescope.DoesNotExist:
-        logger.error(f"Cannot poll Rubin schedule: Rubin telescope {RUBIN_TELESCOPE_ID} is not defined")
-        return
-    try:
-        instrument = Instrument.objects.get(id=RUBIN_INSTRUMENT_ID)
-    except Instrument.DoesNotExist:
-        logger.error(f"Cannot poll Rubin schedule: Rubin instrument {RUBIN_INSTRUMENT_ID} is not defined")
+        user = User.objects.select_related('profile').get(id=user_id)
+    except User.DoesNotExist:
         return
-    
-    # Get the schedule from 15 minutes in the past until 25 hours later
-    start = datetime.now() - timedelta(minutes=15)
-    logger.info(f'Getting the Rubin schedule starting at {start.strftime("%Y-%m-%d %H:%M:%S")}')
-    params = {
-        'time': '25',
-        'start': start.strftime('%Y-%m-%d %H:%M:%S'),
-        'RESPONSEFORMAT': 'json',
-        'columns': 't_planning,target_name,s_ra,s_dec,s_fov,t_min,t_exptime,execution_status'
-    }
-    response = requests.get(settings.RUBIN_SCHEDULE_URL, params=params, timeout=RUBIN_REQUEST_TIMEOUT)
-    response.raise_for_status()
-
-    visits = response.json()
-    
-    # First go through the response and update existing Telescope Pointings which were planned
-    # but have now actually occurred
-    future_visits = []
-    for visit in visits:
-        date = Time(visit['t_min'], format='mjd').to_datetime(timezone=timezone.utc)
-        point = Point(visit['s_ra'], visit['s_dec'], srid=4326)
-        if visit['execution_status'] == 'Performed':
-            # Attempt to create or update existing Telescope Pointing for this now completed observation
-            TelescopePointing.objects.update_or_create(
-                date=date,
-                telescope=telescope,
-                instrument=instrument,
-                coordinate=point,
-                target=visit['target_name'],
-                defaults={'planned': False, 'field': point.buffer(visit['s_fov']/2.0), 'extra': {'exposure_time': visit['t_exptime']}}
-            )
-        elif date > (datetime.now(timezone.utc) - timedelta(minutes=1)):
-            # If this is in the future, i.e. a scheduled / planned visit, then collect them up to bulk add
-            future_visits.append(
-                TelescopePointing(
-                    date=date,
-                    instrument=instrument,
-                    telescope=telescope,
-                    target=visit['target_name'],
-                    planned=True,
-                    coordinate=point,
-                    field=point.buffer(visit['s_fov']/2.0),
-                    extra={'exposure_time': visit['t_exptime']}
-                )
-            )
-    # After we've updated any completed pointings in the system, we can delete all planned future pointings for
-    # Rubin and then add the new planned future pointings in bulk
-    num_deleted = TelescopePointing.objects.filter(telescope=telescope, instrument=instrument, planned=True).delete()
-    logger.info(f"Deleted {num_deleted[0]} old future Telescope Pointings from the Rubin previous schedule")
+    hopskotch.refresh_hop_credential(user)
+
+
+@dramatiq.actor(max_retries=3, time_limit=600000)
+def prune_change_feed():
+    """Delete change feed events older than the retention period"""
+    num_deleted = prune_change_events()
+    logger.info(f"Pruned {num_deleted} change feed events")
+
 
-    TelescopePointing.objects.bulk_create(future_visits, batch_size=100)
-    logger.info(f"Created {len(future_visits)} new future Telescope Pointings from the Rubin schedule")
+@dramatiq.actor(max_retries=3, time_limit=600000)
+def maintain_partitions():
+    """Create the upcoming monthly partitions of the status and pointing histories and apply their retention"""
+    created, removed = maintain_history_partitions()
+    logger.info(f"Created partitions {created} and removed partitions {removed} past their retention")
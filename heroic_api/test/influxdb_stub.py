@@ -0,0 +1,127 @@
+"""heroic_api/test/influxdb_stub.py
+
+A stand-in for an InfluxDB v1 server, for testing request metrics offline
+
+It answers /ping, /query and /write like InfluxDB does, and records the body of each write as a list of
+line protocol lines. Use it in tests as a context manager:
+
+    with StubInfluxDB() as influxdb:
+        client = InfluxDBClient(host=influxdb.host, port=influxdb.port, database='heroic')
+        ...
+        influxdb.writes  # [[line, ...], ...] one list per write request
+
+or run it for local development with INFLUXDB_ENABLED=true, INFLUXDB_SSL=false and INFLUXDB_PORT=8086:
+
+    python -m heroic_api.test.influxdb_stub --port 8086
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class _StubInfluxDBHandler(BaseHTTPRequestHandler):
+    def _respond(self, status: int, body: dict = None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/ping':
+            self._respond(204)
+        elif path == '/query':
+            self._respond(200, {'results': [{'statement_id': 0}]})
+        else:
+            self._respond(404, {'error': 'not found'})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if path == '/query':
+            self._respond(200, {'results': [{'statement_id': 0}]})
+            return
+        if path != '/write':
+            self._respond(404, {'error': 'not found'})
+            return
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if self.server.stub.delay:
+            time.sleep(self.server.stub.delay)
+        self.server.stub.record_write(body.decode().splitlines())
+        self._respond(204)
+
+    def log_message(self, format, *args):
+        if self.server.stub.verbose:
+            super().log_message(format, *args)
+
+
+class StubInfluxDB:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, delay: float = 0.0, verbose: bool = False):
+        """
+        Parameters:
+            port: port to listen on, or 0 to pick a free one
+            delay: seconds to wait before answering each write, to simulate a slow InfluxDB
+        """
+        self.delay = delay
+        self.verbose = verbose
+        self.writes = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _StubInfluxDBHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def points(self) -> list:
+        """Every line protocol line written so far"""
+        with self._lock:
+            return [line for write in self.writes for line in write]
+
+    def record_write(self, lines: list):
+        with self._lock:
+            self.writes.append(lines)
+        if self.verbose:
+            print(f'Write of {len(lines)} points')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a stub InfluxDB v1 server that logs the writes it receives')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8086)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to delay each write by')
+    args = parser.parse_args()
+    stub = StubInfluxDB(args.host, args.port, args.delay, verbose=True)
+    print(f'Stub InfluxDB listening on {stub.host}:{stub.port}')
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
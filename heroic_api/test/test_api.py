@@ -1,9 +1,25 @@
 from rest_framework.test import APITestCase
 from mixer.backend.django import mixer
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from django.test import SimpleTestCase, override_settings
 from datetime import timedelta
+from unittest.mock import patch
+import csv
+import io
+import json
+import pyarrow.parquet
+
+from rest_framework.renderers import JSONRenderer
+
+from heroic_api import export
+from heroic_api.renderers import FastJSONRenderer
+from heroic_api.serializers import TelescopeStatusSerializer, TelescopePointingSerializer, InstrumentCapabilitySerializer
 
 from heroic_api import models
 
@@ -282,6 +298,50 @@ class TestTelescopeStatus(APITestCase):
         self.assertEqual(response.json()['reason'], status['reason'])
         self.assertEqual(response.json()['extra'], status['extra'])
 
+    def test_status_history_is_paginated_by_cursor(self):
+        for days_ago in (1, 2, 3):
+            mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now() - timedelta(days=days_ago))
+        url = reverse('api:telescope-status', args=(self.telescope.id,))
+        response = self.client.get(url, {'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(response.json()[0]['id'], self.telescope_status.id)
+        next_url = response['Link'].split(';')[0].strip('<>')
+        response = self.client.get(next_url)
+        self.assertEqual(len(response.json()), 1)
+        self.assertNotIn('rel="next"', response['Link'])
+        # The list endpoint pages through the same history
+        response = self.client.get(reverse('api:telescopestatus-list'), {'telescope': self.telescope.id, 'limit': 2})
+        self.assertEqual(len(response.json()['results']), 2)
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNone(response.json()['next'])
+
+    def test_status_history_can_be_windowed(self):
+        old_status = mixer.blend(models.TelescopeStatus, telescope=self.telescope,
+                                 date=timezone.now() - timedelta(days=10))
+        mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now() - timedelta(days=20))
+        response = self.client.get(reverse('api:telescope-status', args=(self.telescope.id,)),
+                                   {'start': (timezone.now() - timedelta(days=5)).isoformat()})
+        # The status before the start of the window still applies at its start, so is included
+        self.assertEqual([status['id'] for status in response.json()], [self.telescope_status.id, old_status.id])
+
+    def test_current_status_is_the_latest_status(self):
+        older_status = mixer.blend(models.TelescopeStatus, telescope=self.telescope,
+                                   date=timezone.now() - timedelta(days=1), reason='Older')
+        self.telescope.refresh_from_db()
+        self.assertEqual(self.telescope.current_status, self.telescope_status)
+        # Deleting the current status falls back to the previous one
+        self.telescope_status.delete()
+        self.telescope.refresh_from_db()
+        self.assertEqual(self.telescope.current_status, older_status)
+        older_status.delete()
+        self.telescope.refresh_from_db()
+        self.assertIsNone(self.telescope.current_status)
+        response = self.client.get(reverse('api:telescope-detail', args=(self.telescope.id,)))
+        self.assertEqual(response.json()['status'], models.TelescopeStatus.StatusChoices.UNAVAILABLE)
+        self.assertNotIn('current_status', response.json())
+
     def test_create_telescope_status_in_past(self):
         # Now set a status on the telescope in the past
         status = {'telescope': self.telescope.id,
@@ -535,6 +595,15 @@ class TestInstrumentCapability(APITestCase):
                                                  operation_modes={'readout': {}}
                                                 )
 
+    def test_current_capability_is_the_latest_capability(self):
+        older_capability = mixer.blend(models.InstrumentCapability, instrument=self.instrument,
+                                       date=timezone.now() - timedelta(days=1))
+        self.instrument.refresh_from_db()
+        self.assertEqual(self.instrument.current_capability, self.instrument_capability)
+        self.instrument_capability.delete()
+        self.instrument.refresh_from_db()
+        self.assertEqual(self.instrument.current_capability, older_capability)
+
     def _create_instrument_capability(self, capability):
         response = self.client.post(reverse('api:instrumentcapability-list'), data=capability, format='json')
         self.assertEqual(response.status_code, 201)
@@ -789,3 +858,360 @@ class TestPlannedInstrumentCapability(APITestCase):
         self.assertEqual(len(response.json()), 1)
         self.assertEqual(response.json()[0]['start'], new_start.isoformat().replace("+00:00", "Z"))
         self.assertEqual(response.json()[0]['end'], new_end.isoformat().replace("+00:00", "Z"))
+
+
+class TestConditionalGet(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = mixer.blend(User, is_superuser=False)
+        self.client.force_login(self.user)
+        self.observatory = mixer.blend(models.Observatory, admin=self.user)
+        self.site = mixer.blend(models.Site, observatory=self.observatory)
+        self.telescope = mixer.blend(models.Telescope, site=self.site)
+        self.instrument = mixer.blend(models.Instrument, telescope=self.telescope)
+        mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+
+    def test_matching_etag_returns_not_modified(self):
+        url = reverse('api:telescope-detail', args=(self.telescope.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale", ' + etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_when_nested_data_changes(self):
+        urls = [reverse('api:observatory-list'), reverse('api:site-detail', args=(self.site.id,)),
+                reverse('api:telescope-list'), reverse('api:snapshot')]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        status = {'telescope': self.telescope.id, 'status': models.TelescopeStatus.StatusChoices.AVAILABLE,
+                  'reason': 'Back online'}
+        response = self.client.post(reverse('api:telescopestatus-list'), data=status, format='json')
+        self.assertEqual(response.status_code, 201)
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_ignores_data_of_other_telescopes(self):
+        other_site = mixer.blend(models.Site, observatory=mixer.blend(models.Observatory))
+        other_telescope = mixer.blend(models.Telescope, site=other_site)
+        urls = [reverse('api:observatory-detail', args=(self.observatory.id,)),
+                reverse('api:site-detail', args=(self.site.id,)),
+                reverse('api:telescope-detail', args=(self.telescope.id,)),
+                reverse('api:snapshot') + f'?telescope={self.telescope.id}']
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        mixer.blend(models.TelescopeStatus, telescope=other_telescope, date=timezone.now())
+        mixer.blend(models.Instrument, telescope=other_telescope)
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_etag_changes_when_a_status_is_edited_in_place(self):
+        status = models.TelescopeStatus.objects.get(telescope=self.telescope)
+        url = reverse('api:telescope-detail', args=(self.telescope.id,))
+        etag = self.client.get(url)['ETag']
+        status.reason = 'Edited'
+        status.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_histories_have_no_etag(self):
+        urls = [reverse('api:telescopestatus-list'), reverse('api:instrumentcapability-list'),
+                reverse('api:telescope-status', args=(self.telescope.id,)),
+                reverse('api:instrument-capabilities', args=(self.instrument.id,))]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotIn('ETag', response, url)
+
+    def test_etag_depends_on_media_type(self):
+        url = reverse('api:telescope-detail', args=(self.telescope.id,))
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertIn('Accept', response['Vary'])
+        html_response = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertNotEqual(html_response['ETag'], response['ETag'])
+        response = self.client.get(url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_filters(self):
+        url = reverse('api:telescope-list')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, {'site': self.site.id})['ETag'], etag)
+        response = self.client.get(url, {'site': self.site.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_anonymous_responses_are_publicly_cacheable(self):
+        url = reverse('api:instrument-detail', args=(self.instrument.id,))
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.client.logout()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.ETAG_MAX_AGE}', response['Cache-Control'])
+
+    def test_missing_objects_have_no_etag(self):
+        response = self.client.get(reverse('api:telescope-detail', args=('notATelescope',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class TestNestedQueryCount(APITestCase):
+    def _create_fleet(self, num_sites, telescopes_per_site):
+        observatory = mixer.blend(models.Observatory)
+        for site in mixer.cycle(num_sites).blend(models.Site, observatory=observatory):
+            for telescope in mixer.cycle(telescopes_per_site).blend(models.Telescope, site=site):
+                mixer.blend(models.TelescopeStatus, telescope=telescope, date=timezone.now())
+                instrument = mixer.blend(models.Instrument, telescope=telescope)
+                mixer.blend(models.InstrumentCapability, instrument=instrument, date=timezone.now())
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_the_fleet(self):
+        urls = [reverse('api:observatory-list'), reverse('api:site-list'),
+                reverse('api:telescope-list'), reverse('api:instrument-list')]
+        self._create_fleet(num_sites=1, telescopes_per_site=1)
+        small_fleet_counts = [self._count_queries(url) for url in urls]
+        self._create_fleet(num_sites=4, telescopes_per_site=25)
+        self.assertEqual(models.Telescope.objects.count(), 101)
+        for url, small_fleet_count in zip(urls, small_fleet_counts):
+            self.assertEqual(self._count_queries(url), small_fleet_count, url)
+            self.assertLessEqual(small_fleet_count, 8, url)
+
+
+class TestFieldSelection(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.observatory = mixer.blend(models.Observatory)
+        self.site = mixer.blend(models.Site, observatory=self.observatory)
+        self.telescope = mixer.blend(models.Telescope, site=self.site)
+        self.instrument = mixer.blend(models.Instrument, telescope=self.telescope)
+        mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now(), reason='Weather',
+                    status=models.TelescopeStatus.StatusChoices.AVAILABLE)
+
+    def test_fields_keeps_only_the_selected_fields(self):
+        response = self.client.get(reverse('api:observatory-list'), {'fields': 'id,sites.telescopes.status'})
+        self.assertEqual(response.status_code, 200)
+        observatory = response.json()['results'][0]
+        self.assertEqual(set(observatory.keys()), {'id', 'sites'})
+        self.assertEqual(set(observatory['sites'][0].keys()), {'telescopes'})
+        self.assertEqual(observatory['sites'][0]['telescopes'][0], {'status': models.TelescopeStatus.StatusChoices.AVAILABLE})
+
+    def test_omitted_fields_are_not_computed(self):
+        with patch('heroic_api.serializers.telescope_dark_intervals') as mock_dark_intervals:
+            response = self.client.get(reverse('api:telescope-detail', args=(self.telescope.id,)),
+                                       {'omit': 'next_twilight,reason'})
+        self.assertEqual(response.status_code, 200)
+        mock_dark_intervals.assert_not_called()
+        self.assertNotIn('next_twilight', response.json())
+        self.assertNotIn('reason', response.json())
+        self.assertEqual(response.json()['instruments'][0]['id'], self.instrument.id)
+
+    def test_unexpanded_nested_objects_are_ids(self):
+        with patch('heroic_api.serializers.telescope_dark_intervals') as mock_dark_intervals:
+            response = self.client.get(reverse('api:site-detail', args=(self.site.id,)), {'expand': 'telescopes'})
+        self.assertEqual(response.status_code, 200)
+        mock_dark_intervals.assert_not_called()
+        telescope = response.json()['telescopes'][0]
+        self.assertEqual(telescope['instruments'], [self.instrument.id])
+        self.assertNotIn('next_twilight', telescope)
+        self.assertEqual(telescope['reason'], 'Weather')
+        response = self.client.get(reverse('api:observatory-detail', args=(self.observatory.id,)), {'expand': ''})
+        self.assertEqual(response.json()['sites'], [self.site.id])
+
+    def test_writes_ignore_field_selection(self):
+        user = mixer.blend(User, is_superuser=True)
+        self.client.force_login(user)
+        response = self.client.post(reverse('api:observatory-list') + '?fields=id',
+                                    data={'id': 'newobs', 'name': 'New Observatory'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['name'], 'New Observatory')
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class TestExport(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.observatory = mixer.blend(models.Observatory, id='observatory')
+        self.site = mixer.blend(models.Site, observatory=self.observatory, id='observatory.site')
+        self.telescope = mixer.blend(models.Telescope, site=self.site, id='observatory.site.tel1')
+        self.other_telescope = mixer.blend(models.Telescope, site=self.site, id='observatory.site.tel2')
+        self.statuses = [
+            mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now() - timedelta(days=days_ago),
+                        reason='Reason, with "quotes"', extra={'days_ago': days_ago})
+            for days_ago in (5, 4, 3, 2, 1)
+        ]
+        mixer.blend(models.TelescopeStatus, telescope=self.other_telescope, date=timezone.now())
+
+    def get_export(self, basename, export_format, params=None):
+        response = self.client.get(reverse(f'api:{basename}-export', args=(export_format,)), params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], export.EXPORT_CONTENT_TYPES[export_format])
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_of_filtered_statuses(self):
+        content = self.get_export('telescopestatus', 'csv', {'telescope': self.telescope.id})
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual([int(row['id']) for row in rows], [status.id for status in self.statuses])
+        self.assertEqual(rows[0]['reason'], self.statuses[0].reason)
+        self.assertEqual(json.loads(rows[0]['extra']), {'days_ago': 5})
+        self.assertEqual(rows[0]['date'], self.statuses[0].date.isoformat().replace('+00:00', 'Z'))
+
+    def test_ndjson_export_of_statuses_in_a_time_window(self):
+        content = self.get_export('telescopestatus', 'ndjson', {
+            'telescope': self.telescope.id, 'end': (timezone.now() - timedelta(days=2, hours=12)).isoformat()
+        })
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [status.id for status in self.statuses[:3]])
+        self.assertEqual(rows[0]['extra'], {'days_ago': 5})
+        self.assertEqual(rows[0]['telescope'], self.telescope.id)
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get(reverse('api:telescopestatus-export', args=('csv',)), {'telescope': 'not.a.telescope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_parquet_export_of_statuses(self):
+        content = self.get_export('telescopestatus', 'parquet', {'telescope': self.telescope.id})
+        parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(content))
+        # Each chunk of rows is written as a row group
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        rows = parquet_file.read().to_pylist()
+        self.assertEqual([row['id'] for row in rows], [status.id for status in self.statuses])
+        self.assertEqual(rows[-1]['date'], self.statuses[-1].date)
+
+    def test_csv_export_of_pointings(self):
+        instrument = mixer.blend(models.Instrument, telescope=self.telescope, id='observatory.site.tel1.inst1')
+        pointing = models.TelescopePointing.objects.create(
+            telescope=self.telescope, instrument=instrument, date=timezone.now(), target='Target',
+            coordinate='SRID=4326;POINT (114.4 45.54)'
+        )
+        content = self.get_export('telescopepointing', 'csv', {'instrument': instrument.id})
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(int(rows[0]['id']), pointing.id)
+        self.assertEqual(float(rows[0]['ra']), 114.4)
+        self.assertEqual(float(rows[0]['dec']), 45.54)
+        self.assertEqual(rows[0]['instrument'], instrument.id)
+
+
+class TestFastJSONRenderer(SimpleTestCase):
+    def test_non_finite_floats_are_rendered_as_null(self):
+        data = {'ra': float('nan'), 'dec': float('inf'), 'fov': float('-inf')}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), {'ra': None, 'dec': None, 'fov': None})
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(data)
+
+
+class TestValuesList(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.observatory = mixer.blend(models.Observatory, id='observatory')
+        self.site = mixer.blend(models.Site, observatory=self.observatory, id='observatory.site')
+        self.telescope = mixer.blend(models.Telescope, site=self.site, id='observatory.site.tel1')
+        self.instrument = mixer.blend(models.Instrument, telescope=self.telescope, id='observatory.site.tel1.inst1')
+
+    def assert_list_matches_serializer(self, url, serializer_class, instances):
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        expected = {
+            'next': response.json()['next'],
+            'previous': response.json()['previous'],
+            'results': serializer_class(instances[:2], many=True).data
+        }
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_status_list_matches_serializer(self):
+        statuses = [mixer.blend(models.TelescopeStatus, telescope=self.telescope, reason='Reason \u2028 é',
+                                date=timezone.now() - timedelta(hours=hours), extra={'wind': 10.5, 'dome': None})
+                    for hours in (1, 2, 3)]
+        self.assert_list_matches_serializer(reverse('api:telescopestatus-list'), TelescopeStatusSerializer, statuses)
+
+    def test_capability_list_matches_serializer(self):
+        capabilities = [mixer.blend(models.InstrumentCapability, instrument=self.instrument,
+                                    date=timezone.now() - timedelta(hours=hours),
+                                    operation_modes={'readout': {'default': 'full'}})
+                        for hours in (1, 2, 3)]
+        self.assert_list_matches_serializer(reverse('api:instrumentcapability-list'), InstrumentCapabilitySerializer,
+                                            capabilities)
+
+    def test_pointing_list_matches_serializer(self):
+        pointings = [models.TelescopePointing.objects.create(
+            telescope=self.telescope, instrument=self.instrument, date=timezone.now() - timedelta(hours=hours),
+            target='Target', coordinate=f'SRID=4326;POINT ({10.25 * hours} -{5.5 * hours})',
+            field='SRID=4326;POLYGON ((10 10, 10.5 10, 10.5 10.5, 10 10.5, 10 10))' if hours % 2 else None,
+            extra={'exposure_time': 30.0}
+        ) for hours in (1, 2, 3)]
+        self.assert_list_matches_serializer(reverse('api:telescopepointing-list'), TelescopePointingSerializer,
+                                            pointings)
+
+    def test_pointing_list_only_orders_by_date(self):
+        pointings = [models.TelescopePointing.objects.create(
+            telescope=self.telescope, instrument=self.instrument, date=timezone.now() - timedelta(hours=hours),
+            target='Target', coordinate='SRID=4326;POINT (10 10)'
+        ) for hours in (1, 2, 3)]
+        url = reverse('api:telescopepointing-list')
+        response = self.client.get(url, {'ordering': 'date'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [p.id for p in reversed(pointings)])
+        response = self.client.get(url, {'ordering': '-date'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [p.id for p in pointings])
+        for ordering in ('telescope', '-instrument'):
+            response = self.client.get(url, {'ordering': ordering})
+            self.assertEqual(response.status_code, 400, ordering)
+
+
+class TestSnapshot(APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.observatory = mixer.blend(models.Observatory, id='observatory')
+        self.site = mixer.blend(models.Site, observatory=self.observatory, id='observatory.site')
+        self.telescope = mixer.blend(models.Telescope, site=self.site, id='observatory.site.tel1')
+        self.other_telescope = mixer.blend(models.Telescope, site=self.site, id='observatory.site.tel2')
+        self.instrument = mixer.blend(models.Instrument, telescope=self.telescope, id='observatory.site.tel1.inst1')
+        now = timezone.now()
+        self.old_status = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=now - timedelta(days=2))
+        self.status = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=now - timedelta(hours=1))
+        self.other_status = mixer.blend(models.TelescopeStatus, telescope=self.other_telescope,
+                                        date=now - timedelta(hours=2))
+        self.old_capability = mixer.blend(models.InstrumentCapability, instrument=self.instrument,
+                                          date=now - timedelta(days=3))
+        self.capability = mixer.blend(models.InstrumentCapability, instrument=self.instrument,
+                                      date=now - timedelta(minutes=5))
+
+    def test_snapshot_of_now_has_latest_statuses_and_capabilities(self):
+        response = self.client.get(reverse('api:snapshot'))
+        self.assertEqual(response.status_code, 200)
+        snapshot = response.json()
+        self.assertEqual(snapshot['telescopes'][self.telescope.id]['id'], self.status.id)
+        self.assertEqual(snapshot['telescopes'][self.other_telescope.id]['id'], self.other_status.id)
+        self.assertEqual(snapshot['instruments'][self.instrument.id]['id'], self.capability.id)
+
+    def test_snapshot_at_a_past_time(self):
+        response = self.client.get(reverse('api:snapshot'), {'time': (timezone.now() - timedelta(days=1)).isoformat()})
+        snapshot = response.json()
+        self.assertEqual(snapshot['telescopes'], {self.telescope.id: snapshot['telescopes'][self.telescope.id]})
+        self.assertEqual(snapshot['telescopes'][self.telescope.id]['id'], self.old_status.id)
+        self.assertEqual(snapshot['instruments'][self.instrument.id]['id'], self.old_capability.id)
+
+    def test_snapshot_filtered_by_telescope(self):
+        response = self.client.get(reverse('api:snapshot'), {'telescope': [self.other_telescope.id]})
+        snapshot = response.json()
+        self.assertEqual(list(snapshot['telescopes'].keys()), [self.other_telescope.id])
+        self.assertEqual(snapshot['instruments'], {})
+
+    def test_snapshot_of_now_is_cached_until_a_write(self):
+        self.client.get(reverse('api:snapshot'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('api:snapshot'))
+        new_status = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+        response = self.client.get(reverse('api:snapshot'))
+        self.assertEqual(response.json()['telescopes'][self.telescope.id]['id'], new_status.id)
@@ -0,0 +1,166 @@
+from django.test import SimpleTestCase, override_settings
+from django.core.cache import cache, caches
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+import pickle
+import threading
+import time
+
+from heroic_api.cache import HeroicCache
+from heroic_api.models import Telescope
+from heroic_api.response_cache import query_cache_key, single_flight
+
+
+@override_settings(HEROIC_CACHE_DEFAULT_TIMEOUT=60, HEROIC_CACHE_MAX_ENTRY_SIZE=1000)
+class TestHeroicCache(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        cache.clear()
+        self.cache = HeroicCache('test')
+
+    def test_set_and_get(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.set('key', {'value': [1, 2, 3]}))
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2, 3]})
+        self.assertEqual(self.cache.get_many(['key', 'missing']), {'key': {'value': [1, 2, 3]}})
+
+    def test_namespaces_are_separate(self):
+        other_cache = HeroicCache('other_test')
+        self.cache.set('key', 1)
+        other_cache.set('key', 2)
+        self.assertEqual(self.cache.get('key'), 1)
+        self.assertEqual(other_cache.get('key'), 2)
+
+    def test_invalidate_drops_all_entries_in_namespace(self):
+        other_cache = HeroicCache('other_test')
+        self.cache.set('key1', 1)
+        self.cache.set('key2', 2)
+        other_cache.set('key1', 3)
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get('key1'))
+        self.assertIsNone(self.cache.get('key2'))
+        self.assertEqual(other_cache.get('key1'), 3)
+        self.cache.set('key1', 4)
+        self.assertEqual(self.cache.get('key1'), 4)
+
+    def test_oversized_values_are_not_stored(self):
+        self.assertFalse(self.cache.set('big', 'x' * 2000))
+        self.assertIsNone(self.cache.get('big'))
+
+    def test_delete_if_equal_leaves_other_values_alone(self):
+        self.cache.set('lock', 'token1')
+        self.assertFalse(self.cache.delete_if_equal('lock', 'token2'))
+        self.assertEqual(self.cache.get('lock'), 'token1')
+        self.assertTrue(self.cache.delete_if_equal('lock', 'token1'))
+        self.assertIsNone(self.cache.get('lock'))
+
+    @override_settings(CACHES={'redis': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                         'LOCATION': 'redis://cache.test:6379/0'}})
+    def test_delete_if_equal_compares_and_deletes_in_one_redis_call(self):
+        redis_cache = HeroicCache('test', alias='redis')
+        backend = caches['redis']
+        client = MagicMock()
+        client.eval.return_value = 1
+        with patch.object(redis_cache, 'version', return_value=1), \
+                patch.object(backend._cache, 'get_client', return_value=client):
+            self.assertTrue(redis_cache.delete_if_equal('lock', 'token1'))
+        backend_key = backend.make_and_validate_key('test:1:lock')
+        stored_value = backend._cache._serializer.dumps(pickle.dumps('token1', pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(client.eval.call_args.args[1:], (1, backend_key, stored_value))
+
+    def test_peek_is_not_counted(self):
+        self.cache.set('key', 1)
+        with patch('heroic_api.cache.count_cache_operation') as mock_count:
+            self.assertEqual(self.cache.peek('key'), 1)
+            self.assertIsNone(self.cache.peek('missing'))
+        mock_count.assert_not_called()
+
+    def test_falsy_values_are_cached(self):
+        calls = []
+        for _ in range(2):
+            value = self.cache.get_or_set('falsy', lambda: calls.append(1) or None)
+        self.assertIsNone(value)
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(HEROIC_CACHE_DEFAULT_TIMEOUT=60, HEROIC_CACHE_MAX_ENTRY_SIZE=1000, SINGLE_FLIGHT_LOCK_TIMEOUT=10,
+                   SINGLE_FLIGHT_WAIT_TIMEOUT=5, SINGLE_FLIGHT_POLL_INTERVAL=0.01)
+class TestSingleFlight(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        cache.clear()
+        self.cache = HeroicCache('test_single_flight')
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def _slow_compute(self, result):
+        def compute():
+            with self.calls_lock:
+                self.calls += 1
+            time.sleep(0.2)
+            return result
+        return compute
+
+    def test_concurrent_identical_requests_share_one_computation(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(
+                lambda _: single_flight(self.cache, 'key', self._slow_compute({'value': 1})), range(8)
+            ))
+        self.assertEqual(results, [{'value': 1}] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_waiting_is_counted_as_a_single_miss(self):
+        with patch('heroic_api.cache.count_cache_operation') as mock_count:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                computing = executor.submit(single_flight, self.cache, 'key', self._slow_compute(1))
+                time.sleep(0.02)
+                waiting = executor.submit(single_flight, self.cache, 'key', self._slow_compute(1))
+                self.assertEqual([computing.result(), waiting.result()], [1, 1])
+        misses = [c for c in mock_count.call_args_list if c.args[1] == 'miss']
+        self.assertEqual(len(misses), 2)
+        self.assertEqual(self.calls, 1)
+
+    def test_distinct_requests_are_computed_separately(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(
+                lambda i: single_flight(self.cache, f'key{i % 2}', self._slow_compute(i % 2)), range(4)
+            ))
+        self.assertEqual(results, [0, 1, 0, 1])
+        self.assertEqual(self.calls, 2)
+
+    def test_waiters_compute_themselves_when_the_computation_fails(self):
+        def failing_compute():
+            time.sleep(0.1)
+            raise ValueError('failed')
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            failing = executor.submit(single_flight, self.cache, 'key', failing_compute)
+            time.sleep(0.02)
+            waiting = executor.submit(single_flight, self.cache, 'key', self._slow_compute(2))
+            with self.assertRaises(ValueError):
+                failing.result()
+            self.assertEqual(waiting.result(), 2)
+
+    def test_results_too_large_to_cache_are_not_waited_on(self):
+        big_result = 'x' * 2000
+        self.assertEqual(single_flight(self.cache, 'key', self._slow_compute(big_result)), big_result)
+        # Another computation of the key is in progress, but the result is known to be uncached so this
+        # computes it right away instead of waiting on the lock
+        self.cache.add('key:lock', 'other', timeout=10)
+        start = time.monotonic()
+        self.assertEqual(single_flight(self.cache, 'key', self._slow_compute(big_result)), big_result)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.calls, 2)
+
+
+class TestQueryCacheKey(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        cache.clear()
+
+    def test_key_does_not_depend_on_telescope_order(self):
+        telescopes = [Telescope(id='tst.site.tel1'), Telescope(id='tst.site.tel2')]
+        self.assertEqual(query_cache_key('test', {'telescopes': telescopes, 'ra': 1.0}),
+                         query_cache_key('test', {'telescopes': telescopes[::-1], 'ra': 1.0}))
+        self.assertNotEqual(query_cache_key('test', {'telescopes': telescopes, 'ra': 1.0}),
+                            query_cache_key('test', {'telescopes': telescopes[:1], 'ra': 1.0}))
@@ -0,0 +1,161 @@
+from rest_framework.test import APITestCase
+from mixer.backend.django import mixer
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch, MagicMock, AsyncMock
+import json
+
+from heroic_api import models
+from heroic_api.changes import encode_cursor, decode_cursor
+from heroic_api.event_stream import stream_change_events
+
+
+@override_settings(CHANGE_FEED_SAFETY_LAG_SECONDS=0)
+class TestChangeFeed(APITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = mixer.blend(User, is_superuser=False)
+        self.client.force_login(self.user)
+        self.observatory = mixer.blend(models.Observatory, admin=self.user)
+        self.site = mixer.blend(models.Site, observatory=self.observatory)
+        self.telescope = mixer.blend(models.Telescope, site=self.site)
+        self.telescope2 = mixer.blend(models.Telescope, site=self.site)
+        self.instrument = mixer.blend(models.Instrument, telescope=self.telescope)
+
+    def _get_changes(self, **params):
+        response = self.client.get(reverse('api:changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_feed_returns_mutations_after_cursor(self):
+        status = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+        capability = mixer.blend(models.InstrumentCapability, instrument=self.instrument, date=timezone.now())
+        changes = self._get_changes()
+        self.assertEqual([(change['object_type'], change['object_id'], change['action'], change['telescope'])
+                          for change in changes['results']], [
+            (models.ChangeEvent.ObjectTypes.TELESCOPE_STATUS, status.id, 'CREATED', self.telescope.id),
+            (models.ChangeEvent.ObjectTypes.INSTRUMENT_CAPABILITY, capability.id, 'CREATED', self.telescope.id)
+        ])
+        self.assertEqual(changes['results'][0]['data']['status'], status.status)
+        self.assertFalse(changes['has_more'])
+
+        # Nothing new since the cursor
+        cursor = changes['cursor']
+        self.assertEqual(self._get_changes(cursor=cursor)['results'], [])
+
+        status.reason = 'Updated'
+        status.save()
+        capability.delete()
+        changes = self._get_changes(cursor=cursor)
+        self.assertEqual([(change['object_id'], change['action']) for change in changes['results']],
+                         [(status.id, 'UPDATED'), (capability.id, 'DELETED')])
+        self.assertEqual(changes['results'][0]['data']['reason'], 'Updated')
+        self.assertEqual(changes['results'][1]['data'], {})
+
+    def test_feed_pages_with_limit(self):
+        statuses = [mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+                    for _ in range(5)]
+        changes = self._get_changes(limit=3)
+        self.assertTrue(changes['has_more'])
+        object_ids = [change['object_id'] for change in changes['results']]
+        changes = self._get_changes(limit=3, cursor=changes['cursor'])
+        self.assertFalse(changes['has_more'])
+        object_ids.extend(change['object_id'] for change in changes['results'])
+        self.assertEqual(object_ids, [status.id for status in statuses])
+
+    def test_feed_filters_by_telescope_and_type(self):
+        mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+        status2 = mixer.blend(models.TelescopeStatus, telescope=self.telescope2, date=timezone.now())
+        mixer.blend(models.PlannedTelescopeStatus, telescope=self.telescope2)
+        changes = self._get_changes(telescope=self.telescope2.id,
+                                    object_type=models.ChangeEvent.ObjectTypes.TELESCOPE_STATUS)
+        self.assertEqual([change['object_id'] for change in changes['results']], [status2.id])
+
+    def test_recent_changes_are_held_back(self):
+        mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+        with override_settings(CHANGE_FEED_SAFETY_LAG_SECONDS=60):
+            changes = self._get_changes()
+        self.assertEqual(changes['results'], [])
+        self.assertEqual(changes['cursor'], encode_cursor(0))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('api:changes'), {'cursor': 'notACursor'})
+        self.assertContains(response, 'Invalid cursor', status_code=400)
+
+
+@override_settings(EVENT_STREAM_REDIS_URL='redis://localhost:6379/0', CHANGE_FEED_SAFETY_LAG_SECONDS=0)
+class TestChangeEventStream(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.observatory = mixer.blend(models.Observatory)
+        self.site = mixer.blend(models.Site, observatory=self.observatory)
+        self.telescope = mixer.blend(models.Telescope, site=self.site)
+
+    def test_changes_are_published_on_commit(self):
+        with patch('heroic_api.event_stream._publish') as mock_publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                status = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+                mock_publish.assert_not_called()
+        messages = mock_publish.call_args[0][0]
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['object_id'], status.id)
+        self.assertEqual(messages[0]['telescope'], self.telescope.id)
+        self.assertEqual(decode_cursor(messages[0]['cursor']), messages[0]['id'])
+
+    def test_stream_replays_missed_changes_then_streams_live_ones(self):
+        missed = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+        live = {'id': 10 ** 9, 'cursor': encode_cursor(10 ** 9), 'object_type': 'TELESCOPE_STATUS',
+                'object_id': 1, 'action': 'CREATED', 'telescope': self.telescope.id, 'data': {}}
+        pubsub = MagicMock()
+        pubsub.subscribe = AsyncMock()
+        pubsub.aclose = AsyncMock()
+        pubsub.get_message = AsyncMock(side_effect=[None, {'data': json.dumps(live)}])
+        client = MagicMock(pubsub=MagicMock(return_value=pubsub), aclose=AsyncMock())
+
+        async def read_stream():
+            stream = stream_change_events(after_id=0, telescopes=[self.telescope.id])
+            chunks = [await stream.__anext__() for _ in range(4)]
+            await stream.aclose()
+            return chunks
+
+        with patch('heroic_api.event_stream.redis.asyncio.Redis.from_url', return_value=client):
+            chunks = async_to_sync(read_stream)()
+        self.assertTrue(chunks[0].startswith('retry:'))
+        self.assertIn(f'"object_id": {missed.id}', chunks[1])
+        self.assertEqual(chunks[2], ': keepalive\n\n')
+        self.assertTrue(chunks[3].startswith(f"id: {live['cursor']}\nevent: TELESCOPE_STATUS\n"))
+        pubsub.aclose.assert_awaited()
+
+    def test_stream_sends_live_changes_committed_after_later_replayed_ones(self):
+        slow = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+        slow_event = models.ChangeEvent.objects.get(object_id=slow.id)
+        # Hide the slow transaction's event from the replay, as if it hadn't committed yet
+        models.ChangeEvent.objects.filter(id=slow_event.id).delete()
+        replayed = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=timezone.now())
+        replayed_event = models.ChangeEvent.objects.get(object_id=replayed.id)
+        self.assertLess(slow_event.id, replayed_event.id)
+
+        def live_message(event):
+            return {'data': json.dumps({'id': event.id, 'cursor': encode_cursor(event.id),
+                                        'object_type': event.object_type, 'object_id': event.object_id,
+                                        'action': event.action, 'telescope': event.telescope, 'data': {}})}
+        pubsub = MagicMock()
+        pubsub.subscribe = AsyncMock()
+        pubsub.aclose = AsyncMock()
+        pubsub.get_message = AsyncMock(side_effect=[live_message(replayed_event), live_message(slow_event)])
+        client = MagicMock(pubsub=MagicMock(return_value=pubsub), aclose=AsyncMock())
+
+        async def read_stream():
+            stream = stream_change_events(after_id=0)
+            chunks = [await stream.__anext__() for _ in range(3)]
+            await stream.aclose()
+            return chunks
+
+        with patch('heroic_api.event_stream.redis.asyncio.Redis.from_url', return_value=client):
+            chunks = async_to_sync(read_stream)()
+        self.assertTrue(chunks[1].startswith(f'id: {encode_cursor(replayed_event.id)}\n'))
+        # The replayed event arriving live is skipped, but the slow one is sent
+        self.assertTrue(chunks[2].startswith(f'id: {encode_cursor(slow_event.id)}\n'))
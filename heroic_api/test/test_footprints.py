@@ -0,0 +1,22 @@
+from django.test import SimpleTestCase, override_settings
+import numpy as np
+
+from heroic_api.footprints import circular_field_coordinates, circular_fields
+
+
+class TestCircularFields(SimpleTestCase):
+    def test_field_vertices_lie_on_the_circle(self):
+        rings = circular_field_coordinates([10.0, 200.0], [-30.0, 45.0], [1.0, 0.5], vertices=12)
+        self.assertEqual(rings.shape, (2, 13, 2))
+        np.testing.assert_array_equal(rings[:, 0], rings[:, -1])
+        distances = np.hypot(rings[..., 0] - [[10.0], [200.0]], rings[..., 1] - [[-30.0], [45.0]])
+        np.testing.assert_allclose(distances, [[1.0] * 13, [0.5] * 13])
+
+    @override_settings(FIELD_POLYGON_VERTICES=8)
+    def test_fields_use_configured_vertex_count(self):
+        fields = circular_fields([10.0], [-30.0], [1.75])
+        self.assertEqual(len(fields), 1)
+        self.assertEqual(fields[0].num_points, 9)
+        self.assertEqual(fields[0].srid, 4326)
+        self.assertAlmostEqual(fields[0].centroid.x, 10.0)
+        self.assertAlmostEqual(fields[0].centroid.y, -30.0)
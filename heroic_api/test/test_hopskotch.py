@@ -0,0 +1,61 @@
+from django.test import TestCase
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.utils import timezone
+from mixer.backend.django import mixer
+from unittest.mock import patch
+from datetime import timedelta
+
+from hop.auth import Auth
+
+from heroic_api import hopskotch
+from heroic_api.models import Profile
+
+
+@patch('heroic_api.tasks.refresh_hop_credential_verification.send')
+@patch('heroic_api.hopskotch.create_credential_for_user')
+@patch('heroic_api.hopskotch.verify_credential_for_user')
+class TestCachedCredentialVerification(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        cache.clear()
+        self.user = mixer.blend(User)
+        Profile.objects.create(user=self.user, credential_name='user-cred', credential_password='pw')
+
+    def test_verification_is_cached(self, mock_verify, mock_create, mock_refresh):
+        mock_verify.return_value = True
+        hopskotch.check_and_regenerate_hop_credential(self.user)
+        hopskotch.check_and_regenerate_hop_credential(self.user)
+        mock_verify.assert_called_once_with(self.user.username, 'user-cred')
+        mock_create.assert_not_called()
+        mock_refresh.assert_not_called()
+
+    def test_invalid_credential_is_regenerated_and_new_one_cached(self, mock_verify, mock_create, mock_refresh):
+        mock_verify.return_value = False
+        mock_create.return_value = Auth('user-cred2', 'pw2')
+        hopskotch.check_and_regenerate_hop_credential(self.user)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.credential_name, 'user-cred2')
+        hopskotch.check_and_regenerate_hop_credential(self.user)
+        mock_verify.assert_called_once()
+        mock_create.assert_called_once()
+
+    def test_failed_regeneration_is_negatively_cached(self, mock_verify, mock_create, mock_refresh):
+        mock_verify.return_value = False
+        mock_create.return_value = None
+        for _ in range(3):
+            hopskotch.check_and_regenerate_hop_credential(self.user)
+        mock_verify.assert_called_once()
+        mock_create.assert_called_once()
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.credential_name, 'user-cred')
+
+    def test_stale_verification_is_refreshed_in_background(self, mock_verify, mock_create, mock_refresh):
+        mock_verify.return_value = True
+        hopskotch.check_and_regenerate_hop_credential(self.user)
+        stale = timezone.now() + timedelta(hours=1)
+        with patch('heroic_api.hopskotch.timezone.now', return_value=stale):
+            hopskotch.check_and_regenerate_hop_credential(self.user)
+            hopskotch.check_and_regenerate_hop_credential(self.user)
+        mock_verify.assert_called_once()
+        mock_refresh.assert_called_once_with(self.user.id)
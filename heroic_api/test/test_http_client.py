@@ -0,0 +1,77 @@
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch
+import requests
+
+from heroic_api.http_client import CircuitOpenError, ResilientSession, get_session, reset_circuit_breakers
+
+
+def _response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+@override_settings(HTTP_CLIENT_BREAKER_FAILURES=3, HTTP_CLIENT_BREAKER_RESET_SECONDS=60, HTTP_CLIENT_RETRIES=0)
+class TestResilientSession(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        reset_circuit_breakers()
+        self.addCleanup(reset_circuit_breakers)
+        self.session = ResilientSession(timeout=(1, 2))
+
+    def test_default_timeout_is_applied(self):
+        with patch('requests.adapters.HTTPAdapter.send', return_value=_response(200)) as mock_send:
+            self.session.get('http://service.test/a')
+            self.assertEqual(mock_send.call_args.kwargs['timeout'], (1, 2))
+            self.session.get('http://service.test/a', timeout=10)
+            self.assertEqual(mock_send.call_args.kwargs['timeout'], 10)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        with patch('requests.adapters.HTTPAdapter.send', side_effect=requests.exceptions.ConnectTimeout()) as mock_send:
+            for _ in range(3):
+                with self.assertRaises(requests.exceptions.ConnectTimeout):
+                    self.session.get('http://service.test/a')
+            with self.assertRaises(CircuitOpenError):
+                self.session.get('http://service.test/b')
+            self.assertEqual(mock_send.call_count, 3)
+        # Other hosts are unaffected
+        with patch('requests.adapters.HTTPAdapter.send', return_value=_response(200)):
+            self.assertEqual(self.session.get('http://other.test/a').status_code, 200)
+
+    def test_server_errors_open_the_circuit_and_success_resets_it(self):
+        with patch('requests.adapters.HTTPAdapter.send', side_effect=[_response(500), _response(500), _response(200),
+                                                                      _response(503), _response(503)]):
+            for _ in range(5):
+                self.session.get('http://service.test/a')
+        # Only two failures since the last success, so the circuit is still closed
+        with patch('requests.adapters.HTTPAdapter.send', return_value=_response(200)):
+            self.assertEqual(self.session.get('http://service.test/a').status_code, 200)
+
+    def test_half_open_circuit_allows_a_trial_request(self):
+        with patch('requests.adapters.HTTPAdapter.send', return_value=_response(502)):
+            for _ in range(3):
+                self.session.get('http://service.test/a')
+        with patch('heroic_api.http_client.time.monotonic', return_value=10 ** 9):
+            with patch('requests.adapters.HTTPAdapter.send', return_value=_response(200)):
+                self.assertEqual(self.session.get('http://service.test/a').status_code, 200)
+        with patch('requests.adapters.HTTPAdapter.send', return_value=_response(200)):
+            self.assertEqual(self.session.get('http://service.test/a').status_code, 200)
+
+    def test_failed_trial_request_reopens_the_circuit(self):
+        with patch('requests.adapters.HTTPAdapter.send', return_value=_response(502)):
+            for _ in range(3):
+                self.session.get('http://service.test/a')
+        with patch('heroic_api.http_client.time.monotonic', return_value=10 ** 9):
+            with patch('requests.adapters.HTTPAdapter.send', side_effect=requests.exceptions.ChunkedEncodingError()):
+                with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                    self.session.get('http://service.test/a')
+            with self.assertRaises(CircuitOpenError):
+                self.session.get('http://service.test/a')
+        # The next trial is allowed once the circuit has been open for the reset time again
+        with patch('heroic_api.http_client.time.monotonic', return_value=2 * 10 ** 9):
+            with patch('requests.adapters.HTTPAdapter.send', return_value=_response(200)):
+                self.assertEqual(self.session.get('http://service.test/a').status_code, 200)
+
+    def test_sessions_are_reused_per_name(self):
+        self.assertIs(get_session('test'), get_session('test'))
+        self.assertIsNot(get_session('test'), get_session('other_test'))
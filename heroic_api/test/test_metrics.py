@@ -0,0 +1,77 @@
+from django.test import SimpleTestCase, override_settings
+from django.core.cache import cache
+
+from heroic_api import metrics
+from heroic_api.cache import HeroicCache
+from heroic_api.profiling import span
+
+
+def _sample(name, labels=None):
+    return metrics.get_registry().get_sample_value(name, labels or {}) or 0.0
+
+
+class TestMetrics(SimpleTestCase):
+    def test_spans_are_observed_without_a_profiled_request(self):
+        before = _sample('heroic_hot_path_duration_seconds_count', {'span': 'metrics_test'})
+        with span('metrics_test'):
+            pass
+        self.assertEqual(_sample('heroic_hot_path_duration_seconds_count', {'span': 'metrics_test'}), before + 1)
+
+    def test_hop_handler_counts_messages_by_outcome(self):
+        @metrics.hop_handler('metrics_test')
+        def handler(fail):
+            if fail:
+                raise ValueError('bad message')
+
+        success_before = _sample('heroic_hop_messages_total', {'handler': 'metrics_test', 'outcome': 'success'})
+        error_before = _sample('heroic_hop_messages_total', {'handler': 'metrics_test', 'outcome': 'error'})
+        handler(False)
+        with self.assertRaises(ValueError):
+            handler(True)
+        self.assertEqual(
+            _sample('heroic_hop_messages_total', {'handler': 'metrics_test', 'outcome': 'success'}), success_before + 1
+        )
+        self.assertEqual(
+            _sample('heroic_hop_messages_total', {'handler': 'metrics_test', 'outcome': 'error'}), error_before + 1
+        )
+        self.assertGreaterEqual(_sample('heroic_hop_message_duration_seconds_count', {'handler': 'metrics_test'}), 2)
+
+    def test_schedule_ingest_stats_are_observed(self):
+        before = _sample('heroic_schedule_ingest_visits_total', {'source': 'metrics_test'})
+        metrics.observe_schedule_ingest(
+            {'source': 'metrics_test', 'visits': 12, 'fetch_time': 0.5, 'parse_time': 0.1, 'write_time': 0.2}
+        )
+        self.assertEqual(_sample('heroic_schedule_ingest_visits_total', {'source': 'metrics_test'}), before + 12)
+        self.assertEqual(
+            _sample('heroic_schedule_ingest_duration_seconds_sum', {'source': 'metrics_test', 'stage': 'fetch'}), 0.5
+        )
+
+    @override_settings(HEROIC_CACHE_MAX_ENTRY_SIZE=1000)
+    def test_cache_operations_are_counted_by_namespace(self):
+        cache.clear()
+        heroic_cache = HeroicCache('metrics_test')
+        before = {operation: _sample('heroic_cache_operations_total', {'namespace': 'metrics_test', 'operation': operation})
+                  for operation in ('hit', 'miss', 'set', 'oversize')}
+        heroic_cache.get('key')
+        heroic_cache.set('key', 1)
+        heroic_cache.get('key')
+        heroic_cache.get_many(['key', 'missing'])
+        heroic_cache.set('big', 'x' * 2000)
+        for operation, count in (('hit', 2), ('miss', 2), ('set', 1), ('oversize', 1)):
+            self.assertEqual(
+                _sample('heroic_cache_operations_total', {'namespace': 'metrics_test', 'operation': operation}),
+                before[operation] + count
+            )
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        with span('metrics_test'):
+            pass
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'heroic_hot_path_duration_seconds_bucket{le="0.001",span="metrics_test"}', response.content)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_endpoint_is_not_found_when_disabled(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,80 @@
+from mixer.backend.django import mixer
+from datetime import date, datetime, timezone
+from django.utils import timezone as django_timezone
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from heroic_api import models
+from heroic_api.partitions import (add_months, apply_retention, create_month_partition, ensure_partitions,
+                                   get_month_partitions)
+
+
+class TestPartitions(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.site = mixer.blend(models.Site)
+        self.telescope = mixer.blend(models.Telescope, site=self.site)
+        self.telescope2 = mixer.blend(models.Telescope, site=self.site)
+
+    def _count_rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
+
+    def test_add_months(self):
+        self.assertEqual(add_months(date(2020, 11, 1), 3), date(2021, 2, 1))
+        self.assertEqual(add_months(date(2020, 1, 1), -1), date(2019, 12, 1))
+
+    def test_upcoming_partitions_exist(self):
+        self.assertEqual(ensure_partitions(), [])
+        status = mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=django_timezone.now())
+        self.assertEqual(self._count_rows('heroic_api_telescopestatus_default'), 0)
+        self.assertEqual(self._count_rows(f'heroic_api_telescopestatus_p{status.date:%Y_%m}'), 1)
+
+    def test_creating_a_partition_moves_its_rows_out_of_the_default_partition(self):
+        status = mixer.blend(models.TelescopeStatus, telescope=self.telescope,
+                             date=datetime(2020, 1, 31, 23, 59, tzinfo=timezone.utc))
+        mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=datetime(2020, 2, 1, tzinfo=timezone.utc))
+        self.assertEqual(self._count_rows('heroic_api_telescopestatus_default'), 2)
+
+        self.assertTrue(create_month_partition(models.TelescopeStatus, date(2020, 1, 15)))
+        self.assertFalse(create_month_partition(models.TelescopeStatus, date(2020, 1, 1)))
+        self.assertEqual(get_month_partitions(models.TelescopeStatus)[date(2020, 1, 1)],
+                         'heroic_api_telescopestatus_p2020_01')
+        self.assertEqual(self._count_rows('heroic_api_telescopestatus_p2020_01'), 1)
+        self.assertEqual(self._count_rows('heroic_api_telescopestatus_default'), 1)
+        self.assertEqual(models.TelescopeStatus.objects.get(date__lt=datetime(2020, 2, 1, tzinfo=timezone.utc)), status)
+
+    def test_date_range_queries_only_scan_their_partitions(self):
+        create_month_partition(models.TelescopeStatus, date(2020, 1, 1))
+        create_month_partition(models.TelescopeStatus, date(2020, 2, 1))
+        plan = models.TelescopeStatus.objects.filter(
+            date__gte=datetime(2020, 1, 10, tzinfo=timezone.utc), date__lt=datetime(2020, 1, 20, tzinfo=timezone.utc)
+        ).explain()
+        self.assertIn('heroic_api_telescopestatus_p2020_01', plan)
+        self.assertNotIn('heroic_api_telescopestatus_p2020_02', plan)
+        self.assertNotIn('heroic_api_telescopestatus_default', plan)
+
+    @override_settings(TELESCOPE_STATUS_RETENTION_MONTHS=1, TELESCOPE_POINTING_RETENTION_MONTHS=0)
+    def test_retention_detaches_old_partitions(self):
+        create_month_partition(models.TelescopeStatus, date(2020, 1, 1))
+        old_status = mixer.blend(models.TelescopeStatus, telescope=self.telescope,
+                                 date=datetime(2020, 1, 15, tzinfo=timezone.utc))
+        mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=django_timezone.now())
+
+        self.assertEqual(apply_retention(), ['heroic_api_telescopestatus_p2020_01'])
+        self.assertFalse(models.TelescopeStatus.objects.filter(id=old_status.id).exists())
+        self.assertNotIn(date(2020, 1, 1), get_month_partitions(models.TelescopeStatus))
+        # The detached partition is kept to be archived
+        self.assertEqual(self._count_rows('heroic_api_telescopestatus_p2020_01'), 1)
+
+    @override_settings(TELESCOPE_STATUS_RETENTION_MONTHS=1)
+    def test_retention_keeps_the_current_status_of_every_telescope(self):
+        create_month_partition(models.TelescopeStatus, date(2020, 1, 1))
+        old_status = mixer.blend(models.TelescopeStatus, telescope=self.telescope2,
+                                 date=datetime(2020, 1, 15, tzinfo=timezone.utc))
+        mixer.blend(models.TelescopeStatus, telescope=self.telescope, date=django_timezone.now())
+
+        self.assertEqual(apply_retention(), [])
+        self.telescope2.refresh_from_db()
+        self.assertEqual(self.telescope2.current_status, old_status)
@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.http import HttpResponse
+from unittest.mock import patch, MagicMock
+
+from heroic_api import models
+from heroic_api.middleware import ServerTimingMiddleware, InfluxDBRequestLogger
+from heroic_api.profiling import get_current_profile, profile_request, profiled, span
+
+
+@profiled('decorated')
+def _decorated(value):
+    return value * 2
+
+
+class TestProfiling(SimpleTestCase):
+    def test_spans_outside_a_profiled_request_are_not_recorded(self):
+        with span('unprofiled'):
+            pass
+        self.assertEqual(_decorated(2), 4)
+        self.assertIsNone(get_current_profile())
+
+    def test_spans_are_summed_per_name(self):
+        with profile_request() as profile:
+            for _ in range(3):
+                with span('loop'):
+                    pass
+            self.assertEqual(_decorated(2), 4)
+        self.assertIsNone(get_current_profile())
+        self.assertEqual(dict(profile.span_counts), {'loop': 3, 'decorated': 1})
+        server_timing = profile.server_timing()
+        self.assertIn('loop;dur=', server_timing)
+        self.assertIn('desc="3 calls"', server_timing)
+        self.assertIn('db;dur=0.0;desc="0 queries"', server_timing)
+        self.assertIn('total;dur=', server_timing)
+        fields = profile.influxdb_fields()
+        self.assertIn('span_loop_ms', fields)
+        self.assertEqual(fields['db_queries'], 0)
+
+
+class TestServerTimingMiddleware(TestCase):
+    @override_settings(PROFILING_ENABLED=True, INFLUXDB_ENABLED=True)
+    def test_timings_are_returned_and_logged(self):
+        def view(request):
+            with span('view'):
+                list(models.Observatory.objects.all())
+                list(models.Site.objects.all())
+            return HttpResponse('ok')
+
+        buffer = MagicMock()
+        with patch('heroic_api.middleware.get_request_metric_buffer', return_value=buffer):
+            middleware = ServerTimingMiddleware(InfluxDBRequestLogger(view))
+            response = middleware(RequestFactory().get('/api/observatories/'))
+        self.assertIn('view;dur=', response['Server-Timing'])
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        fields = buffer.add.call_args.args[0]['fields']
+        self.assertEqual(fields['db_queries'], 2)
+        self.assertIn('span_view_ms', fields)
+
+    def test_profiling_is_off_by_default(self):
+        response = self.client.get('/api/observatories/')
+        self.assertNotIn('Server-Timing', response)
@@ -0,0 +1,90 @@
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from django.http import HttpResponse
+from influxdb import InfluxDBClient
+from unittest.mock import patch, MagicMock
+import threading
+
+from heroic_api.middleware import InfluxDBRequestLogger
+from heroic_api.request_metrics import RequestMetricBuffer
+from heroic_api.tasks import write_request_metrics
+from heroic_api.test.influxdb_stub import StubInfluxDB
+
+
+def _point(index):
+    return {
+        'measurement': 'heroic_requests',
+        'time': f'2026-01-01T00:00:{index % 60:02d}+00:00',
+        'tags': {'endpoint': 'api/telescopes/', 'method': 'GET', 'status_code': 200},
+        'fields': {'latency_ms': float(index), 'count': 1},
+    }
+
+
+class TestRequestMetricBuffer(SimpleTestCase):
+    def test_flush_sends_batches_of_at_most_batch_size(self):
+        flush_func = MagicMock()
+        buffer = RequestMetricBuffer(flush_func, batch_size=3, flush_interval=60, max_points=100)
+        with patch.object(buffer, '_ensure_flusher'):
+            for index in range(7):
+                buffer.add(_point(index))
+        buffer.flush()
+        self.assertEqual([len(call.args[0]) for call in flush_func.call_args_list], [3, 3, 1])
+        self.assertEqual(len(buffer), 0)
+
+    def test_buffer_is_bounded(self):
+        buffer = RequestMetricBuffer(MagicMock(), batch_size=100, flush_interval=60, max_points=5)
+        with patch.object(buffer, '_ensure_flusher'):
+            for index in range(8):
+                buffer.add(_point(index))
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual(buffer.dropped, 3)
+        # The oldest points are the ones dropped
+        self.assertEqual(buffer._take_batch()[0]['fields']['latency_ms'], 3.0)
+
+    def test_full_batch_is_flushed_without_waiting_for_the_interval(self):
+        flushed = threading.Event()
+        buffer = RequestMetricBuffer(lambda points: flushed.set(), batch_size=3, flush_interval=60, max_points=100)
+        for index in range(3):
+            buffer.add(_point(index))
+        self.assertTrue(flushed.wait(5))
+
+    def test_failed_flush_drops_batch(self):
+        buffer = RequestMetricBuffer(MagicMock(side_effect=ConnectionError), batch_size=2, flush_interval=60,
+                                     max_points=100)
+        with patch.object(buffer, '_ensure_flusher'):
+            for index in range(3):
+                buffer.add(_point(index))
+        buffer.flush()
+        self.assertEqual(buffer.dropped, 3)
+        self.assertEqual(len(buffer), 0)
+
+
+@override_settings(INFLUXDB_ENABLED=True)
+class TestInfluxDBRequestLogger(SimpleTestCase):
+    def test_requests_are_buffered_not_sent(self):
+        buffer = MagicMock()
+        with patch('heroic_api.middleware.get_request_metric_buffer', return_value=buffer), \
+                patch('heroic_api.tasks.write_request_metrics.send') as mock_send:
+            middleware = InfluxDBRequestLogger(lambda request: HttpResponse('ok'))
+            for _ in range(3):
+                middleware(RequestFactory().get('/api/telescopes/'))
+        self.assertEqual(buffer.add.call_count, 3)
+        self.assertEqual(buffer.add.call_args.args[0]['fields']['path'], '/api/telescopes/')
+        mock_send.assert_not_called()
+
+
+class TestWriteRequestMetrics(SimpleTestCase):
+    def test_batch_is_written_in_one_request(self):
+        with StubInfluxDB() as influxdb:
+            client = InfluxDBClient(host=influxdb.host, port=influxdb.port, database='heroic')
+            with patch('heroic_api.tasks.get_influxdb_client', return_value=client):
+                write_request_metrics.fn([_point(index) for index in range(250)])
+        self.assertEqual(len(influxdb.writes), 1)
+        self.assertEqual(len(influxdb.points), 250)
+        self.assertTrue(influxdb.points[0].startswith('heroic_requests,'))
+
+    def test_slow_influxdb_times_out(self):
+        with StubInfluxDB(delay=2) as influxdb:
+            client = InfluxDBClient(host=influxdb.host, port=influxdb.port, database='heroic', timeout=0.5, retries=1)
+            with patch('heroic_api.tasks.get_influxdb_client', return_value=client):
+                with self.assertRaises(Exception):
+                    write_request_metrics.fn([_point(0)])
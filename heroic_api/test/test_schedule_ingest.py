@@ -0,0 +1,211 @@
+from django.test import SimpleTestCase, TestCase
+from django.contrib.gis.geos import Point
+from django.core.management import call_command
+from mixer.backend.django import mixer
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+import numpy as np
+
+from heroic_api import models
+from heroic_api.footprints import circular_fields
+from heroic_api.schedule_ingest.base import ScheduleSource, ScheduleVisits
+from heroic_api.schedule_ingest.fake import FakeScheduleSource
+from heroic_api.schedule_ingest.rubin import RubinScheduleSource
+from heroic_api.schedule_ingest.pipeline import ingest_schedule, sync_planned_pointings, upsert_performed_pointings
+
+
+class TestScheduleIngestPipeline(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.observatory = mixer.blend(models.Observatory, id='tst')
+        self.site = mixer.blend(models.Site, id='tst.site', observatory=self.observatory)
+        self.telescope = mixer.blend(models.Telescope, id='tst.site.tel', site=self.site)
+        self.instrument = mixer.blend(models.Instrument, id='tst.site.tel.inst', telescope=self.telescope)
+        # Offset the visits by half an interval from now so none become performed between ingests
+        self.start = int(datetime.now(timezone.utc).timestamp()) - 30 * 60 - 30
+
+    def _fake_source(self, **options):
+        options = {'NUM_VISITS': 120, 'START': self.start, 'BATCH_SIZE': 50, **options}
+        return FakeScheduleSource('fake', self.telescope.id, self.instrument.id, options)
+
+    def test_ingest_creates_performed_and_planned_pointings(self):
+        stats = ingest_schedule(self._fake_source())
+        self.assertEqual(stats['visits'], 120)
+        performed = models.TelescopePointing.objects.filter(telescope=self.telescope, planned=False)
+        planned = models.TelescopePointing.objects.filter(telescope=self.telescope, planned=True)
+        self.assertEqual(performed.count(), stats['performed']['created'])
+        self.assertEqual(planned.count(), stats['planned']['created'])
+        self.assertGreater(performed.count(), 0)
+        self.assertGreater(planned.count(), 0)
+        self.assertTrue(all(pointing.date < datetime.now(timezone.utc) for pointing in performed))
+
+    def test_unchanged_schedule_writes_nothing(self):
+        ingest_schedule(self._fake_source())
+        pointing_ids = set(models.TelescopePointing.objects.values_list('id', flat=True))
+        stats = ingest_schedule(self._fake_source())
+        self.assertEqual(stats['performed']['created'], 0)
+        self.assertEqual(stats['performed']['updated'], 0)
+        self.assertEqual(stats['planned'], {'created': 0, 'updated': 0, 'deleted': 0})
+        self.assertEqual(set(models.TelescopePointing.objects.values_list('id', flat=True)), pointing_ids)
+
+    def test_changed_schedule_only_replaces_changed_planned_pointings(self):
+        ingest_schedule(self._fake_source())
+        stats = ingest_schedule(self._fake_source(NUM_VISITS=100))
+        # The last 20 visits dropped out of the schedule so their planned pointings are removed
+        self.assertEqual(stats['planned']['deleted'], 20)
+        self.assertEqual(stats['planned']['created'], 0)
+        self.assertEqual(models.TelescopePointing.objects.filter(target='fake_field_110').count(), 0)
+
+    def test_schedule_churn_updates_changed_pointings(self):
+        ingest_schedule(self._fake_source())
+        stats = ingest_schedule(self._fake_source(CHANGED_FRACTION=1.0))
+        self.assertEqual(stats['planned']['updated'], models.TelescopePointing.objects.filter(planned=True).count())
+        self.assertEqual(stats['planned']['created'], 0)
+        self.assertEqual(stats['planned']['deleted'], 0)
+
+    def test_ingest_records_change_events(self):
+        ingest_schedule(self._fake_source())
+        events = models.ChangeEvent.objects.filter(object_type=models.ChangeEvent.ObjectTypes.TELESCOPE_POINTING)
+        self.assertEqual(events.count(), models.TelescopePointing.objects.count())
+        stats = ingest_schedule(self._fake_source(NUM_VISITS=100))
+        deleted = events.filter(action=models.ChangeEvent.Actions.DELETED)
+        self.assertEqual(deleted.count(), stats['planned']['deleted'])
+        self.assertEqual(set(deleted.values_list('telescope', flat=True)), {self.telescope.id})
+
+    def test_planned_pointing_becomes_performed(self):
+        planned_date = datetime.now(timezone.utc) + timedelta(minutes=5)
+        mixer.blend(models.TelescopePointing, telescope=self.telescope, instrument=self.instrument,
+                    date=planned_date, target='field_1', planned=True)
+        source = self._fake_source()
+        visits = ScheduleVisits(
+            dates=[np.datetime64(planned_date.replace(tzinfo=None), 'us')], targets=['field_1'], ras=[10.0],
+            decs=[-20.0], radii=[1.0], performed=[True]
+        )
+        with patch.object(FakeScheduleSource, 'parse', return_value=visits):
+            stats = ingest_schedule(source)
+        self.assertEqual(stats['performed'], {'created': 0, 'updated': 1})
+        pointing = models.TelescopePointing.objects.get(target='field_1')
+        self.assertFalse(pointing.planned)
+        self.assertEqual(pointing.coordinate.coords, (10.0, -20.0))
+
+    def test_ingest_command_runs_fake_source_offline(self):
+        out = StringIO()
+        start = int(datetime.now(timezone.utc).timestamp()) - 15 * 60 - 30
+        with self.settings(SCHEDULE_INGEST_SOURCES=[{
+            'NAME': 'fake', 'CLASS': 'heroic_api.schedule_ingest.fake.FakeScheduleSource',
+            'TELESCOPE': 'fake.site.telescope', 'INSTRUMENT': 'fake.site.telescope.instrument',
+            'CRONTAB': '*/10 * * * *', 'OPTIONS': {'NUM_VISITS': 50}
+        }]):
+            call_command('ingest_schedule', 'fake', '--setup', '--repeat', '2', '--option', 'NUM_VISITS=40',
+                         '--option', f'START={start}', stdout=out)
+        self.assertIn('Ingested the fake schedule 2 times', out.getvalue())
+        self.assertEqual(models.TelescopePointing.objects.filter(telescope_id='fake.site.telescope').count(), 40)
+
+
+class TestPointingSync(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.site = mixer.blend(models.Site)
+        self.telescope = mixer.blend(models.Telescope, site=self.site)
+        self.instrument = mixer.blend(models.Instrument, telescope=self.telescope)
+        self.date = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(hours=1)
+
+    def _pointing(self, target, minutes=0, ra=10.0, dec=-20.0, radius=1.0, planned=True):
+        return models.TelescopePointing(
+            telescope=self.telescope, instrument=self.instrument, date=self.date + timedelta(minutes=minutes),
+            target=target, planned=planned, coordinate=Point(ra, dec, srid=4326),
+            field=circular_fields(np.array([ra]), np.array([dec]), np.array([radius]))[0],
+            extra={'exposure_time': 30.0}
+        )
+
+    def _sync(self, *pointings):
+        return sync_planned_pointings(self.telescope, self.instrument,
+                                      {(pointing.date, pointing.target): pointing for pointing in pointings},
+                                      batch_size=2)
+
+    def _upsert(self, *pointings):
+        return upsert_performed_pointings(self.telescope, self.instrument,
+                                          {(pointing.date, pointing.target): pointing for pointing in pointings},
+                                          batch_size=2)
+
+    def test_sync_creates_new_planned_pointings(self):
+        stats = self._sync(self._pointing('field_1'), self._pointing('field_2', minutes=1))
+        self.assertEqual(stats, {'created': 2, 'updated': 0, 'deleted': 0})
+        self.assertEqual(set(models.TelescopePointing.objects.values_list('target', flat=True)), {'field_1', 'field_2'})
+
+    def test_sync_leaves_unchanged_pointings_alone(self):
+        self._sync(self._pointing('field_1'), self._pointing('field_2', minutes=1))
+        pointing_ids = set(models.TelescopePointing.objects.values_list('id', flat=True))
+        stats = self._sync(self._pointing('field_1'), self._pointing('field_2', minutes=1))
+        self.assertEqual(stats, {'created': 0, 'updated': 0, 'deleted': 0})
+        self.assertEqual(set(models.TelescopePointing.objects.values_list('id', flat=True)), pointing_ids)
+
+    def test_sync_updates_changed_coordinates(self):
+        self._sync(self._pointing('field_1'), self._pointing('field_2', minutes=1))
+        stats = self._sync(self._pointing('field_1', ra=50.0), self._pointing('field_2', minutes=1))
+        self.assertEqual(stats, {'created': 0, 'updated': 1, 'deleted': 0})
+        pointing = models.TelescopePointing.objects.get(target='field_1')
+        self.assertEqual(pointing.coordinate.coords, (50.0, -20.0))
+        self.assertEqual(pointing.field.centroid.x, self._pointing('field_1', ra=50.0).field.centroid.x)
+
+    def test_sync_updates_changed_fields_of_view(self):
+        self._sync(self._pointing('field_1'))
+        stats = self._sync(self._pointing('field_1', radius=2.0))
+        self.assertEqual(stats, {'created': 0, 'updated': 1, 'deleted': 0})
+        self.assertEqual(models.TelescopePointing.objects.get(target='field_1').field,
+                         self._pointing('field_1', radius=2.0).field)
+
+    def test_sync_deletes_pointings_no_longer_planned(self):
+        self._sync(self._pointing('field_1'), self._pointing('field_2', minutes=1), self._pointing('field_3', minutes=2))
+        stats = self._sync(self._pointing('field_2', minutes=1))
+        self.assertEqual(stats, {'created': 0, 'updated': 0, 'deleted': 2})
+        self.assertEqual(list(models.TelescopePointing.objects.values_list('target', flat=True)), ['field_2'])
+
+    def test_upsert_creates_updates_and_skips_performed_pointings(self):
+        stats = self._upsert(self._pointing('field_1', planned=False), self._pointing('field_2', minutes=1, planned=False))
+        self.assertEqual(stats, {'created': 2, 'updated': 0})
+        stats = self._upsert(self._pointing('field_1', planned=False), self._pointing('field_2', minutes=1, planned=False))
+        self.assertEqual(stats, {'created': 0, 'updated': 0})
+        stats = self._upsert(self._pointing('field_1', planned=False, radius=0.5),
+                             self._pointing('field_2', minutes=1, planned=False),
+                             self._pointing('field_3', minutes=2, planned=False))
+        self.assertEqual(stats, {'created': 1, 'updated': 1})
+        self.assertEqual(models.TelescopePointing.objects.get(target='field_1').field,
+                         self._pointing('field_1', radius=0.5).field)
+
+
+class TestScheduleSource(SimpleTestCase):
+    def test_source_without_parse_cannot_be_constructed(self):
+        class FetchOnlySource(ScheduleSource):
+            def fetch(self):
+                return []
+
+        with self.assertRaises(TypeError):
+            FetchOnlySource('fetch_only', 'tst.site.tel', 'tst.site.tel.inst')
+
+    def test_session_uses_source_timeout_and_retries(self):
+        source = FakeScheduleSource('slow', 'tst.site.tel', 'tst.site.tel.inst', {'TIMEOUT': (30, 120), 'RETRIES': 3})
+        self.assertEqual(source.session.timeout, (30, 120))
+        self.assertEqual(source.session.get_adapter('https://slow.test').max_retries.total, 3)
+
+
+class TestRubinScheduleSource(TestCase):
+    def test_parse_rubin_schedule(self):
+        source = RubinScheduleSource('rubin', 'noirlab.cp.rubin', 'noirlab.cp.rubin.lsstcam', {'URL': 'http://rubin'})
+        response = MagicMock()
+        response.json.return_value = [
+            {'t_planning': 60000.5, 'target_name': 'field_a', 's_ra': 10.0, 's_dec': -20.0, 's_fov': 3.5,
+             't_min': 60000.5, 't_exptime': 30.0, 'execution_status': 'Performed'},
+            {'t_planning': 60000.6, 'target_name': 'field_b', 's_ra': 11.0, 's_dec': -21.0, 's_fov': 3.5,
+             't_min': 60000.75, 't_exptime': 15.0, 'execution_status': 'Scheduled'},
+        ]
+        with patch.object(source.session, 'get', return_value=response) as mock_get:
+            visits = source.parse(source.fetch())
+        self.assertEqual(mock_get.call_args.args[0], 'http://rubin')
+        self.assertEqual(len(visits), 2)
+        self.assertEqual(visits.targets, ['field_a', 'field_b'])
+        self.assertEqual(visits.dates[1], np.datetime64('2023-02-25T18:00:00', 'us'))
+        np.testing.assert_array_equal(visits.radii, [1.75, 1.75])
+        np.testing.assert_array_equal(visits.performed, [True, False])
+        self.assertEqual(visits.extras[1], {'exposure_time': 15.0})
@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase
+from astropy.time import Time
+from datetime import datetime, timezone
+import numpy as np
+
+from heroic_api.time_conversions import (
+    gps_to_datetime, gps_to_datetime64, datetime64_to_datetimes, mjd_to_datetime64
+)
+
+
+class TestGPSConversions(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        rng = np.random.default_rng(26)
+        # A mix of fractional and whole GPS seconds from the GPS epoch up to the current era
+        self.gps_times = np.concatenate([
+            rng.uniform(0, 1.4e9, 500), np.floor(rng.uniform(0, 1.4e9, 500)), [0.0, 1e9 + 0.9999996]
+        ])
+
+    def _astropy_datetime(self, gps_time):
+        return Time(gps_time, format='gps', scale='utc').datetime.replace(tzinfo=timezone.utc)
+
+    def test_scalar_conversion_matches_astropy(self):
+        for gps_time in self.gps_times:
+            self.assertEqual(gps_to_datetime(float(gps_time)), self._astropy_datetime(gps_time))
+
+    def test_array_conversion_matches_astropy(self):
+        converted = datetime64_to_datetimes(gps_to_datetime64(self.gps_times))
+        expected = [self._astropy_datetime(gps_time) for gps_time in self.gps_times]
+        self.assertEqual(converted, expected)
+
+    def test_conversion_across_a_leap_second(self):
+        # The 2016-12-31 leap second spans GPS seconds [1167264017, 1167264018)
+        self.assertEqual(gps_to_datetime(1167264016.5), datetime(2016, 12, 31, 23, 59, 59, 500000, tzinfo=timezone.utc))
+        self.assertEqual(gps_to_datetime(1167264018), datetime(2017, 1, 1, tzinfo=timezone.utc))
+        with self.assertRaises(ValueError):
+            gps_to_datetime(1167264017.5)
+        with self.assertRaises(ValueError):
+            gps_to_datetime64([1167264016.0, 1167264017.5])
+
+    def test_times_before_gps_epoch_are_rejected(self):
+        with self.assertRaises(ValueError):
+            gps_to_datetime(-1.0)
+        with self.assertRaises(ValueError):
+            gps_to_datetime64([10.0, -1.0])
+
+    def test_array_conversion_keeps_shape(self):
+        converted = gps_to_datetime64(np.array([[1e9, 1e9 + 1], [1e9 + 2, 1e9 + 3]]))
+        self.assertEqual(converted.shape, (2, 2))
+        self.assertEqual(converted.dtype, np.dtype('datetime64[us]'))
+        self.assertEqual(gps_to_datetime64([]).size, 0)
+
+
+class TestMJDConversions(SimpleTestCase):
+    def test_array_conversion_matches_astropy(self):
+        mjds = np.random.default_rng(28).uniform(58000, 62000, 1000)
+        converted = datetime64_to_datetimes(mjd_to_datetime64(mjds))
+        expected = [Time(mjd, format='mjd').to_datetime(timezone=timezone.utc) for mjd in mjds]
+        self.assertEqual(converted, expected)
+
+    def test_whole_days(self):
+        converted = datetime64_to_datetimes(mjd_to_datetime64([40587.0, 60000.5]))
+        self.assertEqual(converted, [
+            datetime(1970, 1, 1, tzinfo=timezone.utc), datetime(2023, 2, 25, 12, tzinfo=timezone.utc)
+        ])
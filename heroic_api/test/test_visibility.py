@@ -2,7 +2,10 @@ from rest_framework.test import APITestCase
 from mixer.backend.django import mixer
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.core.cache import cache
+from unittest.mock import patch
 from datetime import datetime, timezone
+import msgpack
 import numpy as np
 
 from heroic_api import models
@@ -11,6 +14,7 @@ from heroic_api import models
 class BaseVisibilityTestCase(APITestCase):
     def setUp(self) -> None:
         super().setUp()
+        cache.clear()
         self.user = mixer.blend(User, is_superuser=False)
         self.client.force_login(self.user)
         self.observatory = mixer.blend(models.Observatory, id='tstObs', admin=self.user)
@@ -253,6 +257,47 @@ class TestVisibilityIntervals(BaseVisibilityTestCase):
         self.assertContains(response, '2025-03-06T', status_code=200)
 
 
+class TestVisibilityCaching(BaseVisibilityTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.query = self.m22_basic_target_query.copy()
+        self.query['include_status'] = True
+
+    @patch('heroic_api.views.get_rise_set_intervals_by_telescope_for_target', return_value={})
+    def test_repeated_visibility_query_is_cached(self, mock_intervals):
+        self.client.get(reverse('api:visibility-intervals'), data=self.query)
+        self.client.post(reverse('api:visibility-intervals'), data=self.query)
+        self.assertEqual(mock_intervals.call_count, 1)
+        # A different query is computed separately
+        self.query['max_airmass'] = 1.5
+        self.client.get(reverse('api:visibility-intervals'), data=self.query)
+        self.assertEqual(mock_intervals.call_count, 2)
+
+    @patch('heroic_api.views.get_rise_set_intervals_by_telescope_for_target', return_value={})
+    def test_status_change_invalidates_only_its_telescope(self, mock_intervals):
+        query2 = self.query.copy()
+        self.query['telescopes'] = [self.telescope.id]
+        query2['telescopes'] = [self.telescope2.id]
+        self.client.get(reverse('api:visibility-intervals'), data=self.query)
+        self.client.get(reverse('api:visibility-intervals'), data=query2)
+        self.assertEqual(mock_intervals.call_count, 2)
+
+        mixer.blend(models.TelescopeStatus, date=datetime(2025, 3, 5, tzinfo=timezone.utc), telescope=self.telescope,
+                    status=models.TelescopeStatus.StatusChoices.UNAVAILABLE)
+        self.client.get(reverse('api:visibility-intervals'), data=self.query)
+        self.client.get(reverse('api:visibility-intervals'), data=query2)
+        self.assertEqual(mock_intervals.call_count, 3)
+
+    @patch('heroic_api.views.get_rise_set_intervals_by_telescope_for_target', return_value={})
+    def test_instrument_capability_change_invalidates_its_telescope(self, mock_intervals):
+        instrument = mixer.blend(models.Instrument, telescope=self.telescope)
+        self.client.get(reverse('api:visibility-intervals'), data=self.query)
+        mixer.blend(models.InstrumentCapability, instrument=instrument, date=datetime(2025, 3, 5, tzinfo=timezone.utc),
+                    status=models.InstrumentCapability.InstrumentStatus.UNAVAILABLE)
+        self.client.get(reverse('api:visibility-intervals'), data=self.query)
+        self.assertEqual(mock_intervals.call_count, 2)
+
+
 class TestVisibilityAirmass(BaseVisibilityTestCase):
     def _compare_airmasses(self, expected_airmasses, actual_airmasses):
         for telescope in set(list(expected_airmasses.keys()) + list(actual_airmasses.keys())):
@@ -297,6 +342,31 @@ class TestVisibilityAirmass(BaseVisibilityTestCase):
         self.assertEqual(response.status_code, 200)
         self._compare_airmasses(expected_airmasses, airmasses)
 
+    def test_visibility_airmasses_in_msgpack(self):
+        query = self.m22_basic_target_query.copy()
+        query['telescopes'] = [self.telescope.id]
+        query['end'] = datetime(2025, 3, 1, 18)
+        response = self.client.get(reverse('api:visibility-airmass'), data=query, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        airmasses = msgpack.unpackb(response.content)[self.telescope.id]
+        times = np.frombuffer(airmasses['times']['data'], dtype=airmasses['times']['dtype'])
+        self.assertEqual(list(times.astype('datetime64[ms]').astype(str)),
+                         ['2025-03-01T17:29:09.080', '2025-03-01T17:39:09.080',
+                          '2025-03-01T17:49:09.080', '2025-03-01T17:59:09.080'])
+        np.testing.assert_allclose(
+            np.frombuffer(airmasses['airmasses']['data'], dtype=airmasses['airmasses']['dtype']),
+            [1.9987162221252013, 1.8809851094809273, 1.7782275734684165, 1.6879817282310978], rtol=1e-6
+        )
+
+    def test_visibility_airmasses_errors_in_msgpack_are_not_compacted(self):
+        query = self.m22_basic_target_query.copy()
+        del query['start']
+        query['format'] = 'msgpack'
+        response = self.client.get(reverse('api:visibility-airmass'), data=query)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start', msgpack.unpackb(response.content))
+
     def test_visibility_airmasses_minor_planet_succeeds(self):
         query = self.minor_planet_target_query
         # constrain query so our expected values are shorter
@@ -357,6 +427,21 @@ class TestSkyMapVisibility(BaseVisibilityTestCase):
         # least one visibility bin should contain cells.
         self.assertTrue(any(entry['moc'].values()))
 
+    def test_skymap_binned_moc_in_msgpack_matches_json(self):
+        query = self.skymap_query.copy()
+        query['telescopes'] = [self.telescope.id]
+        query['bins'] = 4
+        entry = self.client.get(reverse('api:visibility-skymap'), data=query).json()[self.telescope.id]
+        response = self.client.get(reverse('api:visibility-skymap'), data={**query, 'format': 'msgpack'})
+        self.assertEqual(response.status_code, 200)
+        packed_entry = msgpack.unpackb(response.content)[self.telescope.id]
+        self.assertEqual(packed_entry['max_order'], entry['max_order'])
+        self.assertEqual(packed_entry['dark_hours'], entry['dark_hours'])
+        for upper_bound, moc_json in entry['moc'].items():
+            for order, cells in moc_json.items():
+                packed_cells = packed_entry['moc'][upper_bound][order]
+                self.assertEqual(np.frombuffer(packed_cells['data'], dtype=packed_cells['dtype']).tolist(), cells)
+
     def test_skymap_binned_moc_defaults_to_ten_bins(self):
         query = self.skymap_query.copy()
         query['telescopes'] = [self.telescope.id]
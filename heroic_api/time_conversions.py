@@ -0,0 +1,171 @@
+"""heroic_api/time_conversions.py
+
+Lightweight GPS to UTC conversions for the ingest paths.
+
+Building an astropy Time object for every hop message is expensive (and can trigger a check of the
+astropy leap-second table), so this module converts GPS seconds to UTC with plain integer arithmetic
+against an embedded leap-second table. Scalars are converted to timezone aware datetimes and NumPy
+arrays to datetime64[us] arrays, matching astropy's Time(gps, format='gps').datetime to the
+microsecond for any GPS time from the GPS epoch up to LEAP_SECONDS_EXPIRES.
+
+The table needs updating whenever IERS Bulletin C announces a new leap second. Either edit
+LEAP_SECONDS / LEAP_SECONDS_EXPIRES below or call set_leap_seconds() at startup.
+
+MJD (UTC) arrays, as returned by schedule services, are converted to datetime64[us] arrays in a single
+NumPy operation with mjd_to_datetime64().
+"""
+from bisect import bisect_right
+from calendar import timegm
+from datetime import date, datetime, timedelta, timezone
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Unix timestamp of the GPS epoch, 1980-01-06T00:00:00Z
+GPS_EPOCH_UNIX = 315964800
+GPS_EPOCH = datetime(1980, 1, 6, tzinfo=timezone.utc)
+# GPS time is a fixed 19 seconds behind TAI
+GPS_TAI_OFFSET = 19
+# MJD of the Unix epoch, 1970-01-01T00:00:00Z
+MJD_UNIX_EPOCH = 40587
+MICROSECONDS_PER_DAY = 86400 * 1000000
+
+# (UTC date the new offset applies from, TAI-UTC in seconds) for every leap second since the GPS epoch
+LEAP_SECONDS = [
+    (date(1981, 7, 1), 20),
+    (date(1982, 7, 1), 21),
+    (date(1983, 7, 1), 22),
+    (date(1985, 7, 1), 23),
+    (date(1988, 1, 1), 24),
+    (date(1990, 1, 1), 25),
+    (date(1991, 1, 1), 26),
+    (date(1992, 7, 1), 27),
+    (date(1993, 7, 1), 28),
+    (date(1994, 7, 1), 29),
+    (date(1996, 1, 1), 30),
+    (date(1997, 7, 1), 31),
+    (date(1999, 1, 1), 32),
+    (date(2006, 1, 1), 33),
+    (date(2009, 1, 1), 34),
+    (date(2012, 7, 1), 35),
+    (date(2015, 7, 1), 36),
+    (date(2017, 1, 1), 37),
+]
+# The table is known to be complete up until this date (from IERS Bulletin C)
+LEAP_SECONDS_EXPIRES = date(2027, 6, 28)
+
+# GPS seconds at which each leap second in the table ends, and the GPS-UTC offset from that point on.
+# These are derived from LEAP_SECONDS by set_leap_seconds()
+_gps_thresholds = []
+_gps_offsets = []
+_gps_thresholds_array = np.array([], dtype=np.int64)
+_gps_offsets_array = np.array([], dtype=np.int64)
+_gps_expires = 0
+_expires = LEAP_SECONDS_EXPIRES
+_warned_expired = False
+
+
+def set_leap_seconds(leap_seconds: list, expires: date):
+    """Replace the leap-second table used for conversions
+
+    Parameters:
+        leap_seconds: list of (date, TAI-UTC seconds) tuples in increasing date order
+        expires: date up until which the table is known to be complete
+    """
+    global _gps_thresholds, _gps_offsets, _gps_thresholds_array, _gps_offsets_array, _gps_expires, _expires
+    global _warned_expired
+    thresholds = [0]
+    offsets = [0]
+    for leap_date, tai_utc in leap_seconds:
+        gps_utc = tai_utc - GPS_TAI_OFFSET
+        thresholds.append(_unix_seconds(leap_date) - GPS_EPOCH_UNIX + gps_utc)
+        offsets.append(gps_utc)
+    _gps_thresholds = thresholds
+    _gps_offsets = offsets
+    _gps_thresholds_array = np.array(thresholds, dtype=np.int64)
+    _gps_offsets_array = np.array(offsets, dtype=np.int64)
+    _gps_expires = _unix_seconds(expires) - GPS_EPOCH_UNIX + offsets[-1]
+    _expires = expires
+    _warned_expired = False
+
+
+def _unix_seconds(day: date) -> int:
+    return timegm(day.timetuple())
+
+
+def _check_expiry(latest_gps):
+    global _warned_expired
+    if latest_gps >= _gps_expires and not _warned_expired:
+        _warned_expired = True
+        logger.warning(f'Converting GPS times past the leap-second table expiry of {_expires}; '
+                       'update heroic_api.time_conversions.LEAP_SECONDS if a new leap second was announced.')
+
+
+def gps_to_datetime(gps_time: float) -> datetime:
+    """Convert a GPS time in seconds into a timezone aware UTC datetime
+
+    Raises a ValueError for times before the GPS epoch or within a leap second, since datetime
+    cannot represent those.
+    """
+    if gps_time < 0:
+        raise ValueError(f'GPS time {gps_time} is before the GPS epoch')
+    whole_seconds = int(gps_time // 1)
+    microseconds = round((gps_time - whole_seconds) * 1e6)
+    if microseconds == 1000000:
+        # Rounding to the microsecond can carry into the next second
+        whole_seconds += 1
+        microseconds = 0
+    index = bisect_right(_gps_thresholds, whole_seconds) - 1
+    if index + 1 < len(_gps_thresholds) and whole_seconds == _gps_thresholds[index + 1] - 1:
+        raise ValueError(f'GPS time {gps_time} is within a leap second, which datetime does not support')
+    _check_expiry(whole_seconds)
+    return GPS_EPOCH + timedelta(seconds=whole_seconds - _gps_offsets[index], microseconds=microseconds)
+
+
+def gps_to_datetime64(gps_times) -> np.ndarray:
+    """Convert an array of GPS times in seconds into a numpy datetime64[us] array of UTC times
+
+    Raises a ValueError if any time is before the GPS epoch or within a leap second.
+    """
+    gps_times = np.asarray(gps_times, dtype=np.float64)
+    if gps_times.size == 0:
+        return np.array([], dtype='datetime64[us]').reshape(gps_times.shape)
+    if np.any(gps_times < 0):
+        raise ValueError('GPS times before the GPS epoch cannot be converted')
+    whole_seconds = np.floor(gps_times)
+    microseconds = np.rint((gps_times - whole_seconds) * 1e6).astype(np.int64)
+    whole_seconds = whole_seconds.astype(np.int64)
+    # Rounding to the microsecond can carry into the next second
+    carry = microseconds == 1000000
+    whole_seconds = whole_seconds + carry
+    microseconds = np.where(carry, 0, microseconds)
+    index = np.searchsorted(_gps_thresholds_array, whole_seconds, side='right') - 1
+    # The second before each threshold is the leap second itself
+    next_index = np.minimum(index + 1, len(_gps_thresholds_array) - 1)
+    if np.any((next_index > index) & (whole_seconds == _gps_thresholds_array[next_index] - 1)):
+        raise ValueError('GPS times within a leap second cannot be converted')
+    _check_expiry(int(whole_seconds.max()))
+    unix_seconds = whole_seconds - _gps_offsets_array[index] + GPS_EPOCH_UNIX
+    return (unix_seconds * 1000000 + microseconds).astype('datetime64[us]')
+
+
+def mjd_to_datetime64(mjds) -> np.ndarray:
+    """Convert an array of UTC Modified Julian Dates into a numpy datetime64[us] array of UTC times
+
+    Days are treated as 86400 seconds long, so times within a day containing a leap second can differ
+    from astropy's Time(mjd, format='mjd').datetime by up to a second.
+    """
+    mjds = np.asarray(mjds, dtype=np.float64)
+    days = np.floor(mjds)
+    microseconds = np.rint((mjds - days) * MICROSECONDS_PER_DAY).astype(np.int64)
+    return ((days.astype(np.int64) - MJD_UNIX_EPOCH) * MICROSECONDS_PER_DAY + microseconds).astype('datetime64[us]')
+
+
+def datetime64_to_datetimes(times: np.ndarray) -> list:
+    """Convert a datetime64 array into a list of timezone aware UTC datetimes"""
+    return [time.replace(tzinfo=timezone.utc) for time in times.astype('datetime64[us]').tolist()]
+
+
+set_leap_seconds(LEAP_SECONDS, LEAP_SECONDS_EXPIRES)
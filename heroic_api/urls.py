@@ -6,7 +6,8 @@ from heroic_api.viewsets import (
     PlannedTelescopeStatusViewSet, PlannedInstrumentCapabilityViewSet
 )
 from heroic_api.views import (ProfileAPIView, TargetVisibilityAPIView, TargetAirmassAPIView,
-                              RevokeApiTokenApiView, GWVisibilityAPIView, SkyMapVisibilityAPIView)
+                              RevokeApiTokenApiView, GWVisibilityAPIView, SkyMapVisibilityAPIView, ChangesAPIView,
+                              SnapshotAPIView, change_event_stream_view)
 
 
 router = DefaultRouter()
@@ -28,4 +29,7 @@ urlpatterns = [
     re_path(r'visibility/airmass', TargetAirmassAPIView.as_view(), name='visibility-airmass'),
     re_path(r'visibility/skymap', SkyMapVisibilityAPIView.as_view(), name='visibility-skymap'),
     re_path(r'visibility/gw', GWVisibilityAPIView.as_view(), name='visibility-gw'),
+    re_path(r'changes/stream', change_event_stream_view, name='changes-stream'),
+    re_path(r'changes', ChangesAPIView.as_view(), name='changes'),
+    re_path(r'snapshot', SnapshotAPIView.as_view(), name='snapshot'),
 ]
@@ -4,9 +4,11 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.settings import api_settings
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiExample
 
 from django.contrib.auth.models import User
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.generic import RedirectView
 from django.conf import settings
 import requests
@@ -15,10 +17,19 @@ from heroic_api.serializers import (ProfileSerializer, TargetVisibilityQuerySeri
                                     TargetVisibilityIntervalResponseSerializer,
                                     TargetVisibilityAirmassResponseSerializer,
                                     SkyMapVisibilityQuerySerializer, SkyMapVisibilityResponseSerializer,
-                                    GWVisibilityQuerySerializer, GWVisibilityResponseSerializer)
+                                    GWVisibilityQuerySerializer, GWVisibilityResponseSerializer,
+                                    ChangeFeedQuerySerializer, ChangeFeedResponseSerializer,
+                                    SnapshotQuerySerializer, SnapshotResponseSerializer)
 from heroic_api.visibility import (get_rise_set_intervals_by_telescope_for_target, get_airmass_by_telescope_for_target,
                                    get_skymap_fractional_visibility_by_telescope)
 from heroic_api.gw_calculations import calculate_gw_visibility_timeline
+from heroic_api.response_cache import cached_result
+from heroic_api.changes import get_changes
+from heroic_api.snapshot import get_snapshot
+from heroic_api.etags import conditional_response
+from heroic_api.event_stream import stream_change_events
+from heroic_api.metrics import generate_metrics, metrics_available
+from heroic_api.renderers import COMPACT_RENDERER_CLASSES, packed_array, packed_times
 from heroic_api.models import TelescopeStatus
 
 import logging
@@ -54,7 +65,9 @@ class TargetVisibilityAPIView(APIView):
         serializer = TargetVisibilityQuerySerializer(data=data)
         if serializer.is_valid():
             data = serializer.validated_data
-            visibility_intervals = get_rise_set_intervals_by_telescope_for_target(data)
+            visibility_intervals = cached_result(
+                'target_visibility', data, lambda: get_rise_set_intervals_by_telescope_for_target(data)
+            )
             return Response(visibility_intervals, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -93,6 +106,7 @@ class TargetAirmassAPIView(APIView):
         Supports being called through POST with a data dict or GET with query params
     """
     serializer_class = TargetVisibilityQuerySerializer
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, *COMPACT_RENDERER_CLASSES)
     example_response = {
         'telescope_id': {'times': ['2025-03-01T16:15:00Z', '2025-03-01T16:25:00.00Z', '2025-03-01T16:35:00.00Z'],
                          'airmasses': [1.2342, 1.34543, 1.4564]
@@ -102,11 +116,18 @@ class TargetAirmassAPIView(APIView):
                         },
         }
 
+    def compact_response(self, data):
+        """ Times as int64 milliseconds since the Unix epoch and airmasses as float32, for compact encodings
+        """
+        return {telescope_id: {'times': packed_times(airmass_data['times']),
+                               'airmasses': packed_array(airmass_data['airmasses'], '<f4')}
+                for telescope_id, airmass_data in data.items()}
+
     def get_airmass(self, data):
         serializer = TargetVisibilityQuerySerializer(data=data)
         if serializer.is_valid():
             data = serializer.validated_data
-            airmass_data = get_airmass_by_telescope_for_target(data)
+            airmass_data = cached_result('target_airmass', data, lambda: get_airmass_by_telescope_for_target(data))
             return Response(airmass_data, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -145,6 +166,7 @@ class SkyMapVisibilityAPIView(APIView):
     """ A API view to get healpix RING scheme fractional visibility maps for telescopes over a time range
     """
     serializer_class = SkyMapVisibilityQuerySerializer
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, *COMPACT_RENDERER_CLASSES)
     example_response = {
         'telescope_id': {
             'nside': 64,
@@ -158,12 +180,22 @@ class SkyMapVisibilityAPIView(APIView):
             'skymap': [0.0, 0.23, 0.45, 0.55, 0.66]}
     }
 
+    def compact_response(self, data):
+        """ Each MOC's healpix cells as uint64, for compact encodings
+        """
+        return {telescope_id: {**skymap, 'moc': {
+            upper_bound: {order: packed_array(cells, '<u8') for order, cells in moc.items()}
+            for upper_bound, moc in skymap['moc'].items()
+        }} for telescope_id, skymap in data.items()}
+
     def get_visibility(self, data):
         serializer = SkyMapVisibilityQuerySerializer(data=data)
         if serializer.is_valid():
             data = serializer.validated_data
             try:
-                skymap_visibility_by_telescope = get_skymap_fractional_visibility_by_telescope(data)
+                skymap_visibility_by_telescope = cached_result(
+                    'skymap_visibility', data, lambda: get_skymap_fractional_visibility_by_telescope(data)
+                )
                 return Response(skymap_visibility_by_telescope, status=status.HTTP_200_OK)
             except Exception as e:
                 return Response({'error': repr(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -239,9 +271,159 @@ class RevokeApiTokenApiView(APIView):
         return 'revokeApiToken'
 
 
+class ChangesAPIView(APIView):
+    """ A API view for the feed of changes to telescope statuses, instrument capabilities, their planned
+        versions and telescope pointings. Clients sync by passing the cursor from each response to the next query.
+    """
+    @extend_schema(
+        operation_id='query changes',
+        parameters=[ChangeFeedQuerySerializer],
+        responses={200: ChangeFeedResponseSerializer}
+    )
+    def get(self, request):
+        serializer = ChangeFeedQuerySerializer(data=request.query_params)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            changes = get_changes(data.get('cursor', 0), data['limit'], data.get('telescope'), data.get('object_type'))
+            return Response(changes, status=status.HTTP_200_OK)
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class SnapshotAPIView(APIView):
+    """ A API view for the status of every telescope and capability of every instrument at a time, or now.
+        Snapshots of now may be up to a few seconds old, but never older than the latest write. Responses
+        have ETags built from the data versions of the telescopes in them, for conditional GETs.
+    """
+    @extend_schema(
+        operation_id='query snapshot',
+        parameters=[SnapshotQuerySerializer],
+        responses={200: SnapshotResponseSerializer}
+    )
+    def get(self, request):
+        serializer = SnapshotQuerySerializer(data=request.query_params)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            return conditional_response(
+                request,
+                lambda: Response(get_snapshot(data.get('time'), data.get('telescope')), status=status.HTTP_200_OK),
+                time_bucket=None if data.get('time') else settings.ETAG_TIME_BUCKET_SECONDS,
+                telescope_ids=data.get('telescope') or (),
+                global_version=not data.get('telescope')
+            )
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+async def change_event_stream_view(request):
+    """ Server-Sent Events stream of the changes in the change feed, as they happen. Takes the same telescope
+        and object_type filters as the change feed, and replays the changes after the Last-Event-ID header or
+        cursor query parameter first. Must be served through the ASGI app.
+    """
+    params = request.GET.copy()
+    if request.headers.get('Last-Event-ID'):
+        params['cursor'] = request.headers['Last-Event-ID']
+    serializer = ChangeFeedQuerySerializer(data=params)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+    response = StreamingHttpResponse(
+        stream_change_events(data.get('cursor'), data.get('telescope'), data.get('object_type')),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics_view(request):
+    """ Prometheus metrics of the visibility, GW and ingest hot paths, aggregated across the gunicorn workers.
+        This is scraped from inside the deployment network and is not routed through nginx.
+    """
+    if not metrics_available():
+        raise Http404('Metrics are not enabled')
+    body, content_type = generate_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+
+def get_gw_visibility(data: dict) -> dict:
+    """Calculate the GW network visibility response for validated GWVisibilityQuerySerializer data"""
+    # Get telescope status data for the time range
+    telescopes_status = {}
+    for telescope in data['telescopes']:
+        # Get all status changes in the time range
+        statuses_in_range = TelescopeStatus.objects.filter(
+            telescope=telescope,
+            date__gte=data['start'],
+            date__lte=data['end']
+            ).order_by('date')
+        status_before = TelescopeStatus.objects.filter(
+            telescope=telescope,
+            date__lt=data['start']
+            ).first()
+        if (status_before):
+            statuses_in_range |= TelescopeStatus.objects.filter(id=status_before.id)
+
+        # Convert to intervals
+        status_intervals = []
+        for i, status in enumerate(statuses_in_range):
+            interval = {
+                'start': status.date,
+                'status': status.status,
+                'sensitivity': status.extra.get('sensitivity', '0')
+            }
+            # Set end time to next status or query end
+            if i + 1 < len(statuses_in_range):
+                interval['end'] = statuses_in_range[i + 1].date
+            else:
+                interval['end'] = data['end']
+
+            status_intervals.append(interval)
+
+        telescopes_status[telescope.id] = status_intervals
+
+    # Calculate GW visibility timeline
+    timeline = calculate_gw_visibility_timeline(
+        telescopes_status,
+        data['ra'],
+        data['dec'],
+        data['start'],
+        data['end'],
+        data.get('time_resolution_minutes', 15)
+    )
+
+    response_data = {
+        'query_info': {
+            'ra': data['ra'],
+            'dec': data['dec'],
+            'start': data['start'].isoformat(),
+            'end': data['end'].isoformat(),
+            'telescopes': [t.id for t in data['telescopes']],
+            'time_resolution_minutes': data.get('time_resolution_minutes', 15)
+        },
+        'timeline': timeline
+    }
+    return response_data
+
+
 class GWVisibilityAPIView(APIView):
     """API view to get GW network visibility for a sky position over time"""
     serializer_class = GWVisibilityQuerySerializer
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, *COMPACT_RENDERER_CLASSES)
+
+    def compact_response(self, data):
+        """ The timeline as columns rather than a list of entries, with its times as int64 milliseconds since the
+            Unix epoch, distances as float32 and network counts as int32, for compact encodings
+        """
+        timeline = data['timeline']
+        return {**data, 'timeline': {
+            'time': packed_times([entry['time'] for entry in timeline]),
+            'max_distance_snr10_mpc': packed_array([entry['max_distance_snr10_mpc'] for entry in timeline], '<f4'),
+            'active_detectors': [entry['active_detectors'] for entry in timeline],
+            'network_count': packed_array([entry['network_count'] for entry in timeline], '<i4'),
+            'detector_details': [entry['detector_details'] for entry in timeline],
+        }}
     
     @extend_schema(
         request=GWVisibilityQuerySerializer,
@@ -269,62 +451,8 @@ class GWVisibilityAPIView(APIView):
             data = serializer.validated_data
             
             try:
-                # Get telescope status data for the time range
-                telescopes_status = {}
-                for telescope in data['telescopes']:
-                    # Get all status changes in the time range
-                    statuses_in_range = TelescopeStatus.objects.filter(
-                        telescope=telescope,
-                        date__gte=data['start'],
-                        date__lte=data['end']
-                        ).order_by('date')
-                    status_before = TelescopeStatus.objects.filter(
-                        telescope=telescope,
-                        date__lt=data['start']
-                        ).first()
-                    if (status_before):
-                        statuses_in_range |= TelescopeStatus.objects.filter(id=status_before.id)
-
-                    # Convert to intervals
-                    status_intervals = []
-                    for i, status in enumerate(statuses_in_range):
-                        interval = {
-                            'start': status.date,
-                            'status': status.status,
-                            'sensitivity': status.extra.get('sensitivity', '0')
-                        }
-                        # Set end time to next status or query end
-                        if i + 1 < len(statuses_in_range):
-                            interval['end'] = statuses_in_range[i + 1].date
-                        else:
-                            interval['end'] = data['end']
-                        
-                        status_intervals.append(interval)
-
-                    telescopes_status[telescope.id] = status_intervals
-                
-                # Calculate GW visibility timeline
-                timeline = calculate_gw_visibility_timeline(
-                    telescopes_status,
-                    data['ra'],
-                    data['dec'],
-                    data['start'],
-                    data['end'],
-                    data.get('time_resolution_minutes', 15)
-                )
-                
-                response_data = {
-                    'query_info': {
-                        'ra': data['ra'],
-                        'dec': data['dec'],
-                        'start': data['start'].isoformat(),
-                        'end': data['end'].isoformat(),
-                        'telescopes': [t.id for t in data['telescopes']],
-                        'time_resolution_minutes': data.get('time_resolution_minutes', 15)
-                    },
-                    'timeline': timeline
-                }
-                
+                response_data = cached_result('gw_visibility', data, lambda: get_gw_visibility(data))
+
                 from rest_framework import status as http_status
                 return Response(response_data, status=http_status.HTTP_200_OK)
             except Exception as e:
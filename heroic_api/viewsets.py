@@ -1,39 +1,153 @@
+from django.conf import settings
+from django.db.models import Prefetch
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework import status
-from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiResponse
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiExample, OpenApiParameter, OpenApiResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 
+from heroic_api.etags import ConditionalGetMixin
+from heroic_api.export import EXPORT_CONTENT_TYPES, TelescopePointingExport, TelescopeStatusExport, export_response
 from heroic_api.visibility import telescope_dark_intervals
 from heroic_api.filters import (TelescopeFilter, InstrumentFilter, TelescopeStatusFilter, InstrumentCapabilityFilter,
                                 TelescopePointingFilter, PlannedTelescopeStatusFilter, PlannedInstrumentCapabilityFilter)
 from heroic_api.models import (Observatory, Site, Telescope, Instrument, TelescopeStatus, InstrumentCapability,
                                TelescopePointing, PlannedTelescopeStatus, PlannedInstrumentCapability)
 from heroic_api.serializers import (
-    ObservatorySerializer, SiteSerializer, TelescopeSerializer, TelescopeDarkIntervalsSerializer,
+    FieldSelection, ObservatorySerializer, SiteSerializer, TelescopeSerializer, TelescopeDarkIntervalsSerializer,
     InstrumentSerializer, TelescopeStatusSerializer, InstrumentCapabilitySerializer, TelescopePointingSerializer,
-    TelescopeDarkIntervalResponseSerializer, PlannedTelescopeStatusSerializer, PlannedInstrumentCapabilitySerializer
+    TelescopeDarkIntervalResponseSerializer, PlannedTelescopeStatusSerializer, PlannedInstrumentCapabilitySerializer,
+    TelescopeStatusValuesSerializer, TelescopePointingValuesSerializer, InstrumentCapabilityValuesSerializer
 )
+from heroic_api.pagination import (HistoryCursorPagination, PlannedCursorPagination, PointingCursorPagination,
+                                   history_response)
 from heroic_api.permissions import IsObservatoryAdminOrReadOnly, IsAdminOrReadOnly
+from heroic_api.renderers import FastJSONRenderer, PassthroughRenderer, ProfiledJSONRenderer
 
 
-class ObservatoryViewSet(viewsets.ModelViewSet):
+# Querysets that load everything the nested serializers need up front, so serializing a whole fleet of
+# observatories, sites, telescopes and instruments takes the same number of queries however large it is.
+# Nested objects left out by the request's FieldSelection aren't loaded, and ones that aren't expanded
+# only have their ids loaded. Prefetching telescopes through their site also sets each telescope's site,
+# used for its next_twilight.
+def _prefetch_nested(selection: FieldSelection, path: tuple, name: str, queryset_func, ids_queryset) -> list:
+    if not selection.includes(path, name):
+        return []
+    if not selection.expands(path, name):
+        return [Prefetch(name, queryset=ids_queryset)]
+    return [Prefetch(name, queryset=queryset_func(selection, path + (name,)))]
+
+
+def instrument_queryset(selection: FieldSelection, path: tuple = ()):
+    return Instrument.objects.select_related('current_capability')
+
+
+def telescope_queryset(selection: FieldSelection, path: tuple = ()):
+    return Telescope.objects.select_related('current_status').prefetch_related(*_prefetch_nested(
+        selection, path, 'instruments', instrument_queryset, Instrument.objects.only('id', 'telescope')
+    ))
+
+
+def site_queryset(selection: FieldSelection, path: tuple = ()):
+    return Site.objects.prefetch_related(*_prefetch_nested(
+        selection, path, 'telescopes', telescope_queryset, Telescope.objects.only('id', 'site')
+    ))
+
+
+def observatory_queryset(selection: FieldSelection, path: tuple = ()):
+    return Observatory.objects.prefetch_related(*_prefetch_nested(
+        selection, path, 'sites', site_queryset, Site.objects.only('id', 'observatory')
+    ))
+
+
+def filter_history(request, filterset_class, queryset):
+    """Filter a telescope or instrument history action's queryset by time window, like the history endpoints"""
+    filterset = filterset_class(request.query_params, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    return filterset.qs
+
+
+class ValuesListMixin:
+    """ Viewset mixin listing through values_serializer (see heroic_api.serializers.ValuesSerializer) rather than
+        serializer_class, and rendering with orjson, for the list endpoints of large histories
+    """
+    values_serializer = None
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    def list(self, request, *args, **kwargs):
+        rows = self.values_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.values_serializer.many(page))
+        return Response(self.values_serializer.many(rows))
+
+
+class ExportMixin:
+    """ Viewset mixin adding a streaming bulk export of the viewset's history (see heroic_api.export),
+        at <list url>/export/<csv|ndjson|parquet>/, taking the same filters as the list
+    """
+    export_table = None
+
+    @extend_schema(
+        description='Stream every row matching the filters, oldest first, as CSV, NDJSON or Parquet',
+        responses={(200, content_type): OpenApiResponse(description='The exported rows')
+                   for content_type in EXPORT_CONTENT_TYPES.values()}
+    )
+    @action(detail=False, methods=['get'], url_path=f'export/(?P<export_format>{"|".join(EXPORT_CONTENT_TYPES)})',
+            renderer_classes=[ProfiledJSONRenderer, PassthroughRenderer], pagination_class=None)
+    def export(self, request, export_format=None):
+        queryset = filter_history(request, self.filterset_class, self.get_queryset())
+        return export_response(queryset, self.export_table, export_format, self.basename)
+
+
+field_selection_schema = extend_schema(parameters=[
+    OpenApiParameter('fields', str, description='Comma separated fields to include. Nested fields are '
+                     'separated by dots, e.g. id,sites.telescopes.status'),
+    OpenApiParameter('omit', str, description='Comma separated fields to leave out, e.g. sites.telescopes.next_twilight'),
+    OpenApiParameter('expand', str, description='Comma separated nested objects to expand, e.g. sites.telescopes. '
+                     'Other nested objects are returned as lists of ids. Everything is expanded if this is not set'),
+])
+
+
+@extend_schema_view(list=field_selection_schema, retrieve=field_selection_schema)
+class ObservatoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Observatory.objects.all()
+    etag_related_sources = ((Site, 'modified', 'observatory'), (Telescope, 'modified', 'site__observatory'),
+                            (Instrument, 'modified', 'telescope__site__observatory'))
+    etag_telescope_field = 'sites__telescopes'
+    etag_time_bucket = settings.ETAG_TIME_BUCKET_SECONDS
     serializer_class = ObservatorySerializer
     permission_classes = [IsAdminOrReadOnly]
 
+    def get_queryset(self):
+        return observatory_queryset(FieldSelection.from_request(self.request))
+
 
-class SiteViewSet(viewsets.ModelViewSet):
+@extend_schema_view(list=field_selection_schema, retrieve=field_selection_schema)
+class SiteViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     lookup_value_regex = '[^/]+'
     queryset = Site.objects.all()
+    etag_related_sources = ((Telescope, 'modified', 'site'), (Instrument, 'modified', 'telescope__site'))
+    etag_telescope_field = 'telescopes'
+    etag_time_bucket = settings.ETAG_TIME_BUCKET_SECONDS
     serializer_class = SiteSerializer
     permission_classes = [IsObservatoryAdminOrReadOnly]
 
+    def get_queryset(self):
+        return site_queryset(FieldSelection.from_request(self.request))
 
-class TelescopeViewSet(viewsets.ModelViewSet):
+
+@extend_schema_view(list=field_selection_schema, retrieve=field_selection_schema)
+class TelescopeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     lookup_value_regex = '[^/]+'
     queryset = Telescope.objects.all()
+    etag_related_sources = ((Instrument, 'modified', 'telescope'),)
+    etag_telescope_field = 'pk'
+    etag_time_bucket = settings.ETAG_TIME_BUCKET_SECONDS
     serializer_class = TelescopeSerializer
     permission_classes = [IsObservatoryAdminOrReadOnly]
     filterset_class = TelescopeFilter
@@ -49,6 +163,9 @@ class TelescopeViewSet(viewsets.ModelViewSet):
         ],
     }
     
+    def get_queryset(self):
+        return telescope_queryset(FieldSelection.from_request(self.request)).select_related('site')
+
     def get_serializer_class(self):
         if 'dark_intervals' in self.action:
             return TelescopeDarkIntervalsSerializer
@@ -152,11 +269,12 @@ class TelescopeViewSet(viewsets.ModelViewSet):
            )
         },
     )
-    @action(detail=True, methods=['get', 'post'], pagination_class=None)
+    @action(detail=True, methods=['get', 'post'], pagination_class=HistoryCursorPagination)
     def status(self, request, pk=None):
         if request.method == 'GET':
-            serializer = TelescopeStatusSerializer(self.get_object().statuses.all(), many=True)
-            return Response(data=serializer.data, status=status.HTTP_200_OK)
+            telescope = self.get_object()
+            statuses = filter_history(request, TelescopeStatusFilter, telescope.statuses.all())
+            return history_response(request, self, statuses, TelescopeStatusSerializer, self.pagination_class)
         elif request.method == 'POST':
             data = request.data
             data['telescope'] = pk
@@ -174,11 +292,13 @@ class TelescopeViewSet(viewsets.ModelViewSet):
            )
         },
     )
-    @action(detail=True, methods=['get', 'post'], pagination_class=None)
+    @action(detail=True, methods=['get', 'post'], pagination_class=PlannedCursorPagination)
     def planned_status(self, request, pk=None):
         if request.method == 'GET':
-            serializer = PlannedTelescopeStatusSerializer(self.get_object().planned_statuses.all(), many=True)
-            return Response(data=serializer.data, status=status.HTTP_200_OK)
+            telescope = self.get_object()
+            planned_statuses = filter_history(request, PlannedTelescopeStatusFilter, telescope.planned_statuses.all())
+            return history_response(request, self, planned_statuses, PlannedTelescopeStatusSerializer,
+                                    self.pagination_class)
         elif request.method == 'POST':
             data = request.data
             data['telescope'] = pk
@@ -189,14 +309,19 @@ class TelescopeViewSet(viewsets.ModelViewSet):
             else:
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class InstrumentViewSet(viewsets.ModelViewSet):
+@extend_schema_view(list=field_selection_schema, retrieve=field_selection_schema)
+class InstrumentViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     lookup_value_regex = '[^/]+'
     queryset = Instrument.objects.all()
+    etag_telescope_field = 'telescope'
     serializer_class = InstrumentSerializer
     permission_classes = [IsObservatoryAdminOrReadOnly]
     filterset_class = InstrumentFilter
     filter_backends = (DjangoFilterBackend,)
 
+    def get_queryset(self):
+        return instrument_queryset(FieldSelection.from_request(self.request))
+
     @extend_schema(
         responses={
             200: OpenApiResponse(
@@ -204,11 +329,13 @@ class InstrumentViewSet(viewsets.ModelViewSet):
            )
         },
     )
-    @action(detail=True, methods=['get', 'post'], pagination_class=None)
+    @action(detail=True, methods=['get', 'post'], pagination_class=HistoryCursorPagination)
     def capabilities(self, request, pk=None):
         if request.method == 'GET':
-            serializer = InstrumentCapabilitySerializer(self.get_object().capabilities.all(), many=True)
-            return Response(data=serializer.data, status=status.HTTP_200_OK)
+            instrument = self.get_object()
+            capabilities = filter_history(request, InstrumentCapabilityFilter, instrument.capabilities.all())
+            return history_response(request, self, capabilities, InstrumentCapabilitySerializer,
+                                    self.pagination_class)
         elif request.method == 'POST':
             data = request.data
             data['instrument'] = pk
@@ -226,11 +353,15 @@ class InstrumentViewSet(viewsets.ModelViewSet):
            )
         },
     )
-    @action(detail=True, methods=['get', 'post'], pagination_class=None)
+    @action(detail=True, methods=['get', 'post'], pagination_class=PlannedCursorPagination)
     def planned_capabilities(self, request, pk=None):
         if request.method == 'GET':
-            serializer = PlannedInstrumentCapabilitySerializer(self.get_object().planned_capabilities.all(), many=True)
-            return Response(data=serializer.data, status=status.HTTP_200_OK)
+            instrument = self.get_object()
+            planned_capabilities = filter_history(
+                request, PlannedInstrumentCapabilityFilter, instrument.planned_capabilities.all()
+            )
+            return history_response(request, self, planned_capabilities, PlannedInstrumentCapabilitySerializer,
+                                    self.pagination_class)
         elif request.method == 'POST':
             data = request.data
             data['instrument'] = pk
@@ -242,12 +373,15 @@ class InstrumentViewSet(viewsets.ModelViewSet):
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TelescopeStatusViewSet(viewsets.ModelViewSet):
+class TelescopeStatusViewSet(ExportMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = TelescopeStatus.objects.all()
     serializer_class = TelescopeStatusSerializer
     permission_classes = [IsObservatoryAdminOrReadOnly]
     filterset_class = TelescopeStatusFilter
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = HistoryCursorPagination
+    export_table = TelescopeStatusExport()
+    values_serializer = TelescopeStatusValuesSerializer()
 
 
 class PlannedTelescopeStatusViewSet(viewsets.ModelViewSet):
@@ -256,22 +390,28 @@ class PlannedTelescopeStatusViewSet(viewsets.ModelViewSet):
     permission_classes = [IsObservatoryAdminOrReadOnly]
     filterset_class = PlannedTelescopeStatusFilter
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = PlannedCursorPagination
 
 
-class TelescopePointingViewSet(viewsets.ModelViewSet):
+class TelescopePointingViewSet(ExportMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = TelescopePointing.objects.all()
     serializer_class = TelescopePointingSerializer
     permission_classes = [IsObservatoryAdminOrReadOnly]
     filterset_class = TelescopePointingFilter
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = PointingCursorPagination
+    export_table = TelescopePointingExport()
+    values_serializer = TelescopePointingValuesSerializer()
 
 
-class InstrumentCapabilityViewSet(viewsets.ModelViewSet):
+class InstrumentCapabilityViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = InstrumentCapability.objects.all()
     serializer_class = InstrumentCapabilitySerializer
     permission_classes = [IsObservatoryAdminOrReadOnly]
     filterset_class = InstrumentCapabilityFilter
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = HistoryCursorPagination
+    values_serializer = InstrumentCapabilityValuesSerializer()
 
 
 class PlannedInstrumentCapabilityViewSet(viewsets.ModelViewSet):
@@ -280,3 +420,4 @@ class PlannedInstrumentCapabilityViewSet(viewsets.ModelViewSet):
     permission_classes = [IsObservatoryAdminOrReadOnly]
     filterset_class = PlannedInstrumentCapabilityFilter
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = PlannedCursorPagination
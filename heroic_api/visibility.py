@@ -3,6 +3,8 @@ from datetime import datetime, timedelta
 from django.utils import timezone
 import numpy as np
 
+from heroic_api.metrics import count_skymap_pixels
+from heroic_api.profiling import profiled, span
 from heroic_api.models import Telescope, TargetTypes, PlannedInstrumentCapability, PlannedTelescopeStatus, TelescopeStatus, InstrumentCapability, Instrument
 
 from rise_set.astrometry import (
@@ -38,25 +40,29 @@ def get_rise_set_intervals_by_telescope_for_target(data: dict) -> dict:
         rise_set_site = get_rise_set_site(telescope)
         visibility = get_rise_set_visibility(rise_set_site, start, end, telescope)
         try:
-            target_intervals = visibility.get_observable_intervals(
-                rise_set_target,
-                airmass=data['max_airmass'],
-                moon_distance=Angle(
-                    degrees=data['min_lunar_distance']
-                ),
-                moon_phase=data.get('max_lunar_phase', 1.0)
-            )
+            with span('observable_intervals'):
+                target_intervals = visibility.get_observable_intervals(
+                    rise_set_target,
+                    airmass=data['max_airmass'],
+                    moon_distance=Angle(
+                        degrees=data['min_lunar_distance']
+                    ),
+                    moon_phase=data.get('max_lunar_phase', 1.0)
+                )
             # Use the intervals library to coaslesce adjacent intervals for non-sidereal targets since they are sampled
             # Will probably use more things in Intervals later to intersect/union intervals together
-            target_intervals = Intervals(target_intervals)
+            with span('interval_math'):
+                target_intervals = Intervals(target_intervals)
             # Now attempt to filter out current or historical periods of telescope or instrument UNAVAILABILITY
             if data['include_status']:
                 unavailable_intervals = get_telescope_unavailable_intervals(start, end, telescope.id)
-                target_intervals = target_intervals.subtract(unavailable_intervals)
+                with span('interval_math'):
+                    target_intervals = target_intervals.subtract(unavailable_intervals)
             # Now attempt to filter out planned future periods of telescope or instrument UNAVAILABILITY
             if data['include_planned_status']:
                 unavailable_intervals = get_telescope_future_unavailable_intervals(start, end, telescope.id)
-                target_intervals = target_intervals.subtract(unavailable_intervals)
+                with span('interval_math'):
+                    target_intervals = target_intervals.subtract(unavailable_intervals)
             intervals_by_telescope[telescope.id] = target_intervals.toTupleList()
         except MovingViolation:
             pass
@@ -64,6 +70,7 @@ def get_rise_set_intervals_by_telescope_for_target(data: dict) -> dict:
     return intervals_by_telescope
 
 
+@profiled('unavailable_intervals')
 def get_telescope_unavailable_intervals(start, end, telescope_id):
     """ Get the set of past intervals where the telescope is unavailable or all its instruments are unavailable
     """
@@ -131,6 +138,7 @@ def get_telescope_unavailable_intervals(start, end, telescope_id):
     return unavailable_intervals
 
 
+@profiled('unavailable_intervals')
 def get_telescope_future_unavailable_intervals(start, end, telescope_id):
     """ Get the set of future intervals where the telescope is unavailable or all its instruments are unavailable
     """
@@ -198,6 +206,7 @@ def get_rise_set_site(telescope: Telescope):
     }
 
 
+@profiled('rise_set_visibility')
 def get_rise_set_visibility(rise_set_site: dict, start: datetime, end: datetime, telescope: Telescope):
     # Get rise set Visibility class for a site/telescope location and date range
     return Visibility(
@@ -322,9 +331,10 @@ def get_airmass_by_telescope_for_target(data: dict) -> dict:
                 latitude = Angle(degrees=telescope.latitude)
                 longitude = Angle(degrees=telescope.longitude)
                 altitude = telescope.site.elevation
-                airmasses = calculate_airmass_at_times(
-                    night_times, rise_set_target, latitude, longitude, altitude
-                )
+                with span('airmass'):
+                    airmasses = calculate_airmass_at_times(
+                        night_times, rise_set_target, latitude, longitude, altitude
+                    )
                 airmass_data[telescope.id]['airmasses'] = airmasses
     return airmass_data
 
@@ -335,6 +345,7 @@ def telescope_dark_intervals(telescope: Telescope, start: datetime = timezone.no
     return dark_intervals
 
 
+@profiled('binned_moc')
 def healpix_map_to_binned_moc(fraction_map, nside, num_bins=4):
     """Convert a fractional visibility healpix map into a binned MOC.
 
@@ -384,13 +395,16 @@ def get_skymap_fractional_visibility_by_telescope(data: dict) -> dict:
     for telescope in data['telescopes']:
         rise_set_site = get_rise_set_site(telescope)
         visibility = get_rise_set_visibility(rise_set_site, start, end, telescope)
-        skymap = visibility.get_sky_fraction_map(
-            nside=data['nside'],
-            time_resolution=timedelta(minutes=data['time_resolution']),
-            airmass=data['airmass'],
-            nest=True
-        )
-        dark_intervals = visibility.get_dark_intervals()
+        with span('sky_fraction_map'):
+            skymap = visibility.get_sky_fraction_map(
+                nside=data['nside'],
+                time_resolution=timedelta(minutes=data['time_resolution']),
+                airmass=data['airmass'],
+                nest=True
+            )
+        count_skymap_pixels(len(skymap))
+        with span('dark_intervals'):
+            dark_intervals = visibility.get_dark_intervals()
         dark_seconds = 0
         for start, end in dark_intervals:
             dark_seconds += (end - start).total_seconds()
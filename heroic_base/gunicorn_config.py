@@ -0,0 +1,21 @@
+"""Gunicorn configuration, loaded with `gunicorn --config python:heroic_base.gunicorn_config`
+
+Settings passed on the command line (workers, bind) still take precedence over these.
+"""
+import glob
+import os
+
+
+def on_starting(server):
+    # Start every deploy with fresh Prometheus multiprocess metrics (see heroic_api.metrics)
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -65,6 +65,7 @@ MIDDLEWARE = [
     'heroic_api.middleware.SCiMMAAuthSessionRefresh',  # if scimma auth is expired, force user to logout
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'heroic_api.middleware.ServerTimingMiddleware',  # profile hot paths into a Server-Timing header, if enabled
     'heroic_api.middleware.InfluxDBRequestLogger',  # log request metrics to InfluxDB via a dramatiq task
 ]
 
@@ -158,9 +159,19 @@ REST_FRAMEWORK = {
         'heroic_api.auth_backends.HeroicTokenAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': (
+        'heroic_api.renderers.ProfiledJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 1000,
 }
+# Status, capability and pointing histories are paginated by cursor (see heroic_api.pagination). The page size
+# can be changed with the limit parameter, up to the max page size.
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '1000'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '10000'))
+# Rows read from the database, and written to the response, at a time by the streaming exports
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '5000'))
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'HEROIC API',
@@ -170,8 +181,58 @@ SPECTACULAR_SETTINGS = {
     # OTHER SETTINGS
 }
 
+# Outbound HTTP calls to other services (see heroic_api.http_client)
+# Default (connect, read) timeout in seconds. These calls are made while serving requests, so the timeouts
+# and retries are kept short enough that a slow dependency can't hold a worker past its timeout.
+HTTP_CLIENT_TIMEOUT = (
+    float(os.getenv('HTTP_CLIENT_CONNECT_TIMEOUT', 3)), float(os.getenv('HTTP_CLIENT_READ_TIMEOUT', 5))
+)
+HTTP_CLIENT_RETRIES = int(os.getenv('HTTP_CLIENT_RETRIES', 1))
+HTTP_CLIENT_BACKOFF_FACTOR = float(os.getenv('HTTP_CLIENT_BACKOFF_FACTOR', 0.5))
+HTTP_CLIENT_POOL_MAXSIZE = int(os.getenv('HTTP_CLIENT_POOL_MAXSIZE', 10))
+# Consecutive failures before calls to a host fail fast, and how long until it is tried again
+HTTP_CLIENT_BREAKER_FAILURES = int(os.getenv('HTTP_CLIENT_BREAKER_FAILURES', 5))
+HTTP_CLIENT_BREAKER_RESET_SECONDS = float(os.getenv('HTTP_CLIENT_BREAKER_RESET_SECONDS', 30))
+
 RUBIN_SCHEDULE_URL = os.getenv('RUBIN_SCHEDULE_URL', 'https://usdf-rsp.slac.stanford.edu/obsloctap/schedule')
 
+# Observatory schedules polled for telescope pointings (see heroic_api.schedule_ingest).
+# Each source is polled on its own CRONTAB by heroic_base.task_scheduler and its visits are stored as
+# TelescopePointings of the TELESCOPE and INSTRUMENT ids, which must already exist.
+SCHEDULE_INGEST_SOURCES = [
+    {
+        'ACTIVE': os.getenv('RUBIN_SCHEDULE_ACTIVE', 'true').lower() == 'true',
+        'NAME': 'rubin',
+        'CLASS': 'heroic_api.schedule_ingest.rubin.RubinScheduleSource',
+        'TELESCOPE': 'noirlab.cp.rubin',
+        'INSTRUMENT': 'noirlab.cp.rubin.lsstcam',
+        'CRONTAB': os.getenv('RUBIN_SCHEDULE_CRONTAB', '*/10 * * * *'),
+        'OPTIONS': {
+            'URL': RUBIN_SCHEDULE_URL,
+            # The rubin schedule service fails and hangs alot. It is polled by the background task scheduler,
+            # so it gets a much longer timeout and more retries than calls made while serving requests.
+            'TIMEOUT': (30, 120),
+            'RETRIES': 3,
+        },
+    },
+    {
+        # Generates random schedules locally, for load testing the ingest pipeline offline
+        'ACTIVE': False,
+        'NAME': 'fake',
+        'CLASS': 'heroic_api.schedule_ingest.fake.FakeScheduleSource',
+        'TELESCOPE': 'fake.site.telescope',
+        'INSTRUMENT': 'fake.site.telescope.instrument',
+        'CRONTAB': '*/10 * * * *',
+        'OPTIONS': {
+            'NUM_VISITS': 1000,
+            'CHANGED_FRACTION': 0.05,
+        },
+    },
+]
+
+# Number of vertices used for the circular field polygons generated for ingested telescope pointings
+FIELD_POLYGON_VERTICES = int(os.getenv('FIELD_POLYGON_VERTICES', 16))
+
 HEROIC_FRONT_END_BASE_URL = os.getenv('HEROIC_FRONT_END_BASE_URL', 'http://127.0.0.1:5173/')
 
 # Client ID (OIDC_RP_CLIENT_ID) and SECRET (OIDC_RP_CLIENT_SECRET)
@@ -206,6 +267,12 @@ SCIMMA_AUTH_BASE_URL = os.getenv('SCIMMA_AUTH_BASE_URL', 'https://admin.dev.hop.
 SCIMMA_AUTH_USERNAME = os.getenv('SCIMMA_AUTH_USERNAME', '')
 SCIMMA_AUTH_PASSWORD = os.getenv('SCIMMA_AUTH_PASSWORD', '')
 
+# How long (in seconds) a successful or failed hop credential verification against SCiMMA Auth is cached,
+# and the age after which a successful one is re-verified in the background
+HOP_CREDENTIAL_VERIFY_TTL = int(os.getenv('HOP_CREDENTIAL_VERIFY_TTL', 3600))
+HOP_CREDENTIAL_VERIFY_NEGATIVE_TTL = int(os.getenv('HOP_CREDENTIAL_VERIFY_NEGATIVE_TTL', 60))
+HOP_CREDENTIAL_VERIFY_REFRESH_AFTER = int(os.getenv('HOP_CREDENTIAL_VERIFY_REFRESH_AFTER', 2700))
+
 LOGIN_URL = f"{HEROIC_FRONT_END_BASE_URL}/"  # This is the default redirect URL for user authentication tests
 LOGIN_REDIRECT_URL = f"{HEROIC_FRONT_END_BASE_URL}/"  # URL path to redirect to after login
 LOGOUT_REDIRECT_URL = f"{HEROIC_FRONT_END_BASE_URL}/"  # URL path to redirect to after logout
@@ -254,6 +321,92 @@ INFLUXDB_PASSWORD = os.getenv('INFLUXDB_PASSWORD', '')
 INFLUXDB_TIMEOUT = int(os.getenv('INFLUXDB_TIMEOUT', '10'))
 INFLUXDB_CLIENT_CERT = os.getenv('INFLUXDB_CLIENT_CERT', '')
 INFLUXDB_CLIENT_KEY = os.getenv('INFLUXDB_CLIENT_KEY', '')
+# Set false to connect over plain HTTP without a client cert, e.g. to a local stub InfluxDB
+INFLUXDB_SSL = os.getenv('INFLUXDB_SSL', 'true').lower() == 'true'
+# Request metrics are buffered in each process and written in batches (see heroic_api.request_metrics).
+# A batch is sent when it is full or every flush interval, at most max buffered points are held per process,
+# and batches older than the max age (e.g. while InfluxDB is down) are dropped instead of written.
+INFLUXDB_BATCH_SIZE = int(os.getenv('INFLUXDB_BATCH_SIZE', '500'))
+INFLUXDB_FLUSH_INTERVAL_SECONDS = float(os.getenv('INFLUXDB_FLUSH_INTERVAL_SECONDS', '5'))
+INFLUXDB_MAX_BUFFERED_POINTS = int(os.getenv('INFLUXDB_MAX_BUFFERED_POINTS', '10000'))
+INFLUXDB_BATCH_MAX_AGE_SECONDS = int(os.getenv('INFLUXDB_BATCH_MAX_AGE_SECONDS', '300'))
+
+# Per-request profiling of the hot paths, returned in a Server-Timing header and added to the InfluxDB
+# request points (see heroic_api.profiling). Off by default since it exposes timings to every client.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+
+# Prometheus metrics of the hot paths (see heroic_api.metrics), served at /metrics when enabled. Processes
+# without a web server (the alert stream ingestor) serve them on METRICS_SERVER_PORT when it is set.
+# Set PROMETHEUS_MULTIPROC_DIR in the environment to aggregate them across worker processes.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_SERVER_PORT = int(os.getenv('METRICS_SERVER_PORT', '0'))
+if METRICS_ENABLED:
+    # Task durations and counts, served with the metrics of the tasks themselves on port 9191 of the workers.
+    # Set dramatiq_prom_db to the same directory as PROMETHEUS_MULTIPROC_DIR so both are exposed together.
+    DRAMATIQ_BROKER['MIDDLEWARE'].append('dramatiq.middleware.prometheus.Prometheus')
+
+# Shared cache for all gunicorn workers and dramatiq workers, on the same redis instance as dramatiq
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/2')
+# Set it empty to use a local memory cache per process instead, e.g. to run the tests without redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'KEY_PREFIX': 'heroic',
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Defaults for heroic_api.cache.HeroicCache namespaces: entry timeout in seconds, and the largest
+# pickled value in bytes that will be cached
+HEROIC_CACHE_DEFAULT_TIMEOUT = int(os.getenv('HEROIC_CACHE_DEFAULT_TIMEOUT', 300))
+HEROIC_CACHE_MAX_ENTRY_SIZE = int(os.getenv('HEROIC_CACHE_MAX_ENTRY_SIZE', 1024 * 1024))
+# How long visibility, airmass and skymap results are cached, in seconds, and the largest pickled result in
+# bytes that is cached, which is larger than the default so high resolution skymaps are cached too
+VISIBILITY_CACHE_TIMEOUT = int(os.getenv('VISIBILITY_CACHE_TIMEOUT', 300))
+VISIBILITY_CACHE_MAX_ENTRY_SIZE = int(os.getenv('VISIBILITY_CACHE_MAX_ENTRY_SIZE', 16 * 1024 * 1024))
+# Identical concurrent visibility computations wait on a single one (see heroic_api.response_cache.single_flight).
+# The lock timeout bounds the longest computation, and waiters give up and compute the result themselves
+# after the wait timeout. All in seconds. Waiters block a gunicorn worker, so the wait timeout must stay well
+# below gunicorn's worker timeout (30 seconds by default).
+SINGLE_FLIGHT_LOCK_TIMEOUT = int(os.getenv('SINGLE_FLIGHT_LOCK_TIMEOUT', 120))
+SINGLE_FLIGHT_WAIT_TIMEOUT = int(os.getenv('SINGLE_FLIGHT_WAIT_TIMEOUT', 10))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv('SINGLE_FLIGHT_POLL_INTERVAL', 0.1))
+
+# Conditional GETs of catalog and status endpoints (see heroic_api.etags). Anonymous responses may be cached
+# by nginx or clients for ETAG_MAX_AGE seconds, and representations that include the next twilight get a new
+# ETag every ETAG_TIME_BUCKET_SECONDS.
+ETAG_MAX_AGE = int(os.getenv('ETAG_MAX_AGE', 30))
+ETAG_TIME_BUCKET_SECONDS = int(os.getenv('ETAG_TIME_BUCKET_SECONDS', 60))
+# How long snapshots of the current status of every telescope and instrument are cached, in seconds
+SNAPSHOT_CACHE_TIMEOUT = int(os.getenv('SNAPSHOT_CACHE_TIMEOUT', 5))
+
+# Change feed of statuses, capabilities and pointings (see heroic_api.changes). Changes newer than the safety
+# lag are held back so changes from slow transactions aren't skipped, and changes older than the retention
+# are pruned, so clients that fall further behind than that must re-sync from scratch.
+CHANGE_FEED_DEFAULT_LIMIT = int(os.getenv('CHANGE_FEED_DEFAULT_LIMIT', 500))
+CHANGE_FEED_MAX_LIMIT = int(os.getenv('CHANGE_FEED_MAX_LIMIT', 5000))
+CHANGE_FEED_BATCH_SIZE = int(os.getenv('CHANGE_FEED_BATCH_SIZE', 1000))
+CHANGE_FEED_SAFETY_LAG_SECONDS = float(os.getenv('CHANGE_FEED_SAFETY_LAG_SECONDS', 5))
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv('CHANGE_FEED_RETENTION_DAYS', 30))
+CHANGE_FEED_PRUNE_CRONTAB = os.getenv('CHANGE_FEED_PRUNE_CRONTAB', '17 * * * *')
+
+# Monthly partitions of the telescope status and pointing histories (see heroic_api.partitions). Partitions
+# are created PARTITION_MONTHS_AHEAD months ahead, and partitions older than the retention in months are
+# detached (kept as standalone tables to archive) or dropped, depending on PARTITION_RETENTION_ACTION.
+# A retention of 0 keeps every partition.
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+TELESCOPE_STATUS_RETENTION_MONTHS = int(os.getenv('TELESCOPE_STATUS_RETENTION_MONTHS', 0))
+TELESCOPE_POINTING_RETENTION_MONTHS = int(os.getenv('TELESCOPE_POINTING_RETENTION_MONTHS', 0))
+PARTITION_RETENTION_ACTION = os.getenv('PARTITION_RETENTION_ACTION', 'detach')
+PARTITION_MAINTENANCE_CRONTAB = os.getenv('PARTITION_MAINTENANCE_CRONTAB', '23 3 * * *')
+
+# Server-Sent Events stream of the change feed (see heroic_api.event_stream), fanned out through redis pub/sub.
+# Publishing is disabled if the redis url is empty, which it is by default when CACHE_REDIS_URL is.
+EVENT_STREAM_REDIS_URL = os.getenv('EVENT_STREAM_REDIS_URL', CACHE_REDIS_URL)
+EVENT_STREAM_CHANNEL = os.getenv('EVENT_STREAM_CHANNEL', 'heroic:changes')
+EVENT_STREAM_KEEPALIVE_SECONDS = float(os.getenv('EVENT_STREAM_KEEPALIVE_SECONDS', 15))
+EVENT_STREAM_RETRY_MILLISECONDS = int(os.getenv('EVENT_STREAM_RETRY_MILLISECONDS', 3000))
 
 # TOM-Alertstreams configuration
 SCIMMA_KAFKA_BASE_URL = os.getenv("SCIMMA_KAFKA_BASE_URL", default="kafka://dev.hop.scimma.org/")
@@ -1,14 +1,33 @@
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
+from django.conf import settings
 
-from heroic_api.tasks import poll_rubin_schedule
+from heroic_api.schedule_ingest import get_schedule_source_configs
+from heroic_api.tasks import poll_schedule_source, prune_change_feed, maintain_partitions
 
 
 def run():
     scheduler = BlockingScheduler()
+    for source in get_schedule_source_configs():
+        scheduler.add_job(
+            poll_schedule_source.send,
+            CronTrigger.from_crontab(source['CRONTAB']),
+            args=[source['NAME']],
+            id=f"poll_schedule_{source['NAME']}",
+            max_instances=1,
+            replace_existing=True
+        )
     scheduler.add_job(
-        poll_rubin_schedule.send,
-        CronTrigger.from_crontab('*/10 * * * *'),
+        prune_change_feed.send,
+        CronTrigger.from_crontab(settings.CHANGE_FEED_PRUNE_CRONTAB),
+        id='prune_change_feed',
+        max_instances=1,
+        replace_existing=True
+    )
+    scheduler.add_job(
+        maintain_partitions.send,
+        CronTrigger.from_crontab(settings.PARTITION_MAINTENANCE_CRONTAB),
+        id='maintain_partitions',
         max_instances=1,
         replace_existing=True
     )
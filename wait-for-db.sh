@@ -25,6 +25,7 @@ if [ "$#" -gt 0 ]; then
 else
   echo "🚀 Starting Gunicorn"
   exec poetry run gunicorn \
+       --config python:heroic_base.gunicorn_config \
        --workers "${GUNICORN_WORKERS:-2}" \
        --bind 0.0.0.0:8000 \
        heroic_base.wsgi:application